@@ -0,0 +1,1016 @@
+# benchmark.py
+# Timing harness for the house MPC pipeline. Run from this folder, e.g.
+#   python benchmark.py model_build
+import os
+import sys
+import time
+import random
+import statistics
+import tempfile
+import numpy as np
+from config import *
+from data import *
+from house_agent import HouseAgent
+from house_model import HouseModel
+from sparse_model import SparseHouseModel
+from community_controller import CommunityController
+from central_solver import CentralController
+from coordination import DualCoordinator
+from house_workers import HousePool
+import house_agent
+import community_controller
+import house_model
+import sparse_model
+import solvers
+from subproblem_cache import shared_cache
+from surrogate import shared_policy, sample_log
+import surrogate
+import history
+from history import History, stack
+
+
+def record_house_states(num_steps=48, seed=0, alpha=0.1, sigma=0.75):
+    # Drive one house through the simulation and keep the horizon inputs it saw at every step
+    random.seed(seed)
+    house = HouseAgent(0, PV_capacity, C_E, I_max / num_homes)
+    house.alpha = alpha
+    house.sigma_human = sigma
+
+    states = []
+    for step in range(num_steps):
+        states.append(house.build_horizon_inputs(step))
+        schedule = house.generate_proposed_schedule(step, [0.0] * 48)
+        house.execute_physical_action(schedule, step)
+    return house, states
+
+
+def run_community(num_steps, seed=0, num_houses=num_homes, alpha=0.1, sigma=0.75, coordinator=None, stats=None,
+                  limit=I_max, workers=0, central=False):
+    # The closed loop of main.run_simulation without the reporting: negotiate, then act.
+    # Pass a dict as stats to get the controller's negotiation counters back, workers > 0
+    # to run the agents in that many worker processes and central=True to solve every step
+    # as one community model instead of negotiating.
+    random.seed(seed)
+    houses = [HouseAgent(i, PV_capacity, C_E, I_max / num_homes) for i in range(num_houses)]
+    for house in houses:
+        house.alpha = alpha
+        house.sigma_human = sigma
+    if central:
+        community = CentralController(transformer_limit=limit)
+    else:
+        community = CommunityController(transformer_limit=limit, coordinator=coordinator)
+    pool = HousePool(houses, workers) if workers else None
+    if pool is not None:
+        houses = pool.houses
+
+    step_times = []
+    for step in range(num_steps):
+        start = time.perf_counter()
+        approved_schedules, peak_demand = community.negotiate_schedules(houses, step)
+        step_times.append(time.perf_counter() - start)
+
+        total_planned_import = sum(sched["planned_import_k0"] for sched in approved_schedules)
+        global_slack = max(0.0, limit - total_planned_import)
+        for sched in approved_schedules:
+            sched["community_slack_k0"] = global_slack
+            house = next(h for h in houses if h.house_id == sched["house_id"])
+            house.execute_physical_action(sched, step)
+    if stats is not None:
+        stats.update(community.stats)
+    if pool is not None:
+        houses = pool.collect()
+        pool.close()
+    return houses, step_times
+
+
+def community_outcome(houses, num_steps, limit):
+    # Energy bill of the whole community (£), its peak net import (kW) and the steps it spent above the limit
+    grid_import = stack(houses, "Grid_Import", num_steps).sum(axis=0)
+    grid_export = stack(houses, "Grid_Export", num_steps).sum(axis=0)
+    slots = np.arange(num_steps) % total_steps
+    bill = float(((grid_import * np.asarray(price_grid_elec)[slots] - grid_export * np.asarray(price_grid_export)[slots]) * delta).sum())
+    imports = grid_import - grid_export
+    return bill, float(imports.max()), int((imports > limit + 1e-6).sum())
+
+
+def solve_totals(houses):
+    totals = {"solves": 0, "warm_starts": 0, "nodes": 0, "wall_time": 0.0}
+    for house in houses:
+        for key in totals:
+            totals[key] += house.model_template.stats[key]
+    return totals
+
+
+def benchmark_model_build(num_steps=48):
+    # Before: every solve constructed the whole formulation from scratch.
+    # After: the formulation is built once and update() rewrites it in place.
+    house, states = record_house_states(num_steps)
+    penalties = [0.0] * 48
+
+    start = time.perf_counter()
+    for inputs in states:
+        model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+        model.update(inputs, penalties)
+    rebuild_ms = (time.perf_counter() - start) * 1000 / len(states)
+
+    model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    start = time.perf_counter()
+    for inputs in states:
+        model.update(inputs, penalties)
+    update_ms = (time.perf_counter() - start) * 1000 / len(states)
+
+    print(f"Model build per solve over {len(states)} recorded states")
+    print(f"  Full rebuild     : {rebuild_ms:8.2f} ms")
+    print(f"  In-place update  : {update_ms:8.2f} ms")
+    print(f"  Speed-up         : {rebuild_ms / update_ms:8.1f}x")
+
+
+def benchmark_solver_latency(num_steps=48):
+    # Same persistent house model solved by both backends on every recorded state
+    house, states = record_house_states(num_steps)
+    model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    penalties = [0.0] * 48
+
+    times = {"cbc": [], "highs": []}
+    objectives = {"cbc": [], "highs": []}
+    for inputs in states:
+        model.update(inputs, penalties)
+        for backend in times:
+            model.solve(backend)
+            times[backend].append(model.last_solve["wall_time"] * 1000)
+            objectives[backend].append(model.solution()["objective"])
+
+    print(f"House subproblem latency over {len(states)} recorded states (ms)")
+    print(f"  {'Backend':<8} | {'Median':>8} | {'Mean':>8} | {'Max':>8}")
+    for backend, samples in times.items():
+        print(f"  {backend:<8} | {statistics.median(samples):8.1f} | {statistics.mean(samples):8.1f} | {max(samples):8.1f}")
+    worse = sum(1 for a, b in zip(objectives["highs"], objectives["cbc"]) if a > b + 1e-3 * max(1.0, abs(b)))
+    print(f"  HiGHS objective worse than CBC on {worse}/{len(states)} states")
+
+
+def benchmark_warm_start(num_steps=96, backend="cbc", num_houses=num_homes):
+    # Cold solves against MIP starts built from each house's previous plan, over a full community run
+    solvers.solver_backend = backend
+    print(f"Warm start over {num_steps} steps, {num_houses} houses, backend={backend}")
+    print(f"  {'Mode':<6} | {'Solves':>6} | {'Nodes/solve':>11} | {'Solve ms':>8} | {'Step s':>7}")
+    for enabled in (False, True):
+        house_model.warm_start = sparse_model.warm_start = enabled
+        houses, step_times = run_community(num_steps, num_houses=num_houses)
+        totals = solve_totals(houses)
+        solves = max(1, totals["solves"])
+        print(f"  {'warm' if enabled else 'cold':<6} | {totals['solves']:>6} | {totals['nodes'] / solves:>11.1f} | "
+              f"{totals['wall_time'] * 1000 / solves:>8.1f} | {statistics.mean(step_times):>7.2f}")
+
+
+def benchmark_negotiation(num_steps=48, iterations=10, backend="highs", sample_every=4):
+    # One step's negotiation re-solves the same house with rising penalties only.
+    # Cold: a fresh model per round, no start. Reuse: objective-only update and last round's plan as start.
+    solvers.solver_backend = backend
+    house, states = record_house_states(num_steps)
+    states = states[::sample_every]
+    rounds = [[0.05 * r * (1 if 30 <= k < 40 else 0) for k in range(48)] for r in range(iterations)]
+
+    results = {}
+    for mode in ("cold", "reuse"):
+        house_model.warm_start = mode == "reuse"
+        negotiation_times = []
+        objectives = []
+        for inputs in states:
+            start = time.perf_counter()
+            model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+            for r, penalties in enumerate(rounds):
+                if mode == "cold" and r > 0:
+                    model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+                if mode == "reuse" and r > 0:
+                    model.set_penalties(inputs, penalties)
+                else:
+                    model.update(inputs, penalties)
+                model.solve(backend)
+                objectives.append(model.solution()["objective"])
+            negotiation_times.append(time.perf_counter() - start)
+        results[mode] = (negotiation_times, objectives)
+    house_model.warm_start = warm_start
+
+    print(f"{iterations}-round negotiation over {len(states)} recorded states, backend={backend} (s per negotiation)")
+    print(f"  {'Mode':<6} | {'Median':>7} | {'Mean':>7} | {'Max':>7}")
+    for mode, (samples, _) in results.items():
+        print(f"  {mode:<6} | {statistics.median(samples):7.2f} | {statistics.mean(samples):7.2f} | {max(samples):7.2f}")
+    drift = max(abs(a - b) / max(1.0, abs(a)) for a, b in zip(results["cold"][1], results["reuse"][1]))
+    print(f"  Largest relative objective difference: {drift:.2e}")
+
+
+def benchmark_sparse_build(num_steps=48):
+    # Time to get from a house state to arrays the solver can take: PuLP objects compiled
+    # to CSC against the formulation written straight into NumPy/SciPy arrays
+    house, states = record_house_states(num_steps)
+    penalties = [0.0] * 48
+
+    start = time.perf_counter()
+    pulp_model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    pulp_model.update(states[0], penalties)
+    solvers.CompiledModel(pulp_model.model).arrays()
+    pulp_build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model.update(states[0], penalties)
+    sparse_build_ms = (time.perf_counter() - start) * 1000
+
+    compiled = solvers.CompiledModel(pulp_model.model)
+    start = time.perf_counter()
+    for inputs in states:
+        pulp_model.update(inputs, penalties)
+        compiled.arrays()
+    pulp_update_ms = (time.perf_counter() - start) * 1000 / len(states)
+
+    start = time.perf_counter()
+    for inputs in states:
+        model.update(inputs, penalties)
+    sparse_update_ms = (time.perf_counter() - start) * 1000 / len(states)
+
+    print(f"House model to solver arrays ({model.num_col} columns, {model.num_row} rows, {model.A.nnz} non-zeros)")
+    print(f"  {'Builder':<8} | {'Build ms':>8} | {'Update ms':>9}")
+    print(f"  {'pulp':<8} | {pulp_build_ms:8.1f} | {pulp_update_ms:9.2f}")
+    print(f"  {'sparse':<8} | {sparse_build_ms:8.1f} | {sparse_update_ms:9.2f}")
+
+
+def check_sparse_model(num_steps=48, sample_every=3):
+    # The sparse builder must reach the same optimum as the PuLP formulation on recorded states
+    house, states = record_house_states(num_steps)
+    pulp_model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    penalties = [0.0] * 48
+    house_model.warm_start = sparse_model.warm_start = False
+
+    mismatches = 0
+    worst = 0.0
+    checked = states[::sample_every]
+    for inputs in checked:
+        pulp_model.update(inputs, penalties)
+        model.update(inputs, penalties)
+        statuses = (pulp_model.solve("highs"), model.solve("highs"))
+        a = pulp_model.solution()["objective"] if statuses[0] == "Optimal" else None
+        b = model.solution()["objective"] if statuses[1] == "Optimal" else None
+        if a is None or b is None:
+            mismatches += statuses[0] != statuses[1]
+            continue
+        # Both are MIP optima, so they only have to agree to within HiGHS's default relative gap
+        difference = abs(a - b) / max(1.0, abs(a))
+        worst = max(worst, difference)
+        mismatches += difference > 1e-4
+    house_model.warm_start = sparse_model.warm_start = warm_start
+
+    print(f"Sparse builder against PuLP on {len(checked)} recorded states")
+    print(f"  Largest relative objective difference: {worst:.2e}")
+    print(f"  Mismatches: {mismatches}")
+    return mismatches == 0
+
+
+def benchmark_subproblem_cache(num_steps=8, num_houses=2, alphas=(0.05, 0.1, 0.2), sigmas=(0.0, 0.5)):
+    # A miniature Pareto sweep, every (alpha, sigma) pair on the same seed. Memory is cleared
+    # between configurations, as if each ran on its own worker, so reuse has to come from disk.
+    print(f"Subproblem cache over a {len(alphas)}x{len(sigmas)} sweep, {num_steps} steps, {num_houses} houses")
+    print(f"  {'Mode':<8} | {'Sweep s':>7} | {'Solves':>6} | {'Hit rate':>8}")
+    for mode in ("off", "memory", "disk"):
+        house_agent.cache_subproblems = mode != "off"
+        directory = tempfile.mkdtemp(prefix="subproblem_cache_") if mode == "disk" else None
+        shared_cache.directory = directory
+        shared_cache.entries.clear()
+        before = dict(shared_cache.stats)
+
+        start = time.perf_counter()
+        solves = 0
+        for sigma in sigmas:
+            for alpha in alphas:
+                if mode == "disk":
+                    shared_cache.entries.clear()
+                houses, _ = run_community(num_steps, num_houses=num_houses, alpha=alpha, sigma=sigma)
+                solves += solve_totals(houses)["solves"]
+        elapsed = time.perf_counter() - start
+        hit_rate = shared_cache.hit_rate(since=before) if mode != "off" else 0.0
+        print(f"  {mode:<8} | {elapsed:7.1f} | {solves:>6} | {hit_rate * 100:7.1f}%")
+
+    shared_cache.directory = cache_dir
+    house_agent.cache_subproblems = cache_subproblems
+    print(f"  Cache totals: {shared_cache.report()}")
+
+
+def benchmark_grid_binary(num_steps=48, builder="sparse"):
+    # Every recorded state solved with the Z_grid binaries always in the model, then with
+    # them dropped whenever export can never pay for a simultaneous import
+    house, states = record_house_states(num_steps)
+    penalties = [0.0] * 48
+    model_class = SparseHouseModel if builder == "sparse" else HouseModel
+    house_model.warm_start = sparse_model.warm_start = False
+
+    results = {}
+    for dropping in (False, True):
+        house_model.drop_grid_binary = sparse_model.drop_grid_binary = dropping
+        model = model_class(house.house_id, house.battery_capacity, house.house_limit)
+        times, objectives = [], []
+        for inputs in states:
+            model.update(inputs, penalties)
+            model.solve("highs")
+            times.append(model.last_solve["wall_time"])
+            objectives.append(model.solution()["objective"])
+        results[dropping] = (times, objectives, model.stats["grid_binary_dropped"])
+    house_model.drop_grid_binary = sparse_model.drop_grid_binary = drop_grid_binary
+    house_model.warm_start = sparse_model.warm_start = warm_start
+
+    kept, dropped = results[False], results[True]
+    print(f"Import/export binary over {len(states)} recorded states, {builder} builder, HiGHS")
+    print(f"  Fast path taken on {dropped[2]}/{len(states)} solves")
+    print(f"  {'Z_grid':<8} | {'Median ms':>9} | {'Mean ms':>8} | {'Total s':>7}")
+    for label, (times, _, _) in (("kept", kept), ("dropped", dropped)):
+        print(f"  {label:<8} | {statistics.median(times) * 1000:9.1f} | {statistics.mean(times) * 1000:8.1f} | {sum(times):7.2f}")
+    print(f"  Time saved: {sum(kept[0]) - sum(dropped[0]):.2f} s")
+    drift = max(abs(a - b) / max(1.0, abs(a)) for a, b in zip(kept[1], dropped[1]))
+    print(f"  Largest relative objective difference: {drift:.2e}")
+
+
+def benchmark_window_columns(num_steps=48):
+    # Every-slot appliance columns (the PuLP formulation) against columns only inside the
+    # appliance start windows and charging session (the sparse builder), both solved by HiGHS
+    house, states = record_house_states(num_steps)
+    penalties = [0.0] * 48
+    house_model.warm_start = sparse_model.warm_start = False
+    full = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    windowed = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    full_appliances = list(full.E.values()) + list(full.P_flex.values()) + list(full.O_flex.values())
+
+    sizes = {"full": [], "windowed": []}
+    times = {"full": [], "windowed": []}
+    for inputs in states:
+        full.update(inputs, penalties)
+        full.solve("highs")
+        times["full"].append(full.last_solve["wall_time"])
+        # Columns fixed by their bounds are dead weight that presolve has to strip on every solve
+        fixed = sum(1 for var in full.variables if var.upBound is not None and var.upBound == var.lowBound)
+        sizes["full"].append((len(full_appliances), len(full.variables) - fixed, len(full.model.constraints)))
+
+        windowed.update(inputs, penalties)
+        windowed.solve("highs")
+        times["windowed"].append(windowed.last_solve["wall_time"])
+        appliance_columns = windowed.num_col - windowed.num_fixed - len(windowed.E_deficit)
+        free = int(np.sum(windowed.col_upper > windowed.col_lower))
+        sizes["windowed"].append((appliance_columns, free, windowed.num_row))
+    house_model.warm_start = sparse_model.warm_start = warm_start
+
+    print(f"Appliance columns over {len(states)} recorded states (means), HiGHS")
+    print(f"  {'Model':<9} | {'Appliance cols':>14} | {'Unfixed cols':>12} | {'Rows':>5} | {'Median ms':>9} | {'Total s':>7}")
+    for label in ("full", "windowed"):
+        appliance_columns, free, num_rows = (statistics.mean(column) for column in zip(*sizes[label]))
+        print(f"  {label:<9} | {appliance_columns:14.0f} | {free:12.0f} | {num_rows:5.0f} | "
+              f"{statistics.median(times[label]) * 1000:9.1f} | {sum(times[label]):7.2f}")
+    print(f"  Windowed rebuilds: {windowed.stats['rebuilds']} of {len(states)} steps")
+
+
+def benchmark_move_blocking(alpha=0.1, sigma=0.75, seed=0, blocks=None):
+    # The standard 2-day pareto_parallel scenario (10 houses, one seed) with the full-resolution
+    # horizon and with a move-blocked one: size of each house model, run time and outcome KPIs
+    import pareto_parallel
+    blocks = blocks or [1] * 8 + [2] * 8 + [4] * 6
+    house, states = record_house_states(48)
+
+    print(f"Move-blocked horizon {blocks} over {days} days, {num_homes} houses, alpha={alpha}, sigma={sigma}, seed={seed}")
+    print(f"  {'Horizon':<8} | {'Columns':>7} | {'Binaries':>8} | {'Rows':>5} | {'Run s':>7} | {'Smart cost':>10} | "
+          f"{'Peak kW':>7} | {'Cost save %':>11} | {'Peak red %':>10} | {'Breaches':>8} | {'SLA %':>6}")
+    for label, setting in (("full", None), ("blocked", blocks)):
+        model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit, blocks=setting)
+        sizes = []
+        for inputs in states:
+            model.update(inputs, [0.0] * 48)
+            sizes.append((model.num_col, int(model.integrality.sum()), model.num_row))
+        columns, binaries, num_rows = (statistics.mean(column) for column in zip(*sizes))
+
+        house_agent.model_builder, house_agent.horizon_blocks = "sparse", setting
+        start = time.perf_counter()
+        res = pareto_parallel.run_single_simulation((alpha, sigma, seed))
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<8} | {columns:7.0f} | {binaries:8.0f} | {num_rows:5.0f} | {elapsed:7.0f} | {res['Smart_Cost']:10.2f} | "
+              f"{res['Smart_Peak']:7.2f} | {res['Cost_Saving']:11.2f} | {res['Peak_Reduction']:10.2f} | "
+              f"{res['Smart_Breach_Count']:>8} | {res['SLA']:6.1f}")
+    house_agent.horizon_blocks = horizon_blocks
+
+
+def benchmark_lp_fast_path(num_steps=96, seeds=(0, 1, 2)):
+    # Two simulated days per seed, every recorded state solved as a MILP and then with the
+    # pure-LP path for the states where every binary is already fixed
+    states = []
+    for seed in seeds:
+        house, recorded = record_house_states(num_steps, seed=seed)
+        states += recorded
+    penalties = [0.0] * 48
+
+    results = {}
+    sparse_model.drop_grid_binary = True       # the LP path needs the grid binary gone
+    for fast in (False, True):
+        sparse_model.lp_fast_path = fast
+        model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+        times, objectives, relaxed = [], [], []
+        for inputs in states:
+            model.update(inputs, penalties)
+            relaxed.append(not model.discrete())
+            model.solve("highs")
+            times.append(model.last_solve["wall_time"])
+            objectives.append(model.solution()["objective"])
+        results[fast] = (times, objectives, relaxed, model.stats["lp_solves"])
+    sparse_model.lp_fast_path = lp_fast_path
+    sparse_model.drop_grid_binary = drop_grid_binary
+
+    milp_times, milp_objectives, eligible, _ = results[False]
+    lp_times, lp_objectives, _, lp_solves = results[True]
+    print(f"Pure-LP fast path over {len(states)} states ({num_steps} steps x {len(seeds)} seeds), sparse builder, HiGHS")
+    print(f"  LP solves: {lp_solves}/{len(states)} ({lp_solves / len(states) * 100:.1f}%)")
+    print(f"  {'States':<10} | {'Solver':<6} | {'Median ms':>9} | {'Mean ms':>8} | {'Total s':>7}")
+    for label, chosen in (("no binary", True), ("binary", False)):
+        picked = [i for i, flag in enumerate(eligible) if flag == chosen]
+        for solver, times in (("MILP", milp_times), ("fast", lp_times)):
+            subset = [times[i] for i in picked] or [0.0]
+            print(f"  {label:<10} | {solver:<6} | {statistics.median(subset) * 1000:9.1f} | "
+                  f"{statistics.mean(subset) * 1000:8.1f} | {sum(subset):7.2f}")
+    print(f"  Total solve time: {sum(milp_times):.2f} s -> {sum(lp_times):.2f} s")
+    drift = max(abs(a - b) / max(1.0, abs(a)) for a, b in zip(milp_objectives, lp_objectives))
+    print(f"  Largest relative objective difference: {drift:.2e}")
+
+
+def benchmark_coordination(num_steps=12, num_houses=num_homes, limit=0.6 * I_max):
+    # The community under each coordination engine: negotiation rounds and house re-solves per step,
+    # and how many steps still end with a breach. At the default I_max the first day never breaches,
+    # so the transformer limit is tightened until the houses have to be coordinated.
+    engines = [
+        ("heuristic", "heuristic"),
+        ("dual 0.05", DualCoordinator(step_size=0.05)),
+        ("dual 0.2", DualCoordinator(step_size=0.2)),
+        ("dual 0.5", DualCoordinator(step_size=0.5)),
+    ]
+    print(f"Coordination engines over {num_steps} steps, {num_houses} houses, limit {limit:g} kW")
+    print(f"  {'Engine':<10} | {'Rounds/step':>11} | {'Max rounds':>10} | {'Solves/step':>11} | "
+          f"{'MILP solves':>11} | {'Unresolved':>10} | {'Step s':>6}")
+    for label, engine in engines:
+        # Start every engine from an empty cache so none of them is handed another's solutions
+        shared_cache.entries.clear()
+        stats = {}
+        houses, step_times = run_community(num_steps, num_houses=num_houses, coordinator=engine, stats=stats, limit=limit)
+        totals = solve_totals(houses)
+        print(f"  {label:<10} | {stats['iterations'] / stats['steps']:11.2f} | {stats['max_iterations']:10} | "
+              f"{stats['solves'] / stats['steps']:11.1f} | {totals['solves'] / stats['steps']:11.1f} | "
+              f"{stats['unresolved']:>10} | {statistics.mean(step_times):6.2f}")
+
+
+def benchmark_active_set(community_sizes=((10, 12), (100, 4)), tightness=0.6):
+    # House solves per step with every house re-solved each round, then with only the houses
+    # that draw power in a breached slot. The limit is tightened in proportion to the number of
+    # houses so both communities actually negotiate. Each entry is (houses, steps).
+    print(f"Active-set renegotiation, limit {tightness:g} x {I_max / num_homes:g} kW per house, {coordinator} coordinator")
+    print(f"  {'Houses':>6} | {'Active set':<10} | {'Rounds/step':>11} | {'Solves/step':>11} | {'Saved/step':>10} | "
+          f"{'Unresolved':>10} | {'Step s':>6}")
+    for num_houses, num_steps in community_sizes:
+        limit = tightness * I_max * num_houses / num_homes
+        for active in (False, True):
+            community_controller.active_set_negotiation = active
+            shared_cache.entries.clear()
+            stats = {}
+            _, step_times = run_community(num_steps, num_houses=num_houses, stats=stats, limit=limit)
+            print(f"  {num_houses:6} | {'on' if active else 'off':<10} | {stats['iterations'] / stats['steps']:11.2f} | "
+                  f"{stats['solves'] / stats['steps']:11.1f} | {stats['skipped'] / stats['steps']:10.1f} | "
+                  f"{stats['unresolved']:>10} | {statistics.mean(step_times):6.2f}")
+    community_controller.active_set_negotiation = active_set_negotiation
+
+
+def benchmark_house_workers(num_steps=8, worker_counts=(0, 1, 2, 4)):
+    # Negotiation step time with the agents on the controller's threads (0) and in 1, 2 and 4
+    # worker processes, plus what one round ships per house in each direction
+    import pickle
+    print(f"House worker processes over {num_steps} steps, {num_homes} houses, {os.cpu_count()} CPU cores")
+    print(f"  {'Workers':>7} | {'Mean step s':>11} | {'Median step s':>13}")
+    for workers in worker_counts:
+        shared_cache.entries.clear()
+        houses, step_times = run_community(num_steps, workers=workers)
+        print(f"  {workers:7} | {statistics.mean(step_times):11.2f} | {statistics.median(step_times):13.2f}")
+
+    house = houses[0]
+    proposal = house.generate_proposed_schedule(num_steps, [0.0] * 48)
+    print(f"  Per house and round: {len(pickle.dumps((num_steps, [0.0] * 48)))} B of penalties out, "
+          f"{len(pickle.dumps(proposal))} B proposal back (the agent itself pickles to {len(pickle.dumps(house))} B)")
+
+
+def benchmark_deadline(num_steps=12, limit=0.6 * I_max, settings=((None, 1.0), (1.0, 1.0), (0.5, 0.8))):
+    # Step latency with every round waiting for the slowest house, then with streaming rounds that
+    # close at a deadline (seconds) or once a quorum of houses has reported
+    print(f"Streaming negotiation over {num_steps} steps, {num_homes} houses, limit {limit:g} kW, {coordinator} coordinator")
+    print(f"  {'Deadline':>8} | {'Quorum':>6} | {'Mean step s':>11} | {'Max step s':>10} | {'Rounds/step':>11} | "
+          f"{'Stragglers':>10} | {'Missed':>6} | {'Unresolved':>10}")
+    for deadline, quorum in settings:
+        community_controller.negotiation_deadline = deadline
+        community_controller.negotiation_quorum = quorum
+        shared_cache.entries.clear()
+        stats = {}
+        _, step_times = run_community(num_steps, stats=stats, limit=limit)
+        label = "none" if deadline is None else f"{deadline:g}"
+        print(f"  {label:>8} | {quorum:6.2f} | {statistics.mean(step_times):11.2f} | {max(step_times):10.2f} | "
+              f"{stats['iterations'] / stats['steps']:11.2f} | {stats['stragglers']:10} | {stats['missed']:6} | "
+              f"{stats['unresolved']:10}")
+    community_controller.negotiation_deadline = negotiation_deadline
+    community_controller.negotiation_quorum = negotiation_quorum
+
+
+def benchmark_central(community_sizes=(2, 5, 10), num_steps=12, tightness=0.6):
+    # The negotiated community against the joint model that holds the transformer limit exactly:
+    # step time as the community grows, and what the negotiation gives away in bill and breaches
+    print(f"Central reference solver over {num_steps} steps, limit {tightness:g} kW per house, {coordinator} coordinator")
+    print(f"  {'Houses':>6} | {'Solver':<11} | {'Mean step s':>11} | {'Max step s':>10} | {'Bill £':>7} | "
+          f"{'Peak kW':>7} | {'Breached':>8} | {'Model size':>22}")
+    house_agent.model_builder = "sparse"
+    for num_houses in community_sizes:
+        limit = tightness * num_houses
+        for central in (False, True):
+            shared_cache.entries.clear()
+            stats = {}
+            houses, step_times = run_community(num_steps, num_houses=num_houses, stats=stats, limit=limit, central=central)
+            bill, peak, breached = community_outcome(houses, num_steps, limit)
+            if central:
+                size = f"{stats['columns']} cols {stats['integers']} int {stats['rows']} rows"
+            else:
+                size = f"{stats['iterations'] / stats['steps']:.1f} rounds/step"
+            print(f"  {num_houses:6} | {'central' if central else 'negotiation':<11} | {statistics.mean(step_times):11.2f} | "
+                  f"{max(step_times):10.2f} | {bill:7.2f} | {peak:7.2f} | {breached:8} | {size:>22}")
+    house_agent.model_builder = model_builder
+
+
+def benchmark_surrogate(train_seeds=(0, 1, 2), test_seed=3, num_steps=96, num_houses=4):
+    # Log the subproblems of a few runs, train the surrogate on them, then run an unseen seed with
+    # the MILP only and with the surrogate in front of it
+    folder = tempfile.mkdtemp()
+    sample_log.directory = folder
+    for seed in train_seeds:
+        shared_cache.entries.clear()
+        run_community(num_steps, seed=seed, num_houses=num_houses)
+    sample_log.directory = surrogate_log_dir
+    fd, model_path = tempfile.mkstemp(suffix=".pkl")
+    os.close(fd)
+    surrogate.train(folder, model_path)
+
+    print(f"Surrogate policy on seed {test_seed}, {num_steps} steps, {num_houses} houses (trained on seeds {train_seeds})")
+    print(f"  {'Policy':<9} | {'MILP solves':>11} | {'Run s':>6} | {'Bill £':>7} | {'Peak kW':>7} | {'Breached':>8}")
+    for label, use in (("MILP", False), ("surrogate", True)):
+        shared_policy.model = None
+        shared_policy.stats = dict.fromkeys(shared_policy.stats, 0)
+        if use:
+            shared_policy.load(model_path)
+        shared_cache.entries.clear()
+        start = time.perf_counter()
+        houses, _ = run_community(num_steps, seed=test_seed, num_houses=num_houses)
+        elapsed = time.perf_counter() - start
+        bill, peak, breached = community_outcome(houses, num_steps, I_max)
+        print(f"  {label:<9} | {solve_totals(houses)['solves']:11} | {elapsed:6.1f} | {bill:7.2f} | {peak:7.2f} | {breached:8}")
+    print(f"  {shared_policy.report()}")
+    shared_policy.model = None
+    os.remove(model_path)
+
+
+class ReplayPool:
+    # Stand-in for HousePool that answers every round instantly from canned proposals, so a
+    # negotiation run measures only the controller and coordinator
+    def __init__(self, num_houses, variants=4, seed=0):
+        rng = np.random.default_rng(seed)
+        profiles = rng.uniform(0.0, 1.2, (variants, num_houses, mpc_horizon)) * (rng.random((variants, num_houses, mpc_horizon)) < 0.5)
+        self.proposals = [[{"house_id": i, "status": "Optimal", "proposed_import_profile": profiles[v, i].tolist(),
+                            "proposed_flex_profile": [0.0] * mpc_horizon, "planned_import_k0": float(profiles[v, i, 0])}
+                           for i in range(num_houses)] for v in range(variants)]
+        self.calls = 0
+        self.houses = [type("ReplayHouse", (), {"pool": self, "house_id": i})() for i in range(num_houses)]
+
+    def propose(self, current_step, offers):
+        self.calls += 1
+        variant = self.proposals[self.calls % len(self.proposals)]
+        return {house_id: variant[house_id] for house_id in offers}
+
+
+def benchmark_controller_overhead(community_sizes=(10, 100, 1000, 5000), num_steps=3, tightness=0.3):
+    # Controller and coordinator time per negotiation round with houses that answer instantly
+    print(f"Coordinator overhead per round, {mpc_horizon}-slot horizon, limit {tightness:g} kW per house")
+    print(f"  {'Houses':>6} | {'Coordinator':>11} | {'Rounds':>6} | {'ms/round':>8}")
+    for num_houses in community_sizes:
+        for engine in ("heuristic", "dual"):
+            pool = ReplayPool(num_houses)
+            controller = CommunityController(transformer_limit=tightness * num_houses, coordinator=engine)
+            start = time.perf_counter()
+            for step in range(num_steps):
+                controller.negotiate_schedules(pool.houses, step)
+            elapsed = time.perf_counter() - start
+            rounds = controller.stats["iterations"]
+            print(f"  {num_houses:6} | {engine:>11} | {rounds:6} | {elapsed / rounds * 1000:8.2f}")
+
+
+def benchmark_history(num_houses=100, days=14, seed=0):
+    # Before: history_E was a dict keyed by (channel, step) and every report read it back one
+    # .get per house, channel and step. After: one (channels x steps) array per house, read as slices.
+    # The writes of a run are replayed into both, so no house is solved here.
+    import tracemalloc
+    rng = np.random.default_rng(seed)
+    num_steps = total_steps * days
+    every_step = (["Grid_Import", "Grid_Export", "Open_Loop_Import", "Open_Loop_Export", "Battery_Discharge",
+                   "Heat_Pump", "Rogue_Load", "Fridge", "Freezer", "Open_Loop_Heat_Pump", "Open_Loop_Fridge",
+                   "Open_Loop_Freezer"] + [f"Open_Loop_{app['name']}" for app in appliances]
+                  + [app["name"] for app in appliances if app["power_type"] == "flexible"])
+    constant = [app for app in appliances if app["power_type"] == "constant"]
+    values = rng.uniform(0.0, 3.0, (num_steps, len(every_step)))
+    starts = {app["name"]: set(range(int(rng.integers(0, total_steps)), num_steps, total_steps)) for app in constant}
+
+    def fill(make):
+        tracemalloc.start()
+        clock = time.perf_counter()
+        histories = []
+        for _ in range(num_houses):
+            history = make()
+            for step in range(num_steps):
+                for name, value in zip(every_step, values[step]):
+                    history[(name, step)] = float(value)
+                for app in constant:
+                    if step in starts[app["name"]]:
+                        history[(app["name"], step)] = 1
+            histories.append(history)
+        elapsed = time.perf_counter() - clock
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return histories, elapsed, memory
+
+    def report_dict(histories):
+        # The per-step reads main.py and pareto_parallel.py made after every step
+        demand = [sum(h.get(("Grid_Import", s), 0.0) - h.get(("Grid_Export", s), 0.0) for h in histories) for s in range(num_steps)]
+        running = {app["name"]: [sum(1 for t in range(max(0, s - int(app["Slots"]) + 1), s + 1)
+                                     if histories[0].get((app["name"], t), 0) == 1) * app["Power"] for s in range(num_steps)]
+                   for app in constant}
+        return np.array(demand), running
+
+    def report_array(histories):
+        houses = [type("House", (), {"history_E": h})() for h in histories]
+        demand = stack(houses, "Grid_Import", num_steps).sum(axis=0) - stack(houses, "Grid_Export", num_steps).sum(axis=0)
+        running = {app["name"]: (histories[0].running(app["name"], app["Slots"], num_steps) * app["Power"]).tolist()
+                   for app in constant}
+        return demand, running
+
+    print(f"History of {num_houses} houses over {days} days ({num_steps} steps, {len(every_step) + len(constant)} channels)")
+    print(f"  {'Store':>6} | {'Memory (MB)':>11} | {'Write (s)':>9} | {'Report (s)':>10}")
+    results = {}
+    for label, make, report in (("dict", dict, report_dict), ("array", History, report_array)):
+        histories, write_time, memory = fill(make)
+        clock = time.perf_counter()
+        results[label] = report(histories)
+        report_time = time.perf_counter() - clock
+        print(f"  {label:>6} | {memory / 1e6:11.1f} | {write_time:9.2f} | {report_time:10.3f}")
+    same = (np.allclose(results["dict"][0], results["array"][0])
+            and all(np.allclose(results["dict"][1][name], results["array"][1][name]) for name in results["dict"][1]))
+    print(f"  reports identical: {same}")
+
+
+def benchmark_history_window(num_houses=10, days=365, window=48, checkpoints=(30, 90, 180, 365), seed=0):
+    # Memory of the house histories as a run gets longer: the whole run in memory against a
+    # ring of `window` steps with the older blocks on disk. The writes of a run are replayed.
+    import tracemalloc
+    rng = np.random.default_rng(seed)
+    channels = [name for name in history.channel_names if name not in [app["name"] for app in appliances]]
+    values = rng.uniform(0.0, 3.0, (total_steps, len(channels)))
+    print(f"History of {num_houses} houses, {len(channels)} channels written every step, window {window} steps")
+    print(f"  {'Store':>7} | " + " | ".join(f"{f'day {day} (MB)':>14}" for day in checkpoints) + f" | {'Write (s)':>9} | {'Report (s)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        reports = {}
+        for label, size in (("full", None), ("bounded", window)):
+            tracemalloc.start()
+            histories = [History(window=size, directory=directory) for _ in range(num_houses)]
+            memory = []
+            clock = time.perf_counter()
+            for step in range(total_steps * days):
+                for history_E in histories:
+                    for name, value in zip(channels, values[step % total_steps]):
+                        history_E[(name, step)] = float(value)
+                if (step + 1) % total_steps == 0 and (step + 1) // total_steps in checkpoints:
+                    memory.append(tracemalloc.get_traced_memory()[0] / 1e6)
+            write_time = time.perf_counter() - clock
+            tracemalloc.stop()
+            clock = time.perf_counter()
+            houses = [type("House", (), {"history_E": h})() for h in histories]
+            reports[label] = stack(houses, "Grid_Import", total_steps * days).sum(axis=0)
+            report_time = time.perf_counter() - clock
+            print(f"  {label:>7} | " + " | ".join(f"{mb:14.1f}" for mb in memory) + f" | {write_time:9.1f} | {report_time:10.3f}")
+        print(f"  reports identical: {np.array_equal(reports['full'], reports['bounded'])}")
+
+
+def synthetic_run_cache(rng, num_houses=num_homes, num_steps=total_steps * days):
+    # A Time_Series_Cache of the shape run_single_simulation returns, filled with noise
+    series = lambda: rng.uniform(0.0, 3.0, num_steps).tolist()
+    names = [app["name"] for app in appliances] + ["Fridge", "Freezer"]
+    cache = {name: series() for name in ["community_demand", "community_actual_demand", "h0_soc", "h0_thermal_storage",
+                                         "h0_fridge_temp", "h0_freezer_temp", "h0_import", "h0_discharge", "h0_charge",
+                                         "h0_solar", "h0_heat_pump", "h0_indoor_temp", "h0_dumb_heat_pump"]}
+    cache["all_houses_import"] = [series() for _ in range(num_houses)]
+    cache["dumb_appliance_data"] = {name: series() for name in names}
+    cache["appliance_data"] = {name: series() for name in names + ["Unpredicted_Human_Load"]}
+    return cache
+
+
+def benchmark_result_store(num_runs=300, seed=0):
+    # Before: pareto_parallel re-pickled the whole {(alpha, sigma, seed): cache} dict after every
+    # run. After: one shard per run and an append-only index.
+    import pickle
+    from result_store import ResultStore
+    rng = np.random.default_rng(seed)
+    keys = [(round(0.01 * (i // 20), 4), round(0.05 * (i % 20), 4), 0) for i in range(num_runs)]
+    payloads = {key: synthetic_run_cache(rng) for key in keys}
+    print(f"Sweep result storage, {num_runs} runs of {len(pickle.dumps(payloads[keys[0]])) / 1e3:.0f} kB ({num_homes} houses, {total_steps * days} steps)")
+    print(f"  {'Store':>6} | {'Write all (s)':>13} | {'Last write (ms)':>15} | {'Resume (ms)':>11} | {'Load one (ms)':>13} | {'Size (MB)':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "simulation_cache.pkl")
+        all_cache = {}
+        clock = time.perf_counter()
+        for key in keys:
+            last = time.perf_counter()
+            all_cache[key] = payloads[key]
+            with open(path, "wb") as f:
+                pickle.dump(all_cache, f)
+        last, total = time.perf_counter() - last, time.perf_counter() - clock
+        clock = time.perf_counter()
+        with open(path, "rb") as f:
+            loaded = pickle.load(f)
+        resume = time.perf_counter() - clock
+        clock = time.perf_counter()
+        with open(path, "rb") as f:
+            one = pickle.load(f)[keys[num_runs // 2]]
+        load_one = time.perf_counter() - clock
+        print(f"  {'pickle':>6} | {total:13.2f} | {last * 1000:15.1f} | {resume * 1000:11.1f} | {load_one * 1000:13.1f} | {os.path.getsize(path) / 1e6:9.1f}")
+
+        folder = os.path.join(directory, "store")
+        store = ResultStore(folder)
+        clock = time.perf_counter()
+        for key in keys:
+            last = time.perf_counter()
+            store.put(key, payloads[key])
+        last, total = time.perf_counter() - last, time.perf_counter() - clock
+        clock = time.perf_counter()
+        completed = ResultStore(folder).keys()
+        resume = time.perf_counter() - clock
+        clock = time.perf_counter()
+        one = ResultStore(folder).load(keys[num_runs // 2])
+        load_one = time.perf_counter() - clock
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+        print(f"  {'store':>6} | {total:13.2f} | {last * 1000:15.1f} | {resume * 1000:11.1f} | {load_one * 1000:13.1f} | {size / 1e6:9.1f}")
+        print(f"  same runs after resume: {completed == set(loaded)}, loaded run equal at float32 precision: "
+              f"{np.allclose(np.concatenate(flatten(one)), np.concatenate(flatten(payloads[keys[num_runs // 2]])), rtol=1e-6)}")
+
+
+def benchmark_playback(store_sizes=(10, 100, 1000), seed=0):
+    # Time and peak Python memory from start to every series main.py plots for one run, for
+    # the single sweep pickle and the mapped columnar shard
+    import pickle
+    import tracemalloc
+    from result_store import ResultStore
+    plotted = ["community_demand", "community_actual_demand", "dumb_appliance_data", "h0_dumb_heat_pump", "h0_soc",
+               "appliance_data", "h0_import", "h0_discharge", "h0_solar", "h0_charge", "h0_fridge_temp",
+               "h0_freezer_temp", "h0_heat_pump", "h0_thermal_storage", "h0_indoor_temp", "all_houses_import"]
+
+    def touch(data):
+        # Read every value of the plotted series, as the plotting does
+        total = 0.0
+        for name in plotted:
+            value = data[name]
+            for series in (value.values() if isinstance(value, dict) else value if name == "all_houses_import" else [value]):
+                total += float(np.sum(series))
+        return total
+
+    def measure(playback):
+        tracemalloc.start()
+        clock = time.perf_counter()
+        total = playback()
+        elapsed = time.perf_counter() - clock
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return total, elapsed, peak
+
+    rng = np.random.default_rng(seed)
+    print(f"Playback of one run ({num_homes} houses, {total_steps * days} steps) against the size of the sweep cache")
+    print(f"  {'Runs':>5} | {'Format':>14} | {'To data (ms)':>12} | {'Peak memory (MB)':>16}")
+    for num_runs in store_sizes:
+        keys = [(round(0.01 * (i // 20), 4), round(0.05 * (i % 20), 4), 0) for i in range(num_runs)]
+        payloads = {key: synthetic_run_cache(rng) for key in keys}
+        wanted = keys[num_runs // 2]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "simulation_cache.pkl")
+            with open(path, "wb") as f:
+                pickle.dump(payloads, f)
+            mapped = ResultStore(os.path.join(directory, "mapped"))
+            for key in keys:
+                mapped.put(key, payloads[key])
+            del payloads
+
+            def single_pickle():
+                with open(path, "rb") as f:
+                    return touch(pickle.load(f)[wanted])
+
+            totals = []
+            for label, playback in (("single pickle", single_pickle),
+                                    ("mapped shard", lambda: touch(ResultStore(mapped.directory).open(wanted)))):
+                total, elapsed, peak = measure(playback)
+                totals.append(total)
+                print(f"  {num_runs:5} | {label:>14} | {elapsed * 1000:12.1f} | {peak / 1e6:16.2f}")
+        print(f"  same data: {np.allclose(totals, totals[0])}")
+
+
+def benchmark_series_encoding(num_houses=3, num_days=1, alpha=0.1, sigma=0.75, seed=0):
+    # Size and process-pool transfer cost of one run's Time_Series_Cache: the nested float lists
+    # against packed columns. The cache comes from a real (short) run_single_simulation.
+    import pickle
+    import tracemalloc
+    import pareto_parallel
+    from result_store import pack, unpack, materialise
+    pareto_parallel.num_homes, pareto_parallel.days = num_houses, num_days
+    pareto_parallel.pack = lambda cache: cache      # keep the lists the run builds
+    lists = pareto_parallel.run_single_simulation((alpha, sigma, seed))["Time_Series_Cache"]
+    pareto_parallel.pack = pack
+    reference = np.concatenate([np.ravel(v) for v in flatten(lists)])
+
+    print(f"Time_Series_Cache of one run ({num_houses} houses, {total_steps * num_days} steps, {len(reference)} values)")
+    print(f"  {'Encoding':>14} | {'Size (kB)':>9} | {'In memory (kB)':>14} | {'Transfer (ms)':>13} | {'To dict (ms)':>12} | {'Max error':>9}")
+    variants = [("lists", None, None), ("float64", "float64", None), ("float32", "float32", None),
+                ("float32 delta", "float32", "delta"), ("float32 zstd", "float32", "zstd")]
+    for label, dtype, codec in variants:
+        try:
+            payload = lists if dtype is None else pack(lists, dtype=dtype, codec=codec)
+        except ImportError as exc:
+            print(f"  {label:>14} | skipped: {exc}")
+            continue
+        # Pickled size is what crosses the process pool; a .run shard is the same bytes plus its header
+        size = len(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        clock = time.perf_counter()
+        for _ in range(20):
+            pickle.loads(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        transfer = (time.perf_counter() - clock) / 20
+        blob = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        tracemalloc.start()
+        received = pickle.loads(blob)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del received, blob
+        clock = time.perf_counter()
+        restored = materialise(unpack(payload))
+        to_dict = time.perf_counter() - clock
+        error = np.abs(np.concatenate([np.ravel(v) for v in flatten(restored)]) - reference).max()
+        print(f"  {label:>14} | {size / 1e3:9.1f} | {memory / 1e3:14.1f} | {transfer * 1000:13.3f} | {to_dict * 1000:12.2f} | {error:9.1e}")
+
+
+def benchmark_fork(num_houses=3, num_days=1, fork_step=34, alphas=(0.05, 0.1, 0.2), sigma=0.75, seed=0, workers=None):
+    # An alpha comparison for one seed: every run replayed from step 0 against one prefix to
+    # fork_step (17:00, before the evening peak) and a branch per alpha. Each side gets an empty
+    # on-disk subproblem cache so neither reuses the other's solves. KPIs print as replay / fork;
+    # only the first alpha ran the same prefix in both, the others ran it with the first alpha.
+    import concurrent.futures
+    import pareto_parallel
+    import fork
+    pareto_parallel.num_homes, pareto_parallel.days, fork.days = num_houses, num_days, num_days
+    params = [(alpha, sigma, seed) for alpha in alphas]
+    steps = total_steps * num_days
+    kpis = ['Cost_Saving', 'Peak_Reduction', 'SLA', 'Smart_Breach_Count', 'Smart_Cost']
+
+    with tempfile.TemporaryDirectory() as replay_cache, tempfile.TemporaryDirectory() as fork_cache:
+        clock = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=pareto_parallel.init_worker,
+                                                    initargs=(replay_cache,)) as executor:
+            replayed = list(executor.map(pareto_parallel.run_single_simulation, params))
+        replay_time = time.perf_counter() - clock
+
+        fork.sweep_cache_dir = fork_cache
+        clock = time.perf_counter()
+        forked = fork.fork(params[0], fork_step, [{"alpha": alpha} for alpha in alphas], max_workers=workers)
+        fork_time = time.perf_counter() - clock
+
+    print(f"{len(alphas)} alphas, {num_houses} houses, {steps} steps, forked at step {fork_step}")
+    print(f"  {'Sweep':>7} | {'Steps run':>9} | {'Time (s)':>8}")
+    print(f"  {'replay':>7} | {len(alphas) * steps:9d} | {replay_time:8.1f}")
+    print(f"  {'fork':>7} | {fork_step + len(alphas) * (steps - fork_step):9d} | {fork_time:8.1f}")
+    for run, branch in zip(replayed, forked):
+        print(f"  alpha {run['Alpha']}: " + ", ".join(f"{k} {run[k]:.4f} / {branch[k]:.4f}" for k in kpis))
+
+
+def benchmark_metrics(community_sizes=(10, 100), horizons=(1, 30), seed=0):
+    # Run KPIs after the run (the pass both entry points made over every house's history, with
+    # its per-appliance scan over the steps) against the streaming metrics: one update per step
+    # and the final numbers fetched at the end. The houses' writes are synthetic (no EV, whose
+    # score needs no history), no house is solved.
+    from metrics import Metrics, readings
+    rng = np.random.default_rng(seed)
+    channels = ["Grid_Import", "Grid_Export", "Open_Loop_Import", "Open_Loop_Export"]
+
+    def after_run(houses, steps):
+        smart_import = stack(houses, "Grid_Import", steps).sum(axis=0)
+        smart_export = stack(houses, "Grid_Export", steps).sum(axis=0)
+        open_import = stack(houses, "Open_Loop_Import", steps).sum(axis=0)
+        open_export = stack(houses, "Open_Loop_Export", steps).sum(axis=0)
+        smart = np.maximum(0.0, smart_import - smart_export)
+        open_demand = np.maximum(0.0, open_import - open_export)
+        price_in = np.asarray(price_grid_elec)[np.arange(steps) % total_steps]
+        price_out = np.asarray(price_grid_export)[np.arange(steps) % total_steps]
+        kpis = {'Smart_Cost': float(((smart_import * price_in - smart_export * price_out) * delta).sum()),
+                'Open_Cost': float(((open_import * price_in - open_export * price_out) * delta).sum()),
+                'Smart_Peak': float(smart.max()), 'Open_Peak': float(open_demand.max()),
+                'Smart_Breach_Count': int((smart > I_max).sum()), 'Open_Breach_Count': int((open_demand > I_max).sum())}
+        sla = 0.0
+        for house in houses:
+            total_tasks = fulfilled_tasks = 0.0
+            for app in house.personal_appliances:
+                if app.get("power_type") == "flexible":
+                    continue
+                if not any((app.get("T_S", 0.0) * steps_per_hour) <= s < steps for s in range(steps)):
+                    continue
+                total_tasks += 1.0
+                if (house.history_E.series(app["name"], steps) > 0).any():
+                    fulfilled_tasks += 1.0
+            avg_temp = float(house.history_E.series("Indoor_Temp").mean())
+            total_tasks += 1.0
+            fulfilled_tasks += 1.0 if avg_temp >= 18.0 else 0.5 + 0.5 * ((avg_temp - 16.0) / 2.0) if avg_temp >= 16.0 else 0.0
+            sla += fulfilled_tasks / total_tasks * 100
+        kpis['SLA'] = sla / len(houses)
+        return kpis
+
+    print("Run KPIs: one pass after the run against updates as the steps run")
+    print(f"  {'Houses':>6} | {'Days':>4} | {'After run (ms)':>14} | {'Updates (ms)':>12} | {'Per step (us)':>13} | {'Fetch (ms)':>10} | {'Same':>5}")
+    for num_houses in community_sizes:
+        for num_days in horizons:
+            steps = total_steps * num_days
+            houses = []
+            for house_id in range(num_houses):
+                house = type("House", (), {})()
+                house.house_id = house_id
+                house.history_E = History(steps)
+                house.personal_appliances = [app for app in appliances if app["power_type"] == "constant" and rng.random() < 0.7]
+                house.flexible_energy_delivered = {}
+                houses.append(house)
+            metrics = Metrics(houses, I_max)
+            values = rng.uniform(0.0, 1.5, (steps, num_houses, len(channels)))
+            update_time = 0.0
+            for step in range(steps):
+                for house, row in zip(houses, values[step]):
+                    for name, value in zip(channels, row):
+                        house.history_E[(name, step)] = float(value)
+                    house.history_E[("Indoor_Temp", step)] = float(rng.uniform(15.0, 21.0))
+                    for app in house.personal_appliances:
+                        if app["power_type"] == "constant" and rng.random() < 0.01:
+                            house.history_E[(app["name"], step)] = 1
+                # The readings are what execute_physical_action returns, so only the update is timed here
+                step_readings = [readings(house, step) for house in houses]
+                clock = time.perf_counter()
+                metrics.update(step, step_readings)
+                update_time += time.perf_counter() - clock
+
+            clock = time.perf_counter()
+            reference = after_run(houses, steps)
+            after_time = time.perf_counter() - clock
+            clock = time.perf_counter()
+            streamed = metrics.result()
+            streamed['SLA'] = metrics.sla(houses)
+            fetch_time = time.perf_counter() - clock
+            same = all(np.isclose(reference[k], streamed[k]) for k in reference)
+            print(f"  {num_houses:6d} | {num_days:4d} | {after_time * 1000:14.1f} | {update_time * 1000:12.1f} | "
+                  f"{update_time / steps * 1e6:13.1f} | {fetch_time * 1000:10.3f} | {str(same):>5}")
+
+
+def flatten(value):
+    # Every series of a nested cache, in order
+    if isinstance(value, dict):
+        return [series for item in value.values() for series in flatten(item)]
+    if value and isinstance(value[0], list):
+        return [series for item in value for series in flatten(item)]
+    return [value]
+
+
+benchmarks = {
+    "model_build": benchmark_model_build,
+    "solver_latency": benchmark_solver_latency,
+    "warm_start": benchmark_warm_start,
+    "negotiation": benchmark_negotiation,
+    "sparse_build": benchmark_sparse_build,
+    "sparse_check": check_sparse_model,
+    "subproblem_cache": benchmark_subproblem_cache,
+    "grid_binary": benchmark_grid_binary,
+    "window_columns": benchmark_window_columns,
+    "move_blocking": benchmark_move_blocking,
+    "lp_fast_path": benchmark_lp_fast_path,
+    "coordination": benchmark_coordination,
+    "active_set": benchmark_active_set,
+    "house_workers": benchmark_house_workers,
+    "deadline": benchmark_deadline,
+    "controller_overhead": benchmark_controller_overhead,
+    "central": benchmark_central,
+    "surrogate": benchmark_surrogate,
+    "history": benchmark_history,
+    "history_window": benchmark_history_window,
+    "result_store": benchmark_result_store,
+    "playback": benchmark_playback,
+    "series_encoding": benchmark_series_encoding,
+    "fork": benchmark_fork,
+    "metrics": benchmark_metrics,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(benchmarks)
+    for name in selected:
+        benchmarks[name]()
@@ -0,0 +1,134 @@
+# central_solver.py
+# Reference community solver: every house's sparse model stacked into one HiGHS model with the
+# transformer limit as a hard row (community_solver = "central").
+import time
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, Bounds, LinearConstraint
+from config import *
+from sparse_model import SparseHouseModel, highs_result
+import solvers
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+class CentralController:
+    def __init__(self, transformer_limit=num_homes):
+        self.limit = transformer_limit
+        self.stats = {"steps": 0, "solves": 0, "lp_solves": 0, "softened": 0, "nodes": 0, "wall_time": 0.0,
+                      "columns": 0, "integers": 0, "rows": 0, "objective": 0.0}
+
+    def negotiate_schedules(self, house_agents, current_step):
+        # One joint solve replaces the negotiation rounds. The houses see no penalties: the
+        # transformer rows keep them within the limit directly.
+        no_penalties = [0.0] * mpc_horizon
+        inputs = []
+        for house in house_agents:
+            if getattr(house, "pool", None) is not None:
+                raise ValueError("The central solver needs the house agents in this process, not in a HousePool")
+            inputs.append(house.prepare_model(current_step, no_penalties))
+            if not isinstance(house.model_template, SparseHouseModel):
+                raise ValueError("The central solver needs model_builder = 'sparse'")
+        models = [house.model_template for house in house_agents]
+
+        self.build(models)
+        relax = lp_fast_path and not any(model.discrete() for model in models)
+        start = None
+        if warm_start and not relax:
+            plans = [model.shifted_plan() for model in models]
+            if all(plan is not None for plan in plans):
+                start = np.concatenate(plans + [np.zeros(self.periods)])
+
+        clock = time.perf_counter()
+        status, x, nodes = self.solve(start, relax)
+        if status == "Infeasible":
+            self.col_upper[self.breach] = np.inf
+            self.stats["softened"] += 1
+            vprint(f"    [Step {current_step}] WARNING: Transformer limit cannot be met, solving for the least breach.")
+            status, more_x, more_nodes = self.solve(None, relax)
+            x, nodes = more_x, nodes + more_nodes
+        wall_time = time.perf_counter() - clock
+
+        solved = x is not None and status in ("Optimal", "Not Solved")
+        packages = []
+        for i, (house, model) in enumerate(zip(house_agents, models)):
+            sol = None
+            if solved:
+                model.x = x[self.offsets[i]:self.offsets[i + 1]]
+                model.last_solve = {"status": status, "backend": "central", "wall_time": wall_time, "nodes": nodes}
+                model.keep_plan()
+                sol = model.solution()
+            packages.append(house.package_schedule(current_step, no_penalties, inputs[i],
+                                                   "Optimal" if solved else status, sol))
+
+        total_community_demand = np.sum([pkg["proposed_import_profile"] for pkg in packages], axis=0)
+        slack_k0 = max(0.0, self.limit - float(total_community_demand[0]))
+        for pkg in packages:
+            pkg["community_slack_k0"] = slack_k0
+
+        self.stats["steps"] += 1
+        self.stats["solves"] += 1
+        self.stats["lp_solves"] += 1 if relax else 0
+        self.stats["nodes"] += nodes or 0
+        self.stats["wall_time"] += wall_time
+        self.stats["columns"] = max(self.stats["columns"], len(self.c))
+        self.stats["integers"] = max(self.stats["integers"], int(self.integrality.sum()))
+        self.stats["rows"] = max(self.stats["rows"], self.A.shape[0])
+        if solved:
+            self.stats["objective"] += float(self.c[:self.offsets[-1]] @ x[:self.offsets[-1]])
+        vprint(f"    [Step {current_step}] Central {status} in {wall_time:.2f}s. Peak Demand: {total_community_demand.max():.2f} kW")
+
+        return packages, float(total_community_demand[0])
+
+    def build(self, models):
+        # Stack the house blocks and add one transformer row per period. Every house model is
+        # built on the same horizon blocks, so period p means the same slots in all of them.
+        self.periods = periods = models[0].periods
+        self.offsets = np.cumsum([0] + [model.num_col for model in models])
+        houses_cols = self.offsets[-1]
+        self.breach = houses_cols + np.arange(periods)
+
+        self.c = np.concatenate([model.c for model in models] + [1000.0 * models[0].blocks])
+        self.col_lower = np.concatenate([model.col_lower for model in models] + [np.zeros(periods)])
+        self.col_upper = np.concatenate([model.col_upper for model in models] + [np.zeros(periods)])  # hard limit
+        self.integrality = np.concatenate([model.integrality for model in models] + [np.zeros(periods, dtype=np.int32)])
+
+        row = np.concatenate([np.arange(periods)] * len(models) + [np.arange(periods)])
+        col = np.concatenate([offset + model.I for offset, model in zip(self.offsets, models)] + [self.breach])
+        value = np.concatenate([np.ones(periods * len(models)), -np.ones(periods)])
+        transformer = sp.csc_matrix((value, (row, col)), shape=(periods, houses_cols + periods))
+
+        houses = sp.block_diag([model.A for model in models], format="csc")
+        houses = sp.hstack([houses, sp.csc_matrix((houses.shape[0], periods))], format="csc")
+        self.A = sp.vstack([houses, transformer], format="csc")
+        self.row_lower = np.concatenate([model.row_lower for model in models] + [np.full(periods, -np.inf)])
+        self.row_upper = np.concatenate([model.row_upper for model in models] + [np.full(periods, float(self.limit))])
+
+    def solve(self, start, relax):
+        integrality = np.zeros_like(self.integrality) if relax else self.integrality
+        if solvers.resolve_backend() == "highs":
+            h = highspy.Highs()
+            h.setOptionValue("output_flag", False)
+            h.setOptionValue("time_limit", float(central_time_limit))
+            h.passModel(
+                len(self.c), self.A.shape[0], self.A.nnz, 1, 1, 0.0,       # column-wise, minimise, no offset
+                self.c, self.col_lower, self.col_upper, self.row_lower, self.row_upper,
+                self.A.indptr.astype(np.int32), self.A.indices.astype(np.int32), self.A.data, integrality
+            )
+            if start is not None:
+                solution = highspy.HighsSolution()
+                solution.col_value = np.clip(start, self.col_lower, self.col_upper)
+                solution.value_valid = True
+                h.setSolution(solution)
+            h.run()
+            return highs_result(h, relax)
+
+        # Same arrays through SciPy's bundled HiGHS when highspy is missing
+        result = milp(self.c, integrality=integrality, bounds=Bounds(self.col_lower, self.col_upper),
+                      constraints=LinearConstraint(self.A, self.row_lower, self.row_upper),
+                      options={"time_limit": central_time_limit})
+        statuses = {0: "Optimal", 1: "Not Solved", 2: "Infeasible", 3: "Unbounded"}
+        return statuses.get(result.status, "Not Solved"), result.x, getattr(result, "mip_node_count", 0)
@@ -0,0 +1,63 @@
+# checkpoint.py
+# Periodic snapshots of a running simulation (checkpoint_every), so a killed run resumes from
+# its last checkpoint. Solver models are rebuilt on resume, so with warm_start or
+# cache_subproblems on, ties between equally cheap plans may resolve differently.
+import os
+import pickle
+import random
+import tempfile
+import numpy as np
+from config import *
+
+
+def path_for(name):
+    return os.path.join(checkpoint_dir, f"{name}.ckpt")
+
+
+def due(step):
+    return checkpoint_every is not None and (step + 1) % checkpoint_every == 0
+
+
+def save(path, step, houses, community, pool=None, series=None, metrics=None):
+    # `houses` are the agents themselves; with a pool they are collected from the workers
+    state = {
+        "step": step,
+        "houses": pool.collect() if pool is not None else houses,
+        "community": community,
+        "series": series,
+        "metrics": metrics,
+        "random": random.getstate(),
+        "numpy": np.random.get_state(),
+    }
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, scratch = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(scratch, path)
+    vprint(f"    [Step {step - 1}] Checkpoint written to {path}")
+
+
+def load(path):
+    # The saved state with the global random streams restored, or None without a checkpoint
+    # (the houses carry their own generators)
+    if checkpoint_every is None or not os.path.exists(path):
+        return None
+    state = read(path)
+    print(f"Resuming from the checkpoint at step {state['step']} ({path})")
+    return state
+
+
+def read(path):
+    # Any checkpoint file, also with checkpoint_every off (forks, see fork.py)
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    random.setstate(state["random"])
+    np.random.set_state(state["numpy"])
+    return state
+
+
+def remove(path):
+    # The run finished: its checkpoint must not be resumed by the next run
+    if os.path.exists(path):
+        os.remove(path)
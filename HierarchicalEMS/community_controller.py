@@ -1,92 +1,209 @@
 # community_controller.py
 from config import *
+from coordination import make_coordinator
+import numpy as np
+import asyncio
+import math
 import concurrent.futures
-import random
 
 
 class CommunityController:
-    def __init__(self, transformer_limit=num_homes):
+    def __init__(self, transformer_limit=num_homes, coordinator=None):
         self.limit = transformer_limit
-    
+        # Pricing engine: the name of one in coordination.py, or an engine object
+        self.coordinator = make_coordinator(coordinator) if coordinator is None or isinstance(coordinator, str) else coordinator
+        self.stats = {"steps": 0, "iterations": 0, "max_iterations": 0, "solves": 0, "skipped": 0, "unresolved": 0,
+                      "stragglers": 0, "missed": 0}
+        # Streaming negotiation: a solve can outlive its round, so the threads and the solves still
+        # running ({house_id: future}) are kept from one round to the next. Nothing is still running
+        # once a step's negotiation has ended (see settle).
+        self.executor = None
+        self.in_flight = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["executor"] = None
+        return state
+
+    def record(self, proposals, imports, flexible):
+        # Write {house index: package} into the (houses x horizon) import and flexible-load arrays
+        if not proposals:
+            return
+        rows = list(proposals)
+        imports[rows] = [proposals[i]["proposed_import_profile"] for i in rows]
+        flexible[rows] = [proposals[i].get("proposed_flex_profile") or [0.0] * mpc_horizon for i in rows]
+
+    async def stream_round(self, house_agents, active, current_step, latest):
+        # One negotiation round under a deadline. Proposals are taken in as they arrive; the round
+        # closes once a quorum of the houses has reported or the deadline passes, and the houses
+        # still solving keep their last proposal of this step (the dumb schedule in the first
+        # round). Returns {house index: proposal} for the arrivals.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + negotiation_deadline
+
+        async def solve(i):
+            house = house_agents[i]
+            running = self.in_flight.get(house.house_id)
+            if running is None:
+                # A straggler from an earlier round of this step is not asked again, its answer still counts
+                running = self.in_flight[house.house_id] = self.executor.submit(
+                    house.generate_proposed_schedule, current_step, self.coordinator.offer(house))
+                self.stats["solves"] += 1
+            data = await asyncio.shield(asyncio.wrap_future(running))
+            self.in_flight.pop(house.house_id, None)
+            return data
+
+        tasks = {asyncio.ensure_future(solve(i)): i for i in active}
+        quorum = math.ceil(negotiation_quorum * len(tasks))
+        arrivals = {}
+        while tasks and len(arrivals) < quorum:
+            done, _ = await asyncio.wait(tasks, timeout=max(0.0, deadline - loop.time()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                i = tasks.pop(task)
+                arrivals[i] = latest[i] = task.result()
+        for task in tasks:
+            task.cancel()       # only the wait (shielded): the solve runs on and may answer in a later round
+        self.stats["stragglers"] += len(tasks)
+        return arrivals
+
+    async def settle(self, house_agents, current_step):
+        # End of a streaming negotiation: stop the solves still running and wait for them, so no
+        # straggler touches a house while it executes or carries over into the next step
+        for house in house_agents:
+            running = self.in_flight.get(house.house_id)
+            if running is not None and not running.cancel():
+                house.cancel_solve(current_step)
+        futures = [asyncio.wrap_future(running) for running in self.in_flight.values()]
+        await asyncio.gather(*futures, return_exceptions=True)
+        self.in_flight.clear()
+
     def negotiate_schedules(self, house_agents, current_step):
         # Iterative pricing loop
-        # Start with zero penalties
+        # The coordinator sets the penalties each house sees and decides when to stop
 
-        current_penalties = [0.0] * 48
+        coordinator = self.coordinator
+        coordinator.begin(current_step)
         agreed = False
+        outcome = None
         iteration = 0
-        max_iterations = 10
 
         final_approved_data = []
+        latest = [None] * len(house_agents)        # each house's most recent proposal this step
+        active = list(range(len(house_agents)))     # houses to (re-)solve in the next round
+        # The same proposals as arrays, one row per house: grid import and flexible load per slot
+        imports = np.zeros((len(house_agents), mpc_horizon))
+        flexible = np.zeros((len(house_agents), mpc_horizon))
+
+        streaming = negotiation_deadline is not None
+        if streaming:
+            # Every house starts out on its dumb schedule, replaced by its proposals as they arrive.
+            # One event loop serves all rounds, as a straggler's solve can answer in a later one.
+            latest = [house.fallback_schedule(current_step) for house in house_agents]
+            fallbacks = list(latest)
+            self.record(dict(enumerate(latest)), imports, flexible)
+            loop = asyncio.new_event_loop()
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(house_agents))
 
-        while not agreed and iteration < max_iterations:
+        while outcome is None and iteration < coordinator.max_iterations:
             iteration += 1
-            proposed_profiles = []
-            house_data_packages = []
-
-            with concurrent.futures.ThreadPoolExecutor(max_workers=len(house_agents)) as executor:
-                # executor.map runs them all at once, but returns the 'data' results 
-                # in the exact same order as the 'house_agents' list
-                results = list(executor.map(
-                    lambda h: h.generate_proposed_schedule(
-                        current_step, 
-                        [p * random.uniform(0.75, 1.25) for p in current_penalties]
-                    ), 
-                    house_agents
-                ))
-            for house, data in zip(house_agents, results):
-                if data["status"] == "Optimal":
-                    proposed_profiles.append(data["proposed_import_profile"])
-                    house_data_packages.append(data)
-                else:
-                    # If house is infeasible, take whatever breaches necessary
-                    proposed_profiles.append(data["proposed_import_profile"])
-                    house_data_packages.append(data)
-                    
-            total_community_demand = [sum(x) for x in zip(*proposed_profiles)]
+
+            pool = getattr(house_agents[0], "pool", None)
+            if streaming:
+                # Streaming round: the slowest house no longer sets the length of the round
+                arrivals = loop.run_until_complete(self.stream_round(house_agents, active, current_step, latest))
+            elif pool is not None:
+                # Houses living in worker processes (house_workers.py): one message per worker
+                # carries the penalties of all its houses and the workers solve side by side
+                offers = {house_agents[i].house_id: coordinator.offer(house_agents[i]) for i in active}
+                proposals = pool.propose(current_step, offers)
+                results = [proposals[house_agents[i].house_id] for i in active]
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=len(active)) as executor:
+                    # executor.map runs them all at once, but returns the 'data' results 
+                    # in the exact same order as the 'active' list
+                    results = list(executor.map(
+                        lambda i: house_agents[i].generate_proposed_schedule(current_step, coordinator.offer(house_agents[i])),
+                        active
+                    ))
+            if not streaming:
+                self.stats["solves"] += len(active)
+                arrivals = dict(zip(active, results))
+                for i, data in arrivals.items():
+                    latest[i] = data
+            self.stats["skipped"] += len(house_agents) - len(active)
+            # Infeasible houses are in there too, with whatever breaches they need
+            self.record(arrivals, imports, flexible)
 
             # print(f"--- Iteration {iteration} ---")
-            # for i, data in enumerate(house_data_packages):
+            # for i, data in enumerate(latest):
             #     profile = data["proposed_import_profile"]
             #     peak_power = max(profile)
             #     peak_step = profile.index(peak_power)
             #     # Only print the big movers (e.g. EV or Heat Pump spikes)
             #     if peak_power > 2.0: 
             #         print(f"  House {i} -> Peak: {peak_power:.1f}kW at Step {peak_step}")
-            # print(f"  COMMUNITY TOTAL PEAK: {max(total_community_demand):.1f} kW")
+            # print(f"  COMMUNITY TOTAL PEAK: {imports.sum(axis=0).max():.1f} kW")
 
-            breach_detected = False
-            for k in range(48):
-                if total_community_demand[k] > self.limit:
-                    breach_detected = True
-
-                    breach_amount = total_community_demand[k] - self.limit
-                    current_penalties[k] += (breach_amount * 1.0)
+            prices = coordinator.penalties.copy()
+            outcome = coordinator.update(list(latest), imports, self.limit)
+            if active_set_negotiation:
+                # Only houses drawing power in a breached slot can react to the new penalties: a house
+                # with no import and no flexible load there pays nothing extra when they get dearer,
+                # so its proposal stays optimal and it does not need to re-solve. Once a price falls
+                # (the dual engine lowers them in slack slots) any house may want to move load into
+                # that slot, so they all solve again.
+                breached = imports.sum(axis=0) > self.limit
+                drawing = ((imports > 1e-6) | (flexible > 1e-6))[:, breached].any(axis=1)
+                if np.any(coordinator.penalties < prices):
+                    active = list(range(len(house_agents)))
+                else:
+                    active = np.flatnonzero(drawing).tolist() or active
+            house_data_packages = coordinator.approved
+            total_community_demand = coordinator.demand
 
-            if not breach_detected:
+            if outcome == "agreed":
                 agreed = True
                 final_approved_data = house_data_packages
-                vprint(f"    [Step {current_step}] Schedules Approved in {iteration} iterations. Peak Demand: {max(total_community_demand):.2f} kW")
-        
-        slack_k0 = max(0.0, self.limit - total_community_demand[0])
+                vprint(f"    [Step {current_step}] Schedules Approved in {iteration} iterations. Peak Demand: {total_community_demand.max():.2f} kW")
+
+        if streaming:
+            loop.run_until_complete(self.settle(house_agents, current_step))
+            loop.close()
+            missed = [i for i, pkg in enumerate(house_data_packages) if pkg is fallbacks[i]]
+            self.stats["missed"] += len(missed)
+            if missed:
+                vprint(f"    [Step {current_step}] No proposal in time from {', '.join(f'H{i}' for i in missed)}: dumb schedule")
+
+        slack_k0 = max(0.0, self.limit - float(total_community_demand[0]))
         for pkg in final_approved_data:
             pkg["community_slack_k0"] = slack_k0
 
 
+        self.stats["steps"] += 1
+        self.stats["iterations"] += iteration
+        self.stats["max_iterations"] = max(self.stats["max_iterations"], iteration)
+
         if not agreed:        
             final_approved_data = house_data_packages
+            self.stats["unresolved"] += 1
 
-            worst_k = total_community_demand.index(max(total_community_demand))
+            worst_k = int(np.argmax(total_community_demand))
             worst_demand = total_community_demand[worst_k]
 
-            vprint(f"    [Step {current_step}] WARNING: Max iterations reached. Accepting schedule with breaches.")
+            reason = "Houses stopped responding" if outcome == "stalled" else "Max iterations reached"
+            vprint(f"    [Step {current_step}] WARNING: {reason}. Accepting schedule with breaches.")
             vprint(f"      -> Worst breach occurs looking ahead {worst_k} steps.")
             vprint(f"      -> Demand: {worst_demand:.2f} kW (Limit: {self.limit} kW)")
             
             # Print exactly what each house is doing at that specific problem step
-            house_loads = [profiles[worst_k] for profiles in proposed_profiles]
+            house_loads = coordinator.profiles[:, worst_k]
             max_power = I_max/num_homes
-            breakdown = " | ".join([f"H{i}: {load:.2f}kW" for i, load in enumerate(house_loads) if load > max_power])            
+            culprits = np.flatnonzero(house_loads > max_power)
+            breakdown = " | ".join([f"H{i}: {house_loads[i]:.2f}kW" for i in culprits])            
             vprint(f"      -> Culprits: {breakdown}")
 
-        return final_approved_data, total_community_demand[0]
\ No newline at end of file
+        return final_approved_data, float(total_community_demand[0])
@@ -19,6 +19,7 @@ delta = 0.5
 steps_per_hour = int(1 / delta)
 total_steps = 24 * steps_per_hour
 time_steps = range(total_steps)  # 48 half-hourly time steps for a 24-hour period
+mpc_horizon = total_steps        # look-ahead of each house MPC solve, and the length of proposals and penalty vectors
 
 # Physical System Constants (parameters taken from the paper)
 
@@ -46,4 +47,52 @@ T_target = 20.0
 T_min = 18.0
 T_max = 22.0
 
+# Solver Settings
+solver_backend = "highs"    # "highs" runs HiGHS in-process via highspy, "cbc" uses PuLP's CBC binary (fallback)
+solver_time_limit = 10      # seconds per house solve
+warm_start = True           # seed each house solve with its previous plan shifted to the current step
+model_builder = "pulp"      # "sparse" writes the house model straight into NumPy/SciPy arrays, "pulp" builds PuLP objects (needed for CBC)
+drop_grid_binary = False    # leave out the import/export binary when exporting can never pay for importing
+horizon_blocks = None       # steps per MPC period, e.g. [1] * 8 + [2] * 8 + [4] * 6 (sparse builder only); None = every step
+lp_fast_path = False        # solve as a pure LP once every binary is fixed (appliances run, EV full, grid binary dropped)
+
+# Coordination
+community_solver = "negotiation"    # "central": one joint model with the transformer limit as a hard row (reference, sparse builder only)
+central_time_limit = 300            # seconds per joint community solve
+coordinator = "heuristic"           # "dual": dual subgradient prices, "heuristic": penalties += breach with +/-25% jitter
+coordinator_max_iterations = 10     # negotiation rounds per step before schedules are accepted with breaches
+dual_step_size = 0.2                # £/kWh of penalty per kW of breach (or spare capacity) per round
+dual_step_growth = 1.5              # step size multiplier for a slot that is still breached after a round
+dual_primal_tolerance = 1e-3        # kW of breach accepted as meeting the limit
+dual_dual_tolerance = 1e-3          # step size x change in community demand below which the houses have stopped moving
+active_set_negotiation = False      # after the first round only re-solve houses with load in a breached slot
+house_workers = 0                   # main.py: run the house agents in this many worker processes (0 = in-process threads)
+negotiation_deadline = None         # seconds per negotiation round, stragglers keep their last proposal or the dumb schedule (None = wait for all)
+negotiation_quorum = 1.0            # with a deadline: share of a round's houses whose replies close the round early
+
+# Surrogate Policy
+surrogate_log_dir = None        # log every solved house subproblem here as training data for surrogate.py
+surrogate_model = None          # model file from `python surrogate.py train`; None = always solve the MILP
+surrogate_radius = 0.5          # furthest a state may be from the training states (RMS over standardised features)
+surrogate_margin = 0.15         # predicted starts and EV on/off must be this close to 0 or 1
+surrogate_tolerance = 0.1       # kW allowed between the balance-derived and the predicted k=0 import
+
+# Subproblem Cache
+cache_subproblems = False       # reuse the solution of any house subproblem that has been solved before
+cache_max_entries = 4096        # in-memory LRU size per process (about 3 kB an entry)
+cache_dir = None                # directory for the shared on-disk tier (None = memory only)
+cache_penalty_quantum = 1e-6    # penalties are rounded to this before hashing
+
+# History
+history_window = None           # steps of each house's history kept in memory, older ones go to disk (None = keep the whole run)
+history_dir = None              # where the flushed steps are written, deleted when the run ends (None = a temporary directory)
+
+# Checkpoints
+checkpoint_every = None         # steps between checkpoints of a run, resumed from on the next start (None = off)
+checkpoint_dir = "checkpoints"  # one file per run, removed when the run finishes
+
+# Sweep Results
+series_dtype = "float32"        # precision the time series of a run are packed and stored at
+series_codec = None             # None (playback maps the file), "delta" (lossless, through zlib) or "zstd" (needs zstandard)
+
 
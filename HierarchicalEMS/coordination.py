@@ -0,0 +1,146 @@
+# coordination.py
+# Price coordination engines for CommunityController: each round they price the proposals
+# (stacked into a houses x horizon array), pick the schedules to approve and say when to stop.
+import random
+import numpy as np
+from config import *
+
+
+class HeuristicCoordinator:
+    # The original rule: penalties in a breached slot go up by the size of the breach and
+    # every house sees them with +/-25% jitter, so identical houses do not all move together
+
+    def __init__(self, max_iterations=coordinator_max_iterations):
+        self.max_iterations = max_iterations
+        self.penalties = np.zeros(mpc_horizon)
+        self.residuals = (0.0, 0.0)
+
+    def begin(self, current_step):
+        self.penalties = np.zeros(mpc_horizon)
+
+    def offer(self, house):
+        # Drawn from the global `random` stream, in the original order, so seeded runs keep their jitter
+        return (self.penalties * np.array([random.uniform(0.75, 1.25) for _ in range(mpc_horizon)])).tolist()
+
+    def update(self, packages, profiles, limit):
+        self.approved = packages
+        self.profiles = profiles
+        self.demand = profiles.sum(axis=0)
+        breach = np.maximum(0.0, self.demand - limit)
+        self.residuals = (float(breach.max()), 0.0)
+        if not (breach > 0).any():
+            return "agreed"
+        self.penalties += breach * 1.0
+        return None
+
+
+class DualCoordinator:
+    # Dual subgradient on the coupling constraint sum_i I_i[k] <= limit. The penalty in slot k is
+    # its Lagrange multiplier and moves with the slot's residual:
+    #     lambda[k] <- max(0, lambda[k] + rho[k] * (demand[k] - limit))
+    # so slots with spare capacity give back price as well as breached slots gaining it.
+    # rho[k] grows by step_growth for every round slot k stays breached, which bounds the number
+    # of rounds a persistent breach can take. The multipliers are carried over to the next step,
+    # shifted one slot, so a step usually starts close to the prices that cleared the last one.
+    #
+    # Stopping follows ADMM's residuals: the primal residual is the worst breach (kW) and the dual
+    # residual is rho times the largest change in community demand since the last round (£/kWh).
+    # A small dual residual with the limit still breached means the houses are no longer moving.
+    #
+    # Houses answer prices as a block, so a round's proposals tend to overshoot: the load leaves
+    # a breached slot and lands together on the next cheapest one. Every proposal is a feasible
+    # plan for its house though, so before asking for another round the engine looks for a mix of
+    # the proposals seen so far that meets the limit (primal recovery, no extra solves).
+
+    def __init__(self, step_size=dual_step_size, step_growth=dual_step_growth, primal_tolerance=dual_primal_tolerance,
+                 dual_tolerance=dual_dual_tolerance, max_iterations=coordinator_max_iterations):
+        self.step_size = step_size
+        self.step_growth = step_growth
+        self.primal_tolerance = primal_tolerance
+        self.dual_tolerance = dual_tolerance
+        self.max_iterations = max_iterations
+        self.penalties = np.zeros(mpc_horizon)
+        self.step = None
+        self.residuals = (0.0, 0.0)
+
+    def begin(self, current_step):
+        if self.step is not None and current_step > self.step:
+            shift = current_step - self.step
+            self.penalties = np.concatenate([self.penalties[shift:], np.zeros(min(shift, mpc_horizon))])
+        self.step = current_step
+        self.rho = np.full(mpc_horizon, self.step_size)
+        self.last_demand = None
+        self.candidates = []    # packages of every round of this step
+        self.history = []       # and their (houses x horizon) import profiles
+
+    def offer(self, house):
+        return self.penalties.tolist()
+
+    def update(self, packages, profiles, limit):
+        self.approved = packages
+        self.profiles = profiles
+        self.demand = total_demand = profiles.sum(axis=0)
+        self.candidates.append(list(packages))
+        self.history.append(profiles.copy())
+
+        primal = max(0.0, float(total_demand.max()) - limit)
+        if self.last_demand is None:
+            dual = float("inf")
+        else:
+            dual = float((self.rho * np.abs(total_demand - self.last_demand)).max())
+        self.residuals = (primal, dual)
+        self.last_demand = total_demand
+
+        residual = total_demand - limit
+        self.penalties = np.maximum(0.0, self.penalties + self.rho * residual)
+        self.rho = np.where(residual > self.primal_tolerance, self.rho * self.step_growth, self.rho)
+
+        if primal <= self.primal_tolerance:
+            return "agreed"
+        # The recovered mix never breaches more than the latest proposals, so it is what gets
+        # approved if the negotiation ends here
+        history = np.stack(self.history, axis=1)
+        choice, demand = recover_schedules(history, limit)
+        self.approved = [self.candidates[j][i] for i, j in enumerate(choice.tolist())]
+        self.profiles = history[np.arange(len(choice)), choice]
+        self.demand = demand
+        if demand.max() - limit <= self.primal_tolerance:
+            return "agreed"
+        if dual <= self.dual_tolerance:
+            return "stalled"
+        return None
+
+
+def recover_schedules(history, limit):
+    # history[i, r] is house i's import profile from round r of this step, latest last.
+    # Greedy local search from the latest proposals: keep making the single swap that removes
+    # the most breached energy until the limit holds or no swap helps. Every swap is scored at
+    # once as a (houses x rounds) table; ties go to the lowest house, then the earliest round.
+    houses, rounds, _ = history.shape
+    choice = np.full(houses, rounds - 1)
+    delta = history - history[:, -1:]       # change in demand if house i switches to round r
+    demand = history[:, -1].sum(axis=0)
+    breach = np.maximum(0.0, demand - limit).sum()
+    # No single swap moves slot k by more than this, so slots further below the limit never breach
+    reach = history.max(axis=(0, 1)) - history.min(axis=(0, 1))
+
+    while breach > 0:
+        slots = np.flatnonzero(demand + reach > limit)
+        totals = np.maximum(0.0, delta[:, :, slots] + (demand[slots] - limit)).sum(axis=2)
+        i, j = np.unravel_index(np.argmin(totals), totals.shape)
+        if not totals[i, j] < breach - 1e-9:
+            break
+        breach = totals[i, j]
+        demand = demand + delta[i, j]
+        choice[i] = j
+        delta[i] = history[i] - history[i, j]
+    return choice, demand
+
+
+def make_coordinator(name=None):
+    name = name or coordinator
+    if name == "heuristic":
+        return HeuristicCoordinator()
+    if name == "dual":
+        return DualCoordinator()
+    raise ValueError(f"Unknown coordinator '{name}'")
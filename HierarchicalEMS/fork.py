@@ -0,0 +1,84 @@
+# fork.py
+# What-if branches that share a run's prefix: the run up to the fork step is saved as a
+# checkpoint and each branch resumes from it in its own process with a different alpha,
+# sigma_human or I_max (python fork.py <seed> <fork step>).
+import os
+import sys
+import concurrent.futures
+import pandas as pd
+from config import *
+from subproblem_cache import shared_cache
+from surrogate import shared_policy
+from pareto_parallel import start_simulation, advance, finish, init_worker, sweep_cache_dir, alphas
+import checkpoint
+
+changeable = ("alpha", "sigma_human", "I_max")
+
+
+def snapshot(params, fork_step, path):
+    # Run the prefix with the base parameters and save the community at the fork step
+    if not 0 <= fork_step <= 48 * days:
+        raise ValueError(f"Fork step {fork_step} is outside the run (0 to {48 * days} steps)")
+    sim = start_simulation(*params)
+    advance(sim, fork_step)
+    checkpoint.save(path, fork_step, sim["houses"], sim["community"], series=sim["cache"], metrics=sim["metrics"])
+    return [house.history_E for house in sim["houses"]]     # removed by fork() once the branches are done
+
+
+def branch(path, params, changes):
+    # One child: the snapshot with its changes, run to the end
+    unknown = set(changes) - set(changeable)
+    if unknown:
+        raise ValueError(f"A branch can only change {', '.join(changeable)}, not {', '.join(sorted(unknown))}")
+    alpha, sigma, seed_val = params
+    saved = checkpoint.read(path)
+    sim = {"alpha": changes.get("alpha", alpha), "sigma": changes.get("sigma_human", sigma), "seed": seed_val,
+           "step": saved["step"], "houses": saved["houses"], "community": saved["community"],
+           "cache": saved["series"], "metrics": saved["metrics"], "cache_stats": dict(shared_cache.stats),
+           "surrogate_stats": dict(shared_policy.stats)}
+
+    houses, community = sim["houses"], sim["community"]
+    if "I_max" in changes:
+        community.limit = sim["metrics"].limit = changes["I_max"]
+    for house in houses:
+        house.history_E.branch(history_dir)      # bounded histories: the blocks written from here are this branch's
+        house.alpha = sim["alpha"]
+        house.sigma_human = sim["sigma"]
+        house.house_limit = community.limit / len(houses)
+
+    advance(sim, 48 * days)
+    result = finish(sim)
+    result.update({'I_max': community.limit, 'Fork_Step': saved["step"]})
+    for house in houses:
+        house.history_E.remove()
+    return result
+
+
+def fork(params, fork_step, branches, max_workers=None):
+    # The results of every branch, in order. The prefix runs in the pool too, so it sees the
+    # same shared subproblem cache as the branches.
+    alpha, sigma, seed_val = params
+    path = checkpoint.path_for(f"fork_{alpha}_{sigma}_{seed_val}_{fork_step}")
+    prefix = []
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                                    initargs=(sweep_cache_dir,)) as executor:
+            prefix = executor.submit(snapshot, params, fork_step, path).result()
+            return list(executor.map(branch, [path] * len(branches), [params] * len(branches), branches))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        for history_E in prefix:
+            history_E.remove()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("usage: python fork.py <seed> <fork step>")
+    seed_val, fork_step = int(sys.argv[1]), int(sys.argv[2])
+    sigma = 0.75
+
+    results = fork((alphas[0], sigma, seed_val), fork_step, [{"alpha": alpha} for alpha in alphas])
+    df = pd.DataFrame([{k: v for k, v in r.items() if k != 'Time_Series_Cache'} for r in results])
+    print(f"Seed {seed_val}, sigma {sigma}, forked at step {fork_step}")
+    print(df[['Alpha', 'Cost_Saving', 'Peak_Reduction', 'SLA', 'Smart_Breach_Count', 'Smart_Cost']].to_string(index=False))
@@ -0,0 +1,157 @@
+# history.py
+# What each house did at every step, as one (channels x steps) float array behind the old
+# history_E dict interface. With history_window only a ring of recent steps stays in memory
+# and older blocks go to <directory>/<block>.npy; remove() deletes them when the run is over.
+import os
+import shutil
+import tempfile
+import numpy as np
+from config import *
+from data import *
+
+# Channel registry. Appliance rows hold a start flag (1 in the step a constant appliance
+# starts) or the average power of a flexible one; Open_Loop_* rows are the dumb baseline.
+channel_names = (["Grid_Import", "Grid_Export", "Open_Loop_Import", "Open_Loop_Export", "Battery_Discharge",
+                  "Heat_Pump", "Rogue_Load", "Fridge", "Freezer", "Open_Loop_Heat_Pump", "Open_Loop_Fridge",
+                  "Open_Loop_Freezer", "Indoor_Temp"]
+                 + [app["name"] for app in appliances]
+                 + [f"Open_Loop_{app['name']}" for app in appliances])
+channel_index = {name: row for row, name in enumerate(channel_names)}
+
+# Steps the house agent looks back over: a constant appliance started this many steps ago is still running
+lookback = max(int(app.get("Slots", 1)) for app in appliances)
+
+
+class History:
+    def __init__(self, steps=total_steps * days, window=None, directory=None):
+        self.index = dict(channel_index)     # channels outside the registry are added as they are written
+        self.steps = 0                       # one past the last step written
+        self.start = 0                       # first step still in memory
+        self.window = window
+        if window is None:
+            self.data = np.zeros((len(self.index), steps))
+        else:
+            if window < lookback:
+                raise ValueError(f"history_window must cover the longest appliance run ({lookback} steps)")
+            self.data = np.zeros((len(self.index), 2 * window))
+            self.directory = tempfile.mkdtemp(prefix="history_", dir=directory)
+
+    def __getstate__(self):
+        # Copies (checkpoints, worker transfers) carry the written steps, not the preallocated tail
+        state = self.__dict__.copy()
+        if self.window is None:
+            state["data"] = self.data[:, :self.steps].copy()
+        return state
+
+    def branch(self, directory=None):
+        # Give a copy of this history (a forked run, see fork.py) a directory of its own. Blocks
+        # already on disk are never written again, so the new directory links to them; only the
+        # blocks written after the fork are its own.
+        if self.window is None:
+            return
+        shared, self.directory = self.directory, tempfile.mkdtemp(prefix="history_", dir=directory)
+        for name in os.listdir(shared):
+            try:
+                os.link(os.path.join(shared, name), os.path.join(self.directory, name))
+            except OSError:
+                shutil.copy(os.path.join(shared, name), self.directory)
+
+    def remove(self):
+        # The run is over and reported: delete the blocks on disk. Copies of a history (workers,
+        # checkpoints) share its directory, so only the run that owns it calls this.
+        if self.window is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def row(self, name):
+        row = self.index.get(name)
+        if row is None:
+            row = self.index[name] = len(self.index)
+            if row == len(self.data):
+                self.data = np.vstack([self.data, np.zeros_like(self.data)])
+        return row
+
+    def column(self, step):
+        return step if self.window is None else step % (2 * self.window)
+
+    def __setitem__(self, key, value):
+        name, step = key
+        row = self.index.get(name)
+        if row is None:
+            row = self.row(name)
+        if step >= self.steps:
+            self.advance(step)
+        elif step < self.start:
+            raise ValueError(f"Step {step} of the history has already been written to disk")
+        self.data[row, self.column(step)] = value
+
+    def advance(self, step):
+        if self.window is None:
+            if step >= self.data.shape[1]:
+                # Longer run than preallocated: double the columns
+                grown = np.zeros((len(self.data), max(step + 1, 2 * self.data.shape[1])))
+                grown[:, :self.data.shape[1]] = self.data
+                self.data = grown
+        else:
+            # Entering a new block: the block two back goes to disk and its columns are cleared
+            while step >= self.start + 2 * self.window:
+                columns = slice(self.column(self.start), self.column(self.start) + self.window)
+                np.save(os.path.join(self.directory, f"{self.start // self.window}.npy"), self.data[:, columns])
+                self.data[:, columns] = 0.0
+                self.start += self.window
+        self.steps = step + 1
+
+    def block(self, row, number):
+        # One row of a block on disk. Rows added after the block was written read as zero.
+        values = np.load(os.path.join(self.directory, f"{number}.npy"), mmap_mode="r")
+        return np.array(values[row]) if row < len(values) else np.zeros(self.window)
+
+    def get(self, key, default=0.0):
+        name, step = key
+        row = self.index.get(name)
+        if row is None or not 0 <= step < self.steps:
+            return default
+        if step < self.start:
+            return float(self.block(row, step // self.window)[step % self.window])
+        return float(self.data[row, self.column(step)])
+
+    def __getitem__(self, key):
+        name, step = key
+        if name not in self.index or not 0 <= step < self.steps:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key):
+        name, step = key
+        return name in self.index and 0 <= step < self.steps
+
+    def series(self, name, stop=None):
+        # The channel over steps [0, stop) as an array, zero past the last step written.
+        # Within the written steps of a full history this is a view, so copy it before the next
+        # write if it is kept. In bounded mode the steps on disk are read back into a new array.
+        stop = self.steps if stop is None else stop
+        row = self.index.get(name)
+        if row is None:
+            return np.zeros(stop)
+        if self.window is None:
+            if stop > self.data.shape[1]:
+                return np.concatenate([self.data[row], np.zeros(stop - self.data.shape[1])])
+            return self.data[row, :stop]
+
+        values = np.zeros(stop)
+        for first in range(0, min(stop, self.start), self.window):
+            count = min(self.window, stop - first)
+            values[first:first + count] = self.block(row, first // self.window)[:count]
+        for first in range(self.start, min(stop, self.steps), self.window):
+            count = min(self.window, stop - first)
+            values[first:first + count] = self.data[row, self.column(first):self.column(first) + count]
+        return values
+
+    def running(self, name, slots, stop=None):
+        # Number of starts of a constant appliance still running at each step (started in the last `slots` steps)
+        starts = (self.series(name, stop) == 1).astype(np.float64)
+        return np.convolve(starts, np.ones(int(slots)))[:len(starts)]
+
+
+def stack(houses, name, stop):
+    # One channel of every house as a (houses x steps) array
+    return np.array([house.history_E.series(name, stop) for house in houses])
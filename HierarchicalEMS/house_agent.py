@@ -1,7 +1,12 @@
 # house_agent.py
-import pulp
 from config import *
 from data import *
+from house_model import HouseModel
+from sparse_model import SparseHouseModel
+from subproblem_cache import shared_cache, subproblem_key, essentials
+from surrogate import shared_policy, sample_log
+from history import History
+from metrics import readings
 import random
 import copy
 import scipy.stats as stats
@@ -19,8 +24,7 @@ class HouseAgent:
         self.open_soc = S_init
         self.current_soc_th = 0.25 * C_TH
         self.appliances_already_run = {app["name"]: False for app in appliances}
-        self.history_E = {}
-        self.history_T_in = []
+        self.history_E = History(window=history_window, directory=history_dir)     # (channel, step) -> value, see history.py
 
         self.current_T_fridge = 4.0
         self.current_T_freezer = -18.0
@@ -31,6 +35,10 @@ class HouseAgent:
         self.daily_total_uncontrolled_energy = 0.0
         self.daily_total_controlled_energy = 0.0
         self.current_T_in = 20.0
+
+        # Persistent MPC formulation, built on the first solve
+        self.model_template = None
+        self.horizon_inputs = None      # Inputs of the step currently being negotiated
         
     
         # Add randomness
@@ -56,8 +64,15 @@ class HouseAgent:
             random.choice([1.5, 2.5, 3.5]) if random.random() < 0.10 else 0.0
             for _ in range(total_steps * 14)
         ]    
+        self.rogue_start = 0        # step of rogue_spikes_timeline[0]
+        # Spikes past the pregenerated fortnight are drawn a day at a time from the house's own
+        # generator, seeded from its own draws so the global sequence (and every shorter run) is unchanged
+        self.rogue_rng = random.Random(hash((house_id, tuple(self.rogue_spikes_timeline))))
 
         self.noise = [random.uniform(-0.05, 0.05) for _ in range(48)]
+        # The length of each rogue spike too: drawn by the house, so it draws the same whether it
+        # runs in this process or in a worker (house_workers.py)
+        self.spike_rng = random.Random(hash((house_id, tuple(self.noise))))
 
         self.all_days_appliances = []
         for i in range(days):
@@ -71,6 +86,27 @@ class HouseAgent:
 
         
 
+    def __getstate__(self):
+        # The persistent model holds a live HiGHS instance, so copies (worker processes) rebuild it
+        # on their next solve, starting from a fresh negotiation step
+        state = self.__dict__.copy()
+        state["model_template"] = None
+        state["horizon_inputs"] = None
+        return state
+
+    def rogue_spike(self, current_step):
+        # Unpredicted human load at a step. With a bounded history only the last fortnight of
+        # spikes is kept, older days are dropped as new ones are drawn.
+        while current_step >= self.rogue_start + len(self.rogue_spikes_timeline):
+            self.rogue_spikes_timeline += [
+                self.rogue_rng.choice([1.5, 2.5, 3.5]) if self.rogue_rng.random() < 0.10 else 0.0
+                for _ in range(total_steps)
+            ]
+            if history_window is not None:
+                del self.rogue_spikes_timeline[:total_steps]
+                self.rogue_start += total_steps
+        return self.rogue_spikes_timeline[current_step - self.rogue_start]
+
     def randomise_daily_appliances(self, current_step=0):
         # Generate a fresh schedule for each day
         # Appliance window variance and continuous-time random allocation
@@ -162,160 +198,37 @@ class HouseAgent:
         # if ev:
         #     print(f"--> House {self.house_id} EV Window: Plugs in at {ev['T_S']:.2f}, Needs full by {ev['T_F']:.2f}. Energy needed: {ev.get('Required_Energy', 0)} kWh")
 
-    def generate_proposed_schedule(self, current_step, community_penalty_prices):
-        # Lower level solver
-        # Runs a 24 hour look ahead MPC using PuLP to minimise the house's nill
-        # Takes the community penalty prices into account to avoid causing grid spikes
-
-
-        if current_step > 0 and current_step % total_steps == 0:
-            day_id = (current_step // total_steps) % len(self.all_days_appliances)
-            new_day = copy.deepcopy(self.all_days_appliances[day_id])
-            
-            for old_app in self.personal_appliances:
-                name = old_app["name"]
-                is_mid_cycle = False
-
-                if old_app.get("power_type") == "flexible":
-                    is_mid_cycle = self.flexible_energy_delivered.get(name, 0.0) > 0.0
-                elif old_app.get("power_type") == "constant":
-                    duration = int(old_app.get("Slots", 0))
-                    is_mid_cycle = any(self.history_E.get((name, current_step - k), 0) == 1 for k in range(1, duration + 1))
-                
-                if is_mid_cycle:
-                    # Overwrite the new random appliance with the one currently running
-                    new_day = [old_app if app["name"] == name else app for app in new_day]
-
-            self.personal_appliances = new_day
-            self.uncontrolled_appliances = [app for app in self.personal_appliances if not app.get('deferrable', True)]
-
-            for app_name in self.appliances_already_run:
-                self.appliances_already_run[app_name]= False
-
-        horizon = 48
+    def build_horizon_inputs(self, current_step, horizon=mpc_horizon):
+        # Everything the MPC formulation needs that changes from step to step:
+        # initial states, forecasts over the look-ahead window, chance-constraint margins
+        # and which slots each appliance is allowed to use
         mpc_steps = range(horizon)
 
-        model = pulp.LpProblem(f"House_{self.house_id}_Step_{current_step}", pulp.LpMinimize)
-
-        # PuLP variable definition
-        S_E = pulp.LpVariable.dicts(f"SoC_H{self.house_id}", mpc_steps, 0, self.battery_capacity)
-        z = pulp.LpVariable.dicts(f"Charge_Rate_H{self.house_id}", mpc_steps, lowBound=0, cat='Continuous')
-        y = pulp.LpVariable.dicts(f"Discharge_Rate_H{self.house_id}", mpc_steps, lowBound=0, cat='Continuous')
-        I = pulp.LpVariable.dicts(f"Grid_Import_H{self.house_id}", mpc_steps, lowBound=0, cat='Continuous')
-        I_excess = pulp.LpVariable.dicts(f"Excess_Import_H{self.house_id}", mpc_steps, lowBound=0, cat='continuous')
-        I_export = pulp.LpVariable.dicts(f"Grid Export", mpc_steps, lowBound=0)
-        # binary state (1 = Importing, 0 = Exporting)
-        Z_grid = pulp.LpVariable.dicts(f"Grid_State_H{self.house_id}", mpc_steps, cat='Binary')
-
-        P_HP = pulp.LpVariable.dicts(f"Heat_Pump_Power_H{self.house_id}", mpc_steps, lowBound=0, upBound=10.0, cat='Continuous')
-        P_HP_Space = pulp.LpVariable.dicts(f"HP_Space_H{self.house_id}", mpc_steps, lowBound=0, cat='Continuous')
-        P_HP_DHW = pulp.LpVariable.dicts(f"P_HP_DHW{self.house_id}", mpc_steps, lowBound=0, cat='Continuous')
-        S_TH = pulp.LpVariable.dicts(f"SoC_Therm_H{self.house_id}", mpc_steps, 0, C_TH, cat='Continuous')
-        T_in = pulp.LpVariable.dicts(f"T_house_H{self.house_id}", mpc_steps, lowBound=T_min, upBound=T_max, cat='Continuous')
-        diff = pulp.LpVariable.dicts(f"T_diff_H{self.house_id}", mpc_steps, lowBound=0)                 # Comfort deviation variable     
-
-        T_fr = pulp.LpVariable.dicts(f"T_fridge_H{self.house_id}", mpc_steps, lowBound=2, upBound=5, cat='Continuous')
-        T_fz = pulp.LpVariable.dicts(f"T_freezer_H{self.house_id}", mpc_steps, lowBound=-22.0, upBound=-15.0, cat='Continuous')
-        P_comp_fr = pulp.LpVariable.dicts(f"Fridge_Comp_Power_H{self.house_id}", mpc_steps, lowBound=0.0, upBound=0.3, cat='Continuous')
-        P_comp_fz = pulp.LpVariable.dicts(f"Freezer_Comp_Power_H{self.house_id}", mpc_steps, lowBound=0.0, upBound=0.3, cat='Continuous')
-        P_max_local = pulp.LpVariable(f"Peak_Import_H{self.house_id}", lowBound=0, cat='Continuous') 
-        P_max_flex = pulp.LpVariable(f"Peak_Flex_H{self.house_id}", lowBound=0, cat='Continuous')
-
         # Chance constraint setup
         # Calculate the Z-score using the Inverse Cumulative Distribution Function
         z_score = stats.norm.ppf(1- self.alpha)
-        safety_margin = z_score * self.sigma_human
-
         safety_margin_kw = z_score * self.sigma_human
         safety_reserve_kwh = safety_margin_kw * delta
 
         base_soc_floor = 0.05 * self.battery_capacity       # always keep a little bit regardless of sigma
         dynamic_soc_min = min(self.battery_capacity, base_soc_floor + safety_reserve_kwh)
 
-        # Chance Constraint implementation
-
-        E = {}       # For Type 1 & 2: Constant, Non-Interruptible (Start Times)
-        P_flex = {}  # For Type 3: Flexible Power draw
-        O_flex = {}  # For Type 3: Binary On/Off State (for minimum power limits)
-
-        E_deficit = {}
-        for app in self.personal_appliances:
-            if app.get("power_type") == "flexible":
-                E_deficit[app["name"]] = pulp.LpVariable(f"Deficit_{app['name']}_H{self.house_id}", lowBound=0, cat="Continuous")
-
-        Reserve_deficit = pulp.LpVariable.dicts(f"Reserve_deficit_H{self.house_id}", mpc_steps, lowBound=0, cat='Continuous')
-
-        for app in self.personal_appliances:
-            name = app["name"]
-            for k in mpc_steps:
-                if app["power_type"] == "constant":
-                    E[(name, k)] = pulp.LpVariable(f"Start_{name}_H{self.house_id}_k{k}", cat='Binary')
-                elif app["power_type"] == "flexible":
-                    P_flex[(name, k)] = pulp.LpVariable(f"Power_{name}_H{self.house_id}_k{k}", lowBound=0, cat='Continuous')
-                    O_flex[(name, k)] = pulp.LpVariable(f"State_{name}_H{self.house_id}_k{k}", cat='Binary')
-
-        # Battery Limits and Dynamics Loop
-        for k in mpc_steps:
-            model += y[k] <= D_E, f"Discharge_Rate_Limit{k}"
-            model += z[k] <= G_E, f"Charge_Limit{k}"
-            model += I[k] <= self.house_limit + I_excess[k], f"Grid_limit_{k}"
-
-            M = 20.0  # Safe physical wire limit in kW
-            model += I[k] <= M * Z_grid[k], f"Max_Import_State_{k}"
-            model += I_export[k] <= M * (1 - Z_grid[k]), f"Max_Export_State_{k}"
-
-            # The sum of unused grid capacity + unused battery discharge + interruptible charging
-            # must always be capable of absorbing the suddent chance-constraint spikes
-            # The battery inverter must always maintain enough headroom to absorb a rogue spike
-            model += (D_E - y[k]) + z[k] >= safety_margin
-            model += I[k] <= P_max_local, f"Track_Peak_{k}"
-
-            # Sum flexible appliances AND the Heat Pump to squash them together
-            flex_sum = pulp.lpSum([P_flex[(app["name"], k)] for app in self.personal_appliances if app.get("power_type") == "flexible" and (app["name"], k) in P_flex])
-            
-            # The £1.50 objective penalty will now force the EV and Heat Pump to flatten
-            model += flex_sum + P_HP[k] <= P_max_flex, f"Track_Flex_Peak_{k}"
-            # The battery is forced to keep enough energy to survive a 30-minute spike
-           
-            model += S_E[k] >= dynamic_soc_min - Reserve_deficit[k], f"Soft_Safety_Reserve_k{k}"
-            
-            # Storage Dynamics
-            if k == 0:
-                model += S_E[0] == self.current_soc + (nu_E * delta * z[0]) - (delta * y[0] / nu_E)
-            else:
-                # Subsequent steps look backwards at k-1
-                model += S_E[k] == S_E[k-1] + (nu_E * delta * z[k]) - (delta * y[k] / nu_E)
-
-          
-            
-        # Physical Constraints
-        local_elec_demand = [self.personal_elec_demand[(current_step + k) % total_steps] for k in mpc_steps]
-        #Local Data Arrays for this specific prediction horizon
-        # Rogue user interjection
-        rogue_power = self.rogue_spikes_timeline[current_step]
-        
-        # local_elec_demand[0] += rogue_power     # This is now handled as an unforeseen spike in the RTAS stage
-        
         solar_generation_per_house = [self.pv_capacity * efficiency * multiplier for multiplier in solar_profile]
-        local_solar_gen = [solar_generation_per_house[(current_step + k) % 48] for k in mpc_steps]
 
-        flexible_load = {k: 0.0 for k in mpc_steps}
-        locked_in_power = {k: 0.0 for k in mpc_steps}
+        locked_in_power = [0.0] * horizon
+        start_windows = {}      # Constant appliances: local steps where a start is allowed
+        flex_sessions = {}      # Flexible appliances: (local steps of the charging session, energy still required)
 
         for app in self.personal_appliances:
             name = app["name"]
             power_type = app["power_type"]
             interruptible = app.get("interruptible", False)
-            deferrable = app.get("deferrable", True)
 
             if power_type == "constant" and not interruptible:
                 power = app["Power"]
                 duration_steps = int(app["Slots"])
 
-                if self.appliances_already_run.get(name) == True:
-                    for k in mpc_steps:
-                        model += E[(name, k)] == 0, f"Already_run_{name}_{k}"
-                else:
+                if not self.appliances_already_run.get(name) == True:
                     abs_start_limit = int(app["T_S"] * steps_per_hour)
                     abs_end_limit = int(app["T_F"] * steps_per_hour - duration_steps) % total_steps
 
@@ -329,28 +242,19 @@ class HouseAgent:
                             is_valid = (abs_start_limit <= abs_t <= abs_end_limit)
                         else:
                             is_valid = (abs_t >= abs_start_limit or abs_t <= abs_end_limit)
-                        
+
                         if is_valid:
                             if not window_closed:
                                 valid_k_starts.append(k)
                                 found_window = True
-                            else:
-                                model += E[name, k] == 0
-                        else:
-                            if found_window:
-                                window_closed = True
-                            model += E[name, k] == 0
+                        elif found_window:
+                            window_closed = True
 
                     if len(valid_k_starts) > 0:
-                        model += pulp.lpSum(E[name, k] for k in valid_k_starts) == 1, f"Sched_{name}"
+                        start_windows[name] = valid_k_starts
 
-                # Calculate physical load profiles for constant appliances
+                # Past loads still running (locked in)
                 for k in mpc_steps:
-                    # Future/present starts
-                    possible_local_starts = [ks for ks in range(k - duration_steps + 1, k + 1) if ks >= 0]
-                    flexible_load[k] += pulp.lpSum(E[(name, ks)] for ks in possible_local_starts) * power    
-
-                    # Past loads still running (locked in)
                     for past_k in range(-duration_steps + 1, 0):
                         if (k - past_k) < duration_steps:
                             past_t = (current_step + past_k)
@@ -358,19 +262,16 @@ class HouseAgent:
                                 locked_in_power[k] += power
 
             elif power_type == "flexible":
-                min_p = app["Min_Power"]
-                max_p = app["Max_Power"]
                 req_energy = app["Required_Energy"]
-                
 
                 abs_start_limit = int(app["T_S"] * steps_per_hour)
                 abs_t_current = current_step % total_steps
-                
-                if abs_t_current == abs_start_limit: 
+
+                if abs_t_current == abs_start_limit:
                     delivered_so_far = 0.0
                 else:
                     delivered_so_far = self.flexible_energy_delivered.get(name, 0.0)
-                
+
                 req_energy = max(0.0, req_energy - delivered_so_far)
 
                 abs_end_limit = int(app["T_F"] * steps_per_hour) % total_steps
@@ -380,111 +281,161 @@ class HouseAgent:
 
                 for k in mpc_steps:
                     abs_t = (current_step + k) % total_steps
-                    
+
                     # Window logic (allows crossing midnight)
                     if abs_start_limit <= abs_end_limit:
                         is_valid = (abs_start_limit <= abs_t < abs_end_limit)
                     else:
                         is_valid = (abs_t >= abs_start_limit or abs_t < abs_end_limit)
-                        
+
                     if is_valid:
                         if not session_ended:
                             current_session_k.append(k)
                             found_session = True
-                        else:
-                            # Strictly off outside the window
-                            model += O_flex[(name, k)] == 0, f"Off_Out_{name}_{k}"
-                            model += P_flex[(name, k)] == 0, f"Zero_Out_{name}_{k}"
-                    else:
-                        if found_session:
-                            session_ended = True
-                        model += O_flex[(name, k)] == 0, f"Off_Out_{name}_{k}"
-                        model += P_flex[(name, k)] == 0, f"Zero_Out_{name}_{k}"
-                    
-                    # The Semi-Continuous Logic: If On, must be between Min and Max
-                    model += P_flex[(name, k)] >= min_p * O_flex[(name, k)], f"Min_{name}_{k}"
-                    model += P_flex[(name, k)] <= max_p * O_flex[(name, k)], f"Max_{name}_{k}"
-                    
-                    # Add directly to the flexible load (no locked-in history needed because it can be paused)
-                    flexible_load[k] += P_flex[(name, k)]
+                    elif found_session:
+                        session_ended = True
+
+                flex_sessions[name] = (current_session_k, req_energy)
+
+        return {
+            "step": current_step,
+            "soc": self.current_soc,
+            "soc_th": self.current_soc_th,
+            "T_fridge": self.current_T_fridge,
+            "T_freezer": self.current_T_freezer,
+            "T_in": self.current_T_in,
+            "elec_demand": [self.personal_elec_demand[(current_step + k) % total_steps] for k in mpc_steps],
+            "solar": [solar_generation_per_house[(current_step + k) % 48] for k in mpc_steps],
+            "T_out": [current_ambient_temp_profile[(current_step + k) % 48] for k in mpc_steps],
+            "prices": [price_grid_elec[(current_step + k) % 48] for k in mpc_steps],
+            "export_prices": [price_grid_export[(current_step + k) % 48] for k in mpc_steps],
+            "safety_margin": safety_margin_kw,
+            "dynamic_soc_min": dynamic_soc_min,
+            "locked_in_power": locked_in_power,
+            "start_windows": start_windows,
+            "flex_sessions": flex_sessions,
+        }
 
-                model += pulp.lpSum(P_flex[(name, k)] * delta for k in current_session_k) >= req_energy - E_deficit[name], f"Energy_Req_Min_{name}"
-                model += pulp.lpSum(P_flex[(name, k)] * delta for k in current_session_k) <= req_energy, f"Energy_Req_Max_{name}"
-        
-        local_T_out = [current_ambient_temp_profile[(current_step + k) % 48] for k in mpc_steps]
+    def generate_proposed_schedule(self, current_step, community_penalty_prices):
+        # Lower level solver
+        # Runs a 24 hour look ahead MPC using PuLP to minimise the house's nill
+        # Takes the community penalty prices into account to avoid causing grid spikes
 
-        for k in mpc_steps:
-            model += (local_elec_demand[k] + flexible_load[k] + locked_in_power[k] + P_HP[k] + z[k] + (0.3 * P_comp_fr[k]) + (0.3 * P_comp_fz[k]) + I_export[k] == I[k] + local_solar_gen[k] + y[k]), f"Power_balance_{k}"
+        inputs = self.prepare_model(current_step, community_penalty_prices)
+
+        # Identical subproblems (same state, windows, reserve and penalties) are only solved once
+        cache_key = None
+        sol = None
+        if cache_subproblems:
+            cache_key = subproblem_key(self.model_template.signature, self.battery_capacity, self.house_limit,
+                                       inputs, community_penalty_prices)
+            sol = shared_cache.get(cache_key)
+        if sol is None:
+            # A confident surrogate answer stands in for the solve (not cached, it is not exact)
+            sol = shared_policy.propose(inputs, community_penalty_prices, self.battery_capacity, self.house_limit)
+        if sol is not None:
+            status = "Optimal"
+        else:
+            status = self.model_template.solve()
+            if status != "Optimal" and self.model_template.cancelled():
+                status = "Missed_Deadline"      # stopped by the controller, this answer is not used
+            if status == "Optimal":
+                sol = self.model_template.solution()
+                # Only proven optima are exact answers; a time-limited incumbent is used this once
+                if cache_key is not None and self.model_template.last_solve["status"] == "Optimal":
+                    shared_cache.put(cache_key, essentials(sol))
+                if sample_log.directory is not None:
+                    # Training data for surrogate.py, stored once per distinct subproblem
+                    sample_key = subproblem_key(self.model_template.signature, self.battery_capacity, self.house_limit,
+                                                inputs, community_penalty_prices)
+                    sample_log.put(sample_key, {"inputs": inputs, "penalties": list(community_penalty_prices), "sol": sol,
+                                         "battery_capacity": self.battery_capacity, "house_limit": self.house_limit})
+
+        return self.package_schedule(current_step, community_penalty_prices, inputs, status, sol)
+
+    def fallback_schedule(self, current_step):
+        # The dumb schedule for this step. The streaming negotiation asks for it before any solve
+        # starts, so a house that misses the deadline still has a safe package to run.
+        self.start_day(current_step)
+        return self.package_schedule(current_step, None, None, "Missed_Deadline", None)
+
+    def cancel_solve(self, current_step):
+        # The negotiation of this step is over: stop a solve still running for it
+        if self.model_template is not None:
+            self.model_template.cancel(current_step)
+
+    def start_day(self, current_step):
+        # Roll the appliances over at midnight. Within a step every call gives the same day.
+        if current_step > 0 and current_step % total_steps == 0:
+            day_id = (current_step // total_steps) % len(self.all_days_appliances)
+            new_day = copy.deepcopy(self.all_days_appliances[day_id])
             
-            model += P_HP_Space[k] + P_HP_DHW[k] == P_HP[k], f"HP_Split_{k}"
-
-            if k == 0:
-                model += T_fr[0] == self.current_T_fridge + (0.1196 * delta) - (((0.1467 + 0.1196) / 0.3) * delta * P_comp_fr[0])
-                model += T_fz[0] == self.current_T_freezer + ((15/67) * delta) - (((7/25) + (15/67)) / 0.3 * delta * P_comp_fz[0])
-                model += T_in[0] == self.current_T_in + (delta/C_in) * ((P_HP_Space[0] * COP) - (UA * (self.current_T_in - local_T_out[0])))
-                model += S_TH[0] == self.current_soc_th + (P_HP_DHW[0] * COP * delta)
-
-            else: 
-                model += T_fr[k] == T_fr[k-1] + (0.1196 * delta) - (((0.1467 + 0.1196) / 0.3) * delta * P_comp_fr[k])
-                model += T_fz[k] == T_fz[k-1] + ((15/67) * delta) - (((7/25) + (15/67)) / 0.3 * delta * P_comp_fz[k])
-                model += T_in[k] == T_in[k-1] + (delta/C_in) * ((P_HP_Space[k] * COP) - (UA * (T_in[k-1] - local_T_out[k])))
-                model += S_TH[k] == S_TH[k-1] + (P_HP_DHW[k] * COP * delta)
-
-            # Comfort Deviation Constraints
-            model += diff[k] >= T_in[k] - T_target
-            model += diff[k] >= T_target - T_in[k]
-
-
-    
-        # Objective Function
-        local_prices = [price_grid_elec[(current_step + k) % 48] for k in mpc_steps]
-        local_export_prices = [price_grid_export[(current_step + k) % 48] for k in mpc_steps]
-
-        # Generate a noise profile for this specific house
-        # noise = self.noise
-
-        total_cost = pulp.lpSum([
-            delta * (I[k] * (local_prices[k] + community_penalty_prices[k])) -
-            delta * (I_export[k] * local_export_prices[k]) +  
-            (1000 * I_excess[k]) +      # penalty for going over 1kW battery will no save itself for the 35p peak
-            (200 * Reserve_deficit[k]) +
-            (5.0 * diff[k]) + 
-            delta * (y[k] * wear_cost_elec) + 
-            delta * (P_HP[k] * wear_cost_therm)
-            for k in mpc_steps
-        ])
-        
+            for old_app in self.personal_appliances:
+                name = old_app["name"]
+                is_mid_cycle = False
 
-        for app in self.personal_appliances:
-            if app.get("power_type") == "flexible":
-                total_cost += 5000 * E_deficit[app["name"]]
+                if old_app.get("power_type") == "flexible":
+                    is_mid_cycle = self.flexible_energy_delivered.get(name, 0.0) > 0.0
+                elif old_app.get("power_type") == "constant":
+                    duration = int(old_app.get("Slots", 0))
+                    is_mid_cycle = any(self.history_E.get((name, current_step - k), 0) == 1 for k in range(1, duration + 1))
+                
+                if is_mid_cycle:
+                    # Overwrite the new random appliance with the one currently running
+                    new_day = [old_app if app["name"] == name else app for app in new_day]
 
+            self.personal_appliances = new_day
+            self.uncontrolled_appliances = [app for app in self.personal_appliances if not app.get('deferrable', True)]
 
-        terminal_value_rate = 0.08
-        # Lowered so the battery will prioritize Agile prices over perfect flatness
-        final_objective = total_cost - (terminal_value_rate * S_E[horizon - 1]) + (0.1 * P_max_local) + (10 * P_max_flex)        
-        model += final_objective 
+            for app_name in self.appliances_already_run:
+                self.appliances_already_run[app_name]= False
 
-    
-        # Terminal Region
-        model += S_E[horizon - 1] >= dynamic_soc_min, "Terminal_Region_Lower_Bound"
-        
-        model += T_in[horizon - 1] >= T_min, "Terminal_Thermal_Region"
+    def prepare_model(self, current_step, community_penalty_prices):
+        # Roll the appliances over at midnight, then bring the persistent formulation up to
+        # this step and these penalties. Returns the horizon inputs it was built from.
+        self.start_day(current_step)
+        horizon = mpc_horizon
+
+        # The formulation is built once per house and then only updated in place
+        if self.model_template is None:
+            if model_builder == "sparse":
+                self.model_template = SparseHouseModel(self.house_id, self.battery_capacity, self.house_limit, horizon,
+                                                       blocks=horizon_blocks)
+            elif horizon_blocks:
+                raise ValueError("Move-blocked horizons need model_builder = 'sparse'")
+            else:
+                self.model_template = HouseModel(self.house_id, self.battery_capacity, self.house_limit, horizon)
 
-        terminal_target_therm = 0.25 * C_TH
-        model += S_TH[horizon - 1] >= terminal_target_therm, "Terminal_Tank_Reserve"
-        
+        if self.horizon_inputs is not None and self.horizon_inputs["step"] == current_step:
+            # Later negotiation round of the same step: the house state has not moved,
+            # only the community penalties have, and the last round's plan is the warm start
+            inputs = self.horizon_inputs
+            self.model_template.set_penalties(inputs, community_penalty_prices)
+        else:
+            inputs = self.build_horizon_inputs(current_step, horizon)
+            self.horizon_inputs = inputs
+            self.model_template.update(inputs, community_penalty_prices)
+        return inputs
+
+    def package_schedule(self, current_step, community_penalty_prices, inputs, status, sol):
+        # The data package for the controller: the solved plan, or the dumb fallback without one
+        horizon = mpc_horizon
+        mpc_steps = range(horizon)
+        rogue_power = self.rogue_spike(current_step)
 
-        model.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=10))
+        if status == "Optimal":
+            local_solar_gen = inputs["solar"]
+            local_prices = inputs["prices"]
+            dynamic_soc_min = inputs["dynamic_soc_min"]
 
-        if pulp.LpStatus[model.status] == "Optimal"or (pulp.LpStatus[model.status] == "Not Solved" and pulp.value(I[0]) is not None):
-            proposed_import_profile = [pulp.value(I[k]) for k in mpc_steps]
+            proposed_import_profile = sol["I"]
+            proposed_flex_profile = [sum(powers) for powers in zip(*sol["P_flex"].values())] or [0.0] * horizon
 
-            current_import = pulp.value(I[0])
-            current_charge = pulp.value(z[0])
-            current_discharge = pulp.value(y[0])
-            current_export = pulp.value(I_export[0])
-            next_soc = pulp.value(S_E[0])
+            current_import = sol["I"][0]
+            current_charge = sol["z"][0]
+            current_discharge = sol["y"][0]
+            current_export = sol["I_export"][0]
+            next_soc = sol["S_E"][0]
             if next_soc < dynamic_soc_min:
                 vprint(f"House {self.house_id} [Step {current_step}]: MPC intentionally planned to drop SoC to {next_soc:.2f} kWh")
 
@@ -506,10 +457,10 @@ class HouseAgent:
                 interruptible = app.get("interruptible", False)
                 
                 if power_type == "constant" and not interruptible:
-                    if pulp.value(E[name, 0]) >= 0.5:
+                    if sol["E"][name][0] >= 0.5:
                         starting_appliances.append(name)
                 elif power_type == "flexible" and interruptible:
-                    val = pulp.value(P_flex[(name, 0)])
+                    val = sol["P_flex"][name][0]
                     flexible_powers[name] = val if val is not None else 0.0
 
 
@@ -518,29 +469,31 @@ class HouseAgent:
                 "house_id": self.house_id,
                 "status": "Optimal",
                 "proposed_import_profile": proposed_import_profile,
+                "proposed_flex_profile": proposed_flex_profile,
                 "planned_import_k0": current_import,
                 "planned_charge_k0": current_charge,
                 "planned_discharge_k0": current_discharge,
                 "planned_export_k0": current_export,
                 "next_soc_calculation": next_soc,
                 "explainability": reason,
-                "next_soc_th_calculation": pulp.value(S_TH[0]),
+                "next_soc_th_calculation": sol["S_TH"][0],
                 "starting_appliances": starting_appliances,
-                "next_T_fridge": pulp.value(T_fr[0]),
-                "next_T_freezer": pulp.value(T_fz[0]),
-                "fridge_compressor_k0": pulp.value(P_comp_fr[0]),
-                "freezer_compressor_k0": pulp.value(P_comp_fz[0]),
-                "planned_excess_k0": pulp.value(I_excess[0]),
+                "next_T_fridge": sol["T_fr"][0],
+                "next_T_freezer": sol["T_fz"][0],
+                "fridge_compressor_k0": sol["P_comp_fr"][0],
+                "freezer_compressor_k0": sol["P_comp_fz"][0],
+                "planned_excess_k0": sol["I_excess"][0],
                 "rogue_power_k0": rogue_power,
-                "heat_pump_power_k0": pulp.value(P_HP[0]),
+                "heat_pump_power_k0": sol["P_HP"][0],
                 "flexible_powers_k0": flexible_powers,
-                "next_T_in_calculation": pulp.value(T_in[0])
+                "next_T_in_calculation": sol["T_in"][0]
 
 
             }
         else:
             # Fallback Logic
-            print(f"House {self.house_id} SOLVER FAILED - Triggering Dumb Fallback")
+            if status != "Missed_Deadline":
+                print(f"House {self.house_id} SOLVER FAILED - Triggering Dumb Fallback")
             
             starting_appliances = []
             non_optimal_profile = [0.0] *  horizon
@@ -605,8 +558,6 @@ class HouseAgent:
             current_import = max(0.0, current_demand - local_solar_gen[0])
             non_optimal_profile[0] = current_import
 
-            del model
-
 
             return {
                 "house_id": self.house_id,
@@ -638,7 +589,7 @@ class HouseAgent:
         gross_open_demand = self.personal_elec_demand[abs_t]
 
         # Add the unpredicted rogue human loads to the dumb baseline
-        gross_open_demand += self.rogue_spikes_timeline[current_step]
+        gross_open_demand += self.rogue_spike(current_step)
         
         # Instead of sharing the Smart House's thermometer calculate the exact physical energy required to maintain the target temperature.
         # A dumb house's bang-bang thermostat averages out to exactly this continuous load:
@@ -719,6 +670,7 @@ class HouseAgent:
         
     def execute_physical_action(self, accepted_schedule, current_step):
         # Updates the physical state of the house to move forward in time
+        self.horizon_inputs = None      # The next step's inputs must be rebuilt from the new state
        
         # Calculate Unsmart Grid Import (Demand minus whatever the solar is doing right now)
         abs_t = current_step % total_steps
@@ -732,7 +684,7 @@ class HouseAgent:
         self.daily_total_uncontrolled_energy += open_loop_import * delta
 
         self.current_T_in = accepted_schedule.get("next_T_in_calculation", self.current_T_in)
-        self.history_T_in.append(self.current_T_in)
+        self.history_E[("Indoor_Temp", current_step)] = self.current_T_in
         
         #
         # From this point onwards, the code is executing the *actual* smart control actions.
@@ -752,7 +704,7 @@ class HouseAgent:
             flex_apps = accepted_schedule.get("flexible_powers_k0", {}).copy()            
             rogue_spike = accepted_schedule.get("rogue_power_k0", 0.0)
 
-            spike_duration = random.uniform(1.0, 29.0) / 60.0 if rogue_spike > 0 else 0.0
+            spike_duration = self.spike_rng.uniform(1.0, 29.0) / 60.0 if rogue_spike > 0 else 0.0
             normal_duration = delta-spike_duration
 
             emergency_discharge = 0.0
@@ -870,6 +822,7 @@ class HouseAgent:
             started_apps = accepted_schedule.get("starting_appliances", [])
             for app_name in started_apps:
                 self.appliances_already_run[app_name] = True
-                self.history_E[(app_name, current_step)] = 1        
-                
-        
+                self.history_E[(app_name, current_step)] = 1
+
+        # The step's readings for the run metrics (metrics.py)
+        return readings(self, current_step)
@@ -0,0 +1,373 @@
+# house_model.py
+import pulp
+from config import *
+from data import *
+import solvers
+
+
+class HouseModel:
+    # Persistent PuLP MPC model for one house: built once, updated in place before each solve
+
+    def __init__(self, house_id, battery_capacity, house_limit, horizon=48):
+        self.house_id = house_id
+        self.battery_capacity = battery_capacity
+        self.house_limit = house_limit
+        self.horizon = horizon
+        self.signature = ("pulp",)
+        mpc_steps = range(horizon)
+
+        self.model = pulp.LpProblem(f"House_{house_id}", pulp.LpMinimize)
+        model = self.model
+
+        # PuLP variable definition
+        self.S_E = pulp.LpVariable.dicts(f"SoC_H{house_id}", mpc_steps, 0, battery_capacity)
+        self.z = pulp.LpVariable.dicts(f"Charge_Rate_H{house_id}", mpc_steps, lowBound=0, cat='Continuous')
+        self.y = pulp.LpVariable.dicts(f"Discharge_Rate_H{house_id}", mpc_steps, lowBound=0, cat='Continuous')
+        self.I = pulp.LpVariable.dicts(f"Grid_Import_H{house_id}", mpc_steps, lowBound=0, cat='Continuous')
+        self.I_excess = pulp.LpVariable.dicts(f"Excess_Import_H{house_id}", mpc_steps, lowBound=0, cat='Continuous')
+        self.I_export = pulp.LpVariable.dicts(f"Grid_Export_H{house_id}", mpc_steps, lowBound=0)
+        # binary state (1 = Importing, 0 = Exporting)
+        self.Z_grid = pulp.LpVariable.dicts(f"Grid_State_H{house_id}", mpc_steps, cat='Binary')
+
+        self.P_HP = pulp.LpVariable.dicts(f"Heat_Pump_Power_H{house_id}", mpc_steps, lowBound=0, upBound=10.0, cat='Continuous')
+        self.P_HP_Space = pulp.LpVariable.dicts(f"HP_Space_H{house_id}", mpc_steps, lowBound=0, cat='Continuous')
+        self.P_HP_DHW = pulp.LpVariable.dicts(f"P_HP_DHW{house_id}", mpc_steps, lowBound=0, cat='Continuous')
+        self.S_TH = pulp.LpVariable.dicts(f"SoC_Therm_H{house_id}", mpc_steps, 0, C_TH, cat='Continuous')
+        self.T_in = pulp.LpVariable.dicts(f"T_house_H{house_id}", mpc_steps, lowBound=T_min, upBound=T_max, cat='Continuous')
+        self.diff = pulp.LpVariable.dicts(f"T_diff_H{house_id}", mpc_steps, lowBound=0)
+
+        self.T_fr = pulp.LpVariable.dicts(f"T_fridge_H{house_id}", mpc_steps, lowBound=2, upBound=5, cat='Continuous')
+        self.T_fz = pulp.LpVariable.dicts(f"T_freezer_H{house_id}", mpc_steps, lowBound=-22.0, upBound=-15.0, cat='Continuous')
+        self.P_comp_fr = pulp.LpVariable.dicts(f"Fridge_Comp_Power_H{house_id}", mpc_steps, lowBound=0.0, upBound=0.3, cat='Continuous')
+        self.P_comp_fz = pulp.LpVariable.dicts(f"Freezer_Comp_Power_H{house_id}", mpc_steps, lowBound=0.0, upBound=0.3, cat='Continuous')
+        self.P_max_local = pulp.LpVariable(f"Peak_Import_H{house_id}", lowBound=0, cat='Continuous')
+        self.P_max_flex = pulp.LpVariable(f"Peak_Flex_H{house_id}", lowBound=0, cat='Continuous')
+        self.Reserve_deficit = pulp.LpVariable.dicts(f"Reserve_deficit_H{house_id}", mpc_steps, lowBound=0, cat='Continuous')
+
+        # Appliance variables exist for every appliance in the catalogue. Appliances that are
+        # not part of today's routine (or are outside their window) are switched off with bounds.
+        self.constant_apps = [app for app in appliances if app["power_type"] == "constant" and not app.get("interruptible", False)]
+        self.flexible_apps = [app for app in appliances if app["power_type"] == "flexible"]
+
+        self.E = {}         # Constant, Non-Interruptible (Start Times)
+        self.P_flex = {}    # Flexible Power draw
+        self.O_flex = {}    # Binary On/Off State (for minimum power limits)
+        self.E_deficit = {}
+
+        for app in self.constant_apps:
+            name = app["name"]
+            for k in mpc_steps:
+                self.E[(name, k)] = pulp.LpVariable(f"Start_{name}_H{house_id}_k{k}", cat='Binary')
+
+        for app in self.flexible_apps:
+            name = app["name"]
+            self.E_deficit[name] = pulp.LpVariable(f"Deficit_{name}_H{house_id}", lowBound=0, cat="Continuous")
+            for k in mpc_steps:
+                self.P_flex[(name, k)] = pulp.LpVariable(f"Power_{name}_H{house_id}_k{k}", lowBound=0, cat='Continuous')
+                self.O_flex[(name, k)] = pulp.LpVariable(f"State_{name}_H{house_id}_k{k}", cat='Binary')
+
+        S_E, z, y, I, I_excess, I_export, Z_grid = self.S_E, self.z, self.y, self.I, self.I_excess, self.I_export, self.Z_grid
+        P_HP, P_HP_Space, P_HP_DHW, S_TH, T_in, diff = self.P_HP, self.P_HP_Space, self.P_HP_DHW, self.S_TH, self.T_in, self.diff
+        T_fr, T_fz, P_comp_fr, P_comp_fz = self.T_fr, self.T_fz, self.P_comp_fr, self.P_comp_fz
+
+        # Constraints whose right-hand side changes between solves are kept by name so they can be
+        # rewritten in place. The variable terms are always on the left with a zero constant.
+        self.rows = {}
+
+        def add(name, constraint):
+            model.addConstraint(constraint, name)
+            self.rows[name] = constraint
+
+        M = self.big_M = 20.0  # Safe physical wire limit in kW
+
+        self.grid_state_rows = []
+        for k in mpc_steps:
+            add(f"Discharge_Rate_Limit{k}", y[k] <= D_E)
+            add(f"Charge_Limit{k}", z[k] <= G_E)
+            add(f"Grid_limit_{k}", I[k] - I_excess[k] <= house_limit)
+
+            add(f"Max_Import_State_{k}", I[k] - M * Z_grid[k] <= 0)
+            add(f"Max_Export_State_{k}", I_export[k] + M * Z_grid[k] <= M)
+            self.grid_state_rows += [f"Max_Import_State_{k}", f"Max_Export_State_{k}"]
+
+            # The battery inverter must always maintain enough headroom to absorb a rogue spike
+            add(f"Spike_Headroom_{k}", z[k] - y[k] >= 0)
+            add(f"Track_Peak_{k}", I[k] - self.P_max_local <= 0)
+
+            # Sum flexible appliances AND the Heat Pump to squash them together
+            flex_sum = pulp.lpSum(self.P_flex[(app["name"], k)] for app in self.flexible_apps)
+            add(f"Track_Flex_Peak_{k}", flex_sum + P_HP[k] - self.P_max_flex <= 0)
+
+            add(f"Soft_Safety_Reserve_k{k}", S_E[k] + self.Reserve_deficit[k] >= 0)
+
+            # Storage Dynamics
+            if k == 0:
+                add("SoC_Init", S_E[0] - (nu_E * delta * z[0]) + (delta * y[0] / nu_E) == 0)
+            else:
+                add(f"SoC_Dynamics_{k}", S_E[k] - S_E[k-1] - (nu_E * delta * z[k]) + (delta * y[k] / nu_E) == 0)
+
+        # Constant appliances: exactly one start inside the window (or none if it has already run)
+        for app in self.constant_apps:
+            name = app["name"]
+            add(f"Sched_{name}", pulp.lpSum(self.E[(name, k)] for k in mpc_steps) == 0)
+
+        # Flexible appliances: semi-continuous power and the session energy requirement
+        for app in self.flexible_apps:
+            name = app["name"]
+            for k in mpc_steps:
+                add(f"Min_{name}_{k}", self.P_flex[(name, k)] - app["Min_Power"] * self.O_flex[(name, k)] >= 0)
+                add(f"Max_{name}_{k}", self.P_flex[(name, k)] - app["Max_Power"] * self.O_flex[(name, k)] <= 0)
+
+            session_energy = pulp.lpSum(self.P_flex[(name, k)] * delta for k in mpc_steps)
+            add(f"Energy_Req_Min_{name}", session_energy + self.E_deficit[name] >= 0)
+            add(f"Energy_Req_Max_{name}", session_energy <= 0)
+
+        fr_gain = ((0.1467 + 0.1196) / 0.3) * delta
+        fz_gain = (((7/25) + (15/67)) / 0.3) * delta
+        hp_gain = (delta / C_in) * COP
+        loss = (delta / C_in) * UA
+
+        for k in mpc_steps:
+            flexible_load = pulp.lpSum(
+                self.E[(app["name"], ks)] * app["Power"]
+                for app in self.constant_apps
+                for ks in range(max(0, k - int(app["Slots"]) + 1), k + 1)
+            ) + pulp.lpSum(self.P_flex[(app["name"], k)] for app in self.flexible_apps)
+
+            # demand + locked-in appliance power - solar generation is moved to the right-hand side
+            add(f"Power_balance_{k}", flexible_load + P_HP[k] + z[k] + (0.3 * P_comp_fr[k]) + (0.3 * P_comp_fz[k]) + I_export[k] - I[k] - y[k] == 0)
+            add(f"HP_Split_{k}", P_HP_Space[k] + P_HP_DHW[k] - P_HP[k] == 0)
+
+            if k == 0:
+                add("T_fridge_Init", T_fr[0] + fr_gain * P_comp_fr[0] == 0)
+                add("T_freezer_Init", T_fz[0] + fz_gain * P_comp_fz[0] == 0)
+                add("T_in_Init", T_in[0] - hp_gain * P_HP_Space[0] == 0)
+                add("S_TH_Init", S_TH[0] - COP * delta * P_HP_DHW[0] == 0)
+            else:
+                add(f"T_fridge_{k}", T_fr[k] - T_fr[k-1] + fr_gain * P_comp_fr[k] == 0.1196 * delta)
+                add(f"T_freezer_{k}", T_fz[k] - T_fz[k-1] + fz_gain * P_comp_fz[k] == (15/67) * delta)
+                add(f"T_in_{k}", T_in[k] - (1 - loss) * T_in[k-1] - hp_gain * P_HP_Space[k] == 0)
+                add(f"S_TH_{k}", S_TH[k] - S_TH[k-1] - COP * delta * P_HP_DHW[k] == 0)
+
+            # Comfort Deviation Constraints
+            add(f"Comfort_Upper_{k}", diff[k] - T_in[k] >= -T_target)
+            add(f"Comfort_Lower_{k}", diff[k] + T_in[k] >= T_target)
+
+        # Terminal Region
+        add("Terminal_Region_Lower_Bound", S_E[horizon - 1] >= 0)
+        add("Terminal_Thermal_Region", T_in[horizon - 1] >= T_min)
+        add("Terminal_Tank_Reserve", S_TH[horizon - 1] >= 0.25 * C_TH)
+
+        # Objective Function: the price dependent coefficients are overwritten by update()
+        terminal_value_rate = 0.08
+        model += pulp.lpSum([
+            delta * I[k] + (-delta) * I_export[k] +
+            (1000 * I_excess[k]) +      # penalty for going over 1kW battery will no save itself for the 35p peak
+            (200 * self.Reserve_deficit[k]) +
+            (5.0 * diff[k]) +
+            delta * wear_cost_elec * y[k] +
+            delta * wear_cost_therm * P_HP[k]
+            for k in mpc_steps
+        ]) + pulp.lpSum(5000 * self.E_deficit[app["name"]] for app in self.flexible_apps) \
+           - (terminal_value_rate * S_E[horizon - 1]) + (0.1 * self.P_max_local) + (10 * self.P_max_flex)
+
+        # Zero-cost objective terms keep the Z_grid columns in the written model while their rows are left out
+        for k in mpc_steps:
+            model.objective[Z_grid[k]] = 0.0
+
+        self.variables = self.model.variables()
+        self.compiled = {}          # matrix form for the in-process HiGHS backend, per grid binary setting
+        self.grid_binary = True     # False while the Z_grid binaries and their big-M rows are left out
+        self.last_solve = None
+
+        # Time-indexed variable families, used to shift the previous plan into a warm start
+        self.trajectories = [S_E, z, y, I, I_excess, I_export, Z_grid, P_HP, P_HP_Space, P_HP_DHW, S_TH, T_in, diff,
+                             T_fr, T_fz, P_comp_fr, P_comp_fz, self.Reserve_deficit]
+        for app in self.flexible_apps:
+            self.trajectories.append({k: self.P_flex[(app["name"], k)] for k in mpc_steps})
+            self.trajectories.append({k: self.O_flex[(app["name"], k)] for k in mpc_steps})
+        # Start binaries are not repeated past the end of the previous plan (that would be a second start)
+        self.start_families = [{k: self.E[(app["name"], k)] for k in mpc_steps} for app in self.constant_apps]
+
+        self.step = None
+        self.bounds_changed = True  # right-hand sides or bounds changed since HiGHS last saw the model
+        self.last_plan = None       # {variable: value} of the last successful solve
+        self.plan_step = None
+        self.cancel_step = None     # a solve at this step is to stop as soon as HiGHS lets it
+        self.integer_variables = [var for var in self.variables if var.cat == pulp.LpInteger]
+        self.stats = {"solves": 0, "warm_starts": 0, "nodes": 0, "wall_time": 0.0, "grid_binary_dropped": 0,
+                      "lp_solves": 0}
+
+    def set_rhs(self, name, value):
+        # PuLP keeps the right-hand side as a negated constant on the left
+        self.rows[name].constant = -value
+
+    def update(self, inputs, community_penalty_prices):
+        # Rewrite everything that depends on the house state and the look-ahead window
+        H = self.horizon
+        mpc_steps = range(H)
+        self.step = inputs["step"]
+        self.bounds_changed = True
+
+        for k in mpc_steps:
+            self.set_rhs(f"Grid_limit_{k}", self.house_limit)
+            self.set_rhs(f"Spike_Headroom_{k}", inputs["safety_margin"] - D_E)
+            self.set_rhs(f"Soft_Safety_Reserve_k{k}", inputs["dynamic_soc_min"])
+            self.set_rhs(f"Power_balance_{k}", inputs["solar"][k] - inputs["elec_demand"][k] - inputs["locked_in_power"][k])
+            if k > 0:
+                self.set_rhs(f"T_in_{k}", (delta / C_in) * UA * inputs["T_out"][k])
+
+        self.set_rhs("SoC_Init", inputs["soc"])
+        self.set_rhs("T_fridge_Init", inputs["T_fridge"] + (0.1196 * delta))
+        self.set_rhs("T_freezer_Init", inputs["T_freezer"] + ((15/67) * delta))
+        self.set_rhs("T_in_Init", inputs["T_in"] - (delta / C_in) * UA * (inputs["T_in"] - inputs["T_out"][0]))
+        self.set_rhs("S_TH_Init", inputs["soc_th"])
+        self.set_rhs("Terminal_Region_Lower_Bound", inputs["dynamic_soc_min"])
+
+        for app in self.constant_apps:
+            name = app["name"]
+            valid_k_starts = inputs["start_windows"].get(name, [])
+            valid = set(valid_k_starts)
+            for k in mpc_steps:
+                self.E[(name, k)].upBound = 1 if k in valid else 0
+            self.set_rhs(f"Sched_{name}", 1 if valid_k_starts else 0)
+
+        for app in self.flexible_apps:
+            name = app["name"]
+            session_k, req_energy = inputs["flex_sessions"].get(name, ([], 0.0))
+            session = set(session_k)
+            for k in mpc_steps:
+                # Strictly off outside the session window, and once the car is full
+                on = k in session and req_energy > 0
+                self.O_flex[(name, k)].upBound = 1 if on else 0
+                self.P_flex[(name, k)].upBound = None if on else 0
+            self.set_rhs(f"Energy_Req_Min_{name}", req_energy)
+            self.set_rhs(f"Energy_Req_Max_{name}", req_energy)
+
+        self.set_penalties(inputs, community_penalty_prices)
+
+    def set_penalties(self, inputs, community_penalty_prices):
+        # Between negotiation rounds this is the only thing that changes
+        objective = self.model.objective
+        for k in range(self.horizon):
+            objective[self.I[k]] = delta * (inputs["prices"][k] + community_penalty_prices[k])
+            objective[self.I_export[k]] = -delta * inputs["export_prices"][k]
+
+        # Importing and exporting in the same slot loses (import + penalty - export) on every kWh,
+        # so when that margin is positive everywhere the LP already keeps them apart
+        needed = not drop_grid_binary or any(
+            inputs["export_prices"][k] >= inputs["prices"][k] + community_penalty_prices[k] for k in range(self.horizon)
+        )
+        self.set_grid_binary(needed)
+
+    def set_grid_binary(self, needed):
+        if needed == self.grid_binary:
+            return
+        for name in self.grid_state_rows:
+            if needed:
+                self.model.addConstraint(self.rows[name], name)
+            else:
+                del self.model.constraints[name]
+        for k in range(self.horizon):
+            self.Z_grid[k].upBound = 1 if needed else 0
+            # Without the big-M rows the wire limit they imposed becomes a plain bound
+            self.I[k].upBound = None if needed else self.big_M
+            self.I_export[k].upBound = None if needed else self.big_M
+        self.grid_binary = needed
+        self.bounds_changed = True
+
+    def shifted_plan(self):
+        # Receding horizon: the plan made `shift` steps ago, moved forward and clipped to today's bounds
+        if self.last_plan is None or self.plan_step is None:
+            return None
+        shift = self.step - self.plan_step
+        if not 0 <= shift < self.horizon:
+            return None
+
+        H = self.horizon
+        plan = self.last_plan
+        start = {}
+        for family in self.trajectories:
+            for k in range(H):
+                start[family[k]] = plan[family[min(k + shift, H - 1)]]
+        for family in self.start_families:
+            for k in range(H):
+                start[family[k]] = plan[family[k + shift]] if k + shift < H else 0.0
+        for var in (self.P_max_local, self.P_max_flex, *self.E_deficit.values()):
+            start[var] = plan[var]
+        # Variables that were left out of the last solve have no value to start from
+        start = {var: value for var, value in start.items() if value is not None}
+
+        for var, value in start.items():
+            if var.lowBound is not None and value < var.lowBound:
+                start[var] = var.lowBound
+            elif var.upBound is not None and value > var.upBound:
+                start[var] = var.upBound
+        return start
+
+    def cancel(self, step):
+        # Stop the solve for this step, from another thread (HiGHS only, CBC runs to its time limit)
+        self.cancel_step = step
+
+    def cancelled(self):
+        return self.cancel_step is not None and self.cancel_step == self.step
+
+    def discrete(self):
+        # True while some integer variable can still take more than one value
+        return any(var.upBound is None or var.upBound > (var.lowBound or 0) for var in self.integer_variables)
+
+    def solve(self, backend=None):
+        # Once the day's appliances have run, the EV is full and the grid binary is dropped,
+        # every binary is fixed and the model is solved as the LP it really is
+        relax = lp_fast_path and not self.discrete()
+        start = self.shifted_plan() if warm_start and not relax else None
+
+        # Clear the previous solution so a failed solve cannot be mistaken for a fresh one
+        for var in self.variables:
+            var.varValue = None
+
+        backend = solvers.resolve_backend(backend)
+        compiled = self.compiled.get(self.grid_binary)
+        if backend == "highs" and compiled is None:
+            compiled = self.compiled[self.grid_binary] = solvers.CompiledModel(self.model)
+        self.last_solve = solvers.solve(self.model, backend, time_limit=solver_time_limit, compiled=compiled,
+                                        warm_start=start, costs_only=not self.bounds_changed, relax=relax,
+                                        stop=self.cancelled)
+        if backend == "highs":
+            self.bounds_changed = False
+
+        self.stats["solves"] += 1
+        self.stats["warm_starts"] += 1 if start else 0
+        self.stats["grid_binary_dropped"] += 0 if self.grid_binary else 1
+        self.stats["lp_solves"] += 1 if relax else 0
+        self.stats["nodes"] += self.last_solve["nodes"] or 0
+        self.stats["wall_time"] += self.last_solve["wall_time"]
+
+        status = self.last_solve["status"]
+        if status == "Optimal" or (status == "Not Solved" and self.I[0].varValue is not None):
+            self.last_plan = {var: var.varValue for var in self.variables}
+            self.plan_step = self.step
+            return "Optimal"
+        return status
+
+    def solution(self):
+        # Plain lists of the solved trajectories, in the shape the house agent packages up
+        steps = range(self.horizon)
+        return {
+            "I": [self.I[k].varValue for k in steps],
+            "z": [self.z[k].varValue for k in steps],
+            "y": [self.y[k].varValue for k in steps],
+            "I_export": [self.I_export[k].varValue for k in steps],
+            "I_excess": [self.I_excess[k].varValue for k in steps],
+            "S_E": [self.S_E[k].varValue for k in steps],
+            "S_TH": [self.S_TH[k].varValue for k in steps],
+            "T_in": [self.T_in[k].varValue for k in steps],
+            "T_fr": [self.T_fr[k].varValue for k in steps],
+            "T_fz": [self.T_fz[k].varValue for k in steps],
+            "P_comp_fr": [self.P_comp_fr[k].varValue for k in steps],
+            "P_comp_fz": [self.P_comp_fz[k].varValue for k in steps],
+            "P_HP": [self.P_HP[k].varValue for k in steps],
+            "E": {app["name"]: [self.E[(app["name"], k)].varValue for k in steps] for app in self.constant_apps},
+            "P_flex": {app["name"]: [self.P_flex[(app["name"], k)].varValue for k in steps] for app in self.flexible_apps},
+            "objective": pulp.value(self.model.objective),
+        }
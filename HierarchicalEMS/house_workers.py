@@ -0,0 +1,147 @@
+# house_workers.py
+# House agents that live in long-running worker processes (house_workers in config.py): each
+# round sends a worker the penalties of its houses and gets back their proposal packages.
+# Attribute reads on a RemoteHouse fetch a copy from the worker and must not modify the agent.
+import os
+import threading
+import multiprocessing
+from config import *
+from surrogate import shared_policy
+
+
+def serve(connection, houses):
+    # Worker loop: answer commands for the houses this worker owns until told to stop
+    houses = {house.house_id: house for house in houses}
+    while True:
+        command, payload = connection.recv()
+        if command == "stop":
+            break
+        try:
+            if command == "propose":
+                step, offers = payload
+                result = {house_id: houses[house_id].generate_proposed_schedule(step, penalties)
+                          for house_id, penalties in offers.items()}
+            elif command == "call":
+                house_id, method, args = payload
+                result = getattr(houses[house_id], method)(*args)
+            elif command == "get":
+                house_id, name = payload
+                result = getattr(houses[house_id], name)
+            elif command == "collect":
+                result = list(houses.values())
+            elif command == "surrogate_stats":
+                result = dict(shared_policy.stats)
+            else:
+                raise ValueError(f"Unknown worker command '{command}'")
+            connection.send((True, result))
+        except Exception as error:
+            connection.send((False, error))
+    connection.close()
+
+
+class RemoteHouse:
+    # Stand-in for a HouseAgent that lives in a worker process
+
+    def __init__(self, pool, house_id):
+        self.pool = pool
+        self.house_id = house_id
+
+    def generate_proposed_schedule(self, current_step, community_penalty_prices):
+        return self.pool.propose(current_step, {self.house_id: community_penalty_prices})[self.house_id]
+
+    def execute_physical_action(self, accepted_schedule, current_step):
+        return self.pool.call(self.house_id, "execute_physical_action", accepted_schedule, current_step)
+
+    def fallback_schedule(self, current_step):
+        return self.pool.call(self.house_id, "fallback_schedule", current_step)
+
+    def cancel_solve(self, current_step):
+        pass        # the worker's pipe is busy with the solve, which runs to its time limit
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)      # keep copy/pickle protocol lookups local
+        return self.pool.get(self.house_id, name)
+
+
+class HousePool:
+    def __init__(self, houses, processes=None):
+        processes = min(processes or house_workers or os.cpu_count(), len(houses))
+        self.owner = {}
+        self.connections = []
+        self.locks = []         # one request at a time per worker pipe (streaming negotiation calls from threads)
+        self.processes = []
+        for worker in range(processes):
+            group = houses[worker::processes]
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=serve, args=(child, group), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.locks.append(threading.Lock())
+            self.processes.append(process)
+            for house in group:
+                self.owner[house.house_id] = worker
+        self.houses = [RemoteHouse(self, house.house_id) for house in houses]
+
+    def request(self, messages):
+        # Send every worker its message first, then gather, so the workers run side by side
+        workers = sorted(messages)
+        for worker in workers:
+            self.locks[worker].acquire()
+        try:
+            for worker in workers:
+                self.connections[worker].send(messages[worker])
+            replies = {}
+            for worker in workers:
+                ok, value = self.connections[worker].recv()
+                if not ok:
+                    raise value
+                replies[worker] = value
+        finally:
+            for worker in workers:
+                self.locks[worker].release()
+        return replies
+
+    def propose(self, current_step, offers):
+        # offers: {house_id: penalty vector}. Returns {house_id: proposal package}.
+        batches = {}
+        for house_id, penalties in offers.items():
+            batches.setdefault(self.owner[house_id], {})[house_id] = penalties
+        replies = self.request({worker: ("propose", (current_step, batch)) for worker, batch in batches.items()})
+        proposals = {}
+        for reply in replies.values():
+            proposals.update(reply)
+        return proposals
+
+    def call(self, house_id, method, *args):
+        worker = self.owner[house_id]
+        return self.request({worker: ("call", (house_id, method, args))})[worker]
+
+    def get(self, house_id, name):
+        worker = self.owner[house_id]
+        return self.request({worker: ("get", (house_id, name))})[worker]
+
+    def collect(self):
+        # Copies of every agent in the original order (their solver models are rebuilt on demand)
+        replies = self.request({worker: ("collect", None) for worker in range(len(self.connections))})
+        agents = {house.house_id: house for reply in replies.values() for house in reply}
+        return [agents[proxy.house_id] for proxy in self.houses]
+
+    def surrogate_stats(self):
+        # The surrogate's counters summed over the workers (each has its own shared_policy)
+        replies = self.request({worker: ("surrogate_stats", None) for worker in range(len(self.connections))})
+        return {name: sum(reply[name] for reply in replies.values()) for name in shared_policy.stats}
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(("stop", None))
+            connection.close()
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
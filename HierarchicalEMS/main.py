@@ -4,17 +4,25 @@ import time
 from config import *
 from house_agent import HouseAgent
 from community_controller import CommunityController
+from central_solver import CentralController
+from house_workers import HousePool
+from history import stack
+from metrics import Metrics
+from result_store import ResultStore
+from surrogate import shared_policy
+import checkpoint
 from visualisation import *
 from data import *  
+import os
 import json
 import random
-import pickle
+import numpy as np
 
 PLAYBACK_MODE = True
 PLAYBACK_ALPHA = 0.15
 PLAYBACK_SIGMA = 0.75
 PLAYBACK_SEED = 0
-CACHE_FILE = 'simulation_cache_extended.pkl'
+CACHE_DIR = 'simulation_cache_extended'     # ResultStore written by pareto_parallel.py
 
 
 
@@ -22,19 +30,18 @@ def run_simulation():
     # locks the random shifting to a specific repeatable timeline
     if PLAYBACK_MODE:
         print(f"Loading data for Alpha={PLAYBACK_ALPHA}, Sigma={PLAYBACK_SIGMA}, Seed={PLAYBACK_SEED} from cache")
-        try:
-            with open(CACHE_FILE, 'rb') as f:
-                all_cache = pickle.load(f)
-        except:
+        if not os.path.isdir(CACHE_DIR):
             print("Error: File not found")
             return
+        store = ResultStore(CACHE_DIR)
         
+        # Only this run's file is opened, and each series is read from it as it is plotted
         cache_key = (PLAYBACK_ALPHA, PLAYBACK_SIGMA, PLAYBACK_SEED)
-        if cache_key not in all_cache:
+        try:
+            data = store.open(cache_key)
+        except KeyError:
             print(f"Error: Combination {cache_key} not found in cache data")
             return
-    
-        data = all_cache[cache_key]
         # Extract costs safely (using .get() with fallback keys from your pareto script just in case)
         uncontrolled_cost = data.get('total_uncontrolled_cost', data.get('Open_Cost', 0.0))
         controlled_cost = data.get('total_controlled_cost', data.get('Smart_Cost', 0.0))
@@ -90,7 +97,10 @@ def run_simulation():
 
     print("Initialising Microgrid Community")
     houses = [HouseAgent(i, PV_capacity, C_E, I_max / num_homes) for i in range(num_homes)]    
-    community = CommunityController(transformer_limit=I_max)
+    if community_solver == "central":
+        community = CentralController(transformer_limit=I_max)
+    else:
+        community = CommunityController(transformer_limit=I_max)
 
     history_community_demand = []
     history_h0_soc = []
@@ -103,11 +113,26 @@ def run_simulation():
     h0_discharge = []
     h0_charge = []
     h0_solar = []
+    metrics = Metrics(houses, I_max, tolerance=0.01)     # KPIs as the steps run, see metrics.py
+
+    # Carry on from the last checkpoint of a run that was stopped
+    checkpoint_path = checkpoint.path_for("main")
+    first_step = 0
+    saved = checkpoint.load(checkpoint_path)
+    if saved is not None:
+        first_step, houses, community, metrics = saved["step"], saved["houses"], saved["community"], saved["metrics"]
+        (history_community_demand, history_h0_soc, history_h0_soc_th, history_h0_fridge_temp, history_h0_freezer_temp,
+         history_actual_community_demand, h0_import, h0_discharge, h0_charge, h0_solar) = saved["series"]
+
+    # Optionally move every agent into a worker process for the run
+    pool = HousePool(houses) if house_workers else None
+    if pool is not None:
+        houses = pool.houses
 
     print(f"Starting simulation for {num_homes} homes over {simulation_steps} steps")
     start_time = time.time()
     
-    for step in range(simulation_steps):
+    for step in range(first_step, simulation_steps):
         vprint(f"Time Step {step}")
 
         approved_schedules, peak_demand = community.negotiate_schedules(houses, step)
@@ -119,105 +144,72 @@ def run_simulation():
         for sched in approved_schedules:
             sched["community_slack_k0"] = global_slack
         
+        readings = []
         for house in houses:
             house_schedule = next((item for item in approved_schedules if item["house_id"] == house.house_id), None)
             if house_schedule is not None:
-                house.execute_physical_action(house_schedule, step)
+                readings.append(house.execute_physical_action(house_schedule, step))
+        metrics.update(step, readings)
 
         step_true_community_import = 0.0
         step_open_community_demand = 0.0
         
-        for house in houses:
-            net_import = house.history_E.get(("Grid_Import", step), 0.0)
-            solar_export = house.history_E.get(("Grid_Export", step), 0.0)
-            step_true_community_import += (net_import - solar_export)
-
-            # pv_gen = house.history_E.get(("PV_Generation", step), 0.0)
-            # open_import, open_export = house.calculate_open_loop_demand(step, pv_gen)
-            # house.history_E[("Open_Loop_Import", step)] = open_import
-            # house.history_E[("Open_Loop_Export", step)] = open_export
-            open_import = house.history_E.get(("Open_Loop_Import", step), 0.0)
-            open_export = house.history_E.get(("Open_Loop_Export", step), 0.0)
-            step_open_community_demand += open_import
+        for reading in readings:
+            step_true_community_import += (reading["Grid_Import"] - reading["Grid_Export"])
+            step_open_community_demand += (reading["Open_Loop_Import"] - reading["Open_Loop_Export"])
 
+        # Both net of export, the same demand the metrics report peaks, PAR and breaches on
         step_true_community_import = max(0.0, step_true_community_import)
+        step_open_community_demand = max(0.0, step_open_community_demand)
         history_community_demand.append(step_true_community_import)
         history_actual_community_demand.append(step_open_community_demand)
 
-        # Log House 0 specific data for the detailed slides
-        history_h0_soc.append(houses[0].current_soc)
-        history_h0_soc_th.append(houses[0].current_soc_th)
-        history_h0_fridge_temp.append(houses[0].current_T_fridge)
-        history_h0_freezer_temp.append(houses[0].current_T_freezer)
+        # Log House 0 specific data for the detailed slides (from its readings, which also come
+        # back from a worker process without copying the agent)
+        h0 = next(reading for reading in readings if reading["house_id"] == 0)
+        history_h0_soc.append(h0["soc"])
+        history_h0_soc_th.append(h0["soc_th"])
+        history_h0_fridge_temp.append(h0["T_fridge"])
+        history_h0_freezer_temp.append(h0["T_freezer"])
         
         h0_solar.append(PV_capacity * efficiency* solar_profile[step % total_steps])
         
         h0_sched = next((item for item in approved_schedules if item["house_id"] == 0))
-        h0_import.append(houses[0].history_E.get(("Grid_Import", step), 0.0))
-        h0_discharge.append(houses[0].history_E.get(("Battery_Discharge", step), 0.0))
+        h0_import.append(h0["Grid_Import"])
+        h0_discharge.append(h0["Battery_Discharge"])
         h0_charge.append(h0_sched["planned_charge_k0"])
         
         if houses[0].house_id == 0:
             apps = h0_sched.get("starting_appliances", [])
             app_text = f"  | Starting Appliances: {apps}" if apps else ""
-            vprint(f"    House 0 Status: {h0_sched['explainability']} (Battery: {houses[0].current_soc:.2f} kWh){app_text}")
+            vprint(f"    House 0 Status: {h0_sched['explainability']} (Battery: {h0['soc']:.2f} kWh){app_text}")
+
+        if checkpoint.due(step):
+            checkpoint.save(checkpoint_path, step + 1, houses, community, pool, metrics=metrics,
+                            series=(history_community_demand, history_h0_soc, history_h0_soc_th, history_h0_fridge_temp,
+                                    history_h0_freezer_temp, history_actual_community_demand, h0_import, h0_discharge,
+                                    h0_charge, h0_solar))
 
         vprint("-" * 25)
 
     end_time = time.time()
+    checkpoint.remove(checkpoint_path)
+
+    if pool is not None:
+        houses = pool.collect()
+        shared_policy.stats = pool.surrogate_stats()
+        pool.close()
 
     print("\n" + "="*40)
     print("  TOTAL SIMULATION HOUSE ENERGY SUMMARY")
     print("="*40)
 
-    community_total_sla_score = 0.0
-    sim_steps_run = len(houses[0].history_T_in)
-    
     for house in houses:
-        # Find the absolute highest peak from the open loop vs closed loop
-        total_tasks = 0.0
-        fulfilled_tasks = 0.0
-        
-        ev_appliance = next((app for app in house.personal_appliances if app["name"] == "Electric car"), None)
-        if ev_appliance is not None:
-            ev_req = ev_appliance.get("Required_Energy", 0.0)
-            if ev_req > 0:
-                # Sum the exact kW pulled at every step * 0.5 hours (delta)
-                ev_delivered = house.flexible_energy_delivered.get("Electric car", 0.0)                
-                total_tasks += 1.0
-                fulfilled_tasks += min(1.0, ev_delivered / ev_req)
-
-        # Standard appliances - binary score
-        for app in house.personal_appliances:
-            if app.get("power_type") == "flexible": 
-                continue # Already handled EV
-            total_tasks += 1.0
-            if any(house.history_E.get((app["name"], s), 0) > 0 for s in range(sim_steps_run)):
-                    fulfilled_tasks += 1.0
-        
-        # Instead of a strict 18.0 threshold, calculate the average temperature.        thermal_steps_ok = sum(1 for t in house.history_T_in if t >= 18.0)
-        avg_temp = sum(house.history_T_in) / sim_steps_run if sim_steps_run > 0 else 0
-            
-        total_tasks += 1.0
-        if avg_temp >= 18.0:
-            fulfilled_tasks += 1.0
-        elif avg_temp >= 16.0:
-            # Partial credit: 16.0C to 17.9C gives a sliding scale from 50% to 95%
-            fulfilled_tasks += 0.5 + (0.5 * ((avg_temp - 16.0) / 2.0))
-        else:
-            fulfilled_tasks += 0.0
-        
-        # Calculate final percentage for this house
-        house_sla_pct = (fulfilled_tasks / total_tasks) * 100 if total_tasks > 0 else 100.0
-        community_total_sla_score += house_sla_pct
-
-        max_raw_peak = 0.0
-        peak_raw_step = 0
-        for s in range(simulation_steps):
-            val = house.history_E.get(("Open_Loop_Import", s), 0.0)
-            if val > max_raw_peak:
-                max_raw_peak = val
-                peak_raw_step = s
+        house_sla_pct = metrics.house_sla(house)
+
+        open_loop_import = house.history_E.series("Open_Loop_Import", simulation_steps)
+        peak_raw_step = int(np.argmax(open_loop_import))
+        max_raw_peak = float(open_loop_import[peak_raw_step])
         
         peak_time_hours = peak_raw_step * delta
         
@@ -234,7 +226,7 @@ def run_simulation():
                 
         device_str = ", ".join(causing_devices) if causing_devices else "Base Load / Standard Appliances"
 
-        max_controlled_peak = max([house.history_E.get(("Grid_Import", s), 0) for s in range(simulation_steps)])
+        max_controlled_peak = float(house.history_E.series("Grid_Import", simulation_steps).max())
         
         vprint(f"House {house.house_id}:")
         vprint(f"  Unsmart House (Open Loop):")
@@ -254,41 +246,26 @@ def run_simulation():
             vprint(f"    - EV Charge Delivered: (Car not used today)")
         vprint(f"    - Comprehensive Service Level (SLA): {house_sla_pct:.1f}%\n")
 
-    uncontrolled_community_peak = max(history_actual_community_demand)
-    controlled_community_peak = max(history_community_demand)
+    kpis = metrics.result()
+    uncontrolled_community_peak = kpis['Open_Peak']
+    controlled_community_peak = kpis['Smart_Peak']
     print("Simulation Complete")
     print(f"Time taken: {end_time - start_time:.2f} seconds")
+    if surrogate_model is not None:
+        print(f"Surrogate policy: {shared_policy.report()}")
 
     print(f"Maximum Community Peak Demand hit: {controlled_community_peak:.2f} kW")
     print(f"Uncontrolled Peak:  {uncontrolled_community_peak:.2f} kW")
     print(f"Power Draw Limit: {I_max} kW")
- 
-    avg_uncontrolled_demand = sum(history_actual_community_demand) / simulation_steps
-    avg_controlled_demand = sum(history_community_demand) / simulation_steps
-    
-    uncontrolled_par = uncontrolled_community_peak / avg_uncontrolled_demand if avg_uncontrolled_demand > 0 else 0
-    controlled_par = controlled_community_peak / avg_controlled_demand if avg_controlled_demand > 0 else 0
-    
-    uncontrolled_breaches = sum(1 for d in history_actual_community_demand if d > I_max + 0.01)
-    controlled_breaches = sum(1 for d in history_community_demand if d > I_max + 0.01)
-
-    total_uncontrolled_cost = 0.0
-    total_controlled_cost = 0.0
-    total_controlled_export_kwh = 0.0
 
-    for step in range(simulation_steps):
-        price_in = price_grid_elec[step % total_steps]
-        price_out = price_grid_export[step % total_steps]
-        
-        step_open_import = sum(h.history_E.get(("Open_Loop_Import", step), 0.0) for h in houses)
-        step_open_export = sum(h.history_E.get(("Open_Loop_Export", step), 0.0) for h in houses)
+    uncontrolled_par = kpis['Open_PAR']
+    controlled_par = kpis['Smart_PAR']
+    uncontrolled_breaches = kpis['Open_Breach_Count']
+    controlled_breaches = kpis['Smart_Breach_Count']
 
-        step_smart_import = sum(h.history_E.get(("Grid_Import", step), 0.0) for h in houses)
-        step_smart_export = sum(h.history_E.get(("Grid_Export", step), 0.0) for h in houses)
-        
-        total_uncontrolled_cost += (step_open_import * price_in * delta) - (step_open_export * price_out * delta)
-        total_controlled_cost += (step_smart_import * price_in * delta) - (step_smart_export * price_out * delta)
-        total_controlled_export_kwh += step_smart_export * delta
+    total_uncontrolled_cost = kpis['Open_Cost']
+    total_controlled_cost = kpis['Smart_Cost']
+    total_controlled_export_kwh = kpis['Smart_Export']
 
     fridge_violations = sum(1 for t in history_h0_fridge_temp if t > 5.5)
 
@@ -309,7 +286,7 @@ def run_simulation():
     print("-" * 65)
     print("User Comfort")
     print(f"  H0 Fridge Violations (>5.5°C)     | {'0':<11} | {fridge_violations:<11}")
-    avg_community_sla = community_total_sla_score / num_homes
+    avg_community_sla = metrics.sla(houses)
     print(f"  Community Appliance SLA (%)       | {'100.0%':<11} | {avg_community_sla:.1f}%")
 
     total_uncontrolled_kwh = sum(house.daily_total_uncontrolled_energy for house in houses)
@@ -319,7 +296,7 @@ def run_simulation():
     print(f"Smart Grid (Controlled)  : {total_controlled_kwh:.2f} kWh")
 
 
-    if max(history_community_demand) <= I_max + 0.1:
+    if controlled_community_peak <= I_max + 0.1:
         print("Success: the limit was protected")
     else:
         print("WARNING: the community breached the limit.")
@@ -334,65 +311,34 @@ def run_simulation():
     appliance_data["Fridge"] = {'counts': [0] * simulation_steps, 'power': [0.0] * simulation_steps}
     appliance_data["Freezer"] = {'counts': [0] * simulation_steps, 'power': [0.0] * simulation_steps}
    
-    for t in range(simulation_steps):
-        for app in appliances:
-            name = app["name"]
-            power_type = app.get("power_type", "constant")       
+    h0_history = houses[0].history_E
 
-            rogue_power_total = 0.0
-            for house in [houses[0]]:
-                rogue_power_total += house.history_E.get(("Rogue_Load", t), 0.0)
+    def channel_data(power, counts=None):
+        counts = power > 0 if counts is None else counts
+        return {'counts': counts.astype(int).tolist(), 'power': power.tolist()}
 
-            # Ensure the dictionary key exists before assigning
-            if "Unpredicted_Human_Load" not in appliance_data:
-                appliance_data["Unpredicted_Human_Load"] = {'counts': [0] * simulation_steps, 'power': [0.0] * simulation_steps}
-                
-            appliance_data["Unpredicted_Human_Load"]['counts'][t] = 1 if rogue_power_total > 0 else 0
-            appliance_data["Unpredicted_Human_Load"]['power'][t] = rogue_power_total
-
-            if power_type == "constant":
-                power = app["Power"]
-                duration = int(app["Slots"])
-                count = 0
-                for house in [houses[0]]:
-                    for look_back in range(duration):
-                        past_t = t - look_back
-                        if past_t >= 0 and house.history_E.get((name, past_t), 0) == 1:
-                            count += 1
-                            break
-
-                appliance_data[name]['counts'][t] = count
-                appliance_data[name]['power'][t] = count * power
-
-            elif power_type == "flexible":
-                exact_power = 0.0
-                for house in [houses[0]]:
-                    exact_power += house.history_E.get((name, t), 0.0)
-                
-                appliance_data[name]['counts'][t] = 1 if exact_power > 0 else 0
-                appliance_data[name]['power'][t] = exact_power
+    rogue_power = h0_history.series("Rogue_Load", simulation_steps)
+    appliance_data["Unpredicted_Human_Load"] = channel_data(rogue_power)
 
-            
-        fridge_power = 0.0
-        freezer_power = 0.0
-        #
-        for house in [houses[0]]:
-            fridge_power += house.history_E.get(("Fridge", t), 0.0)
-            freezer_power += house.history_E.get(("Freezer", t), 0.0)
-                
-        appliance_data["Fridge"]['counts'][t] = 1 if fridge_power > 0 else 0
-        appliance_data["Fridge"]['power'][t] = fridge_power
+    for app in appliances:
+        name = app["name"]
+        power_type = app.get("power_type", "constant")
+
+        if power_type == "constant":
+            # Running in any step within `Slots` of a start
+            running = np.minimum(h0_history.running(name, app["Slots"], simulation_steps), 1)
+            appliance_data[name] = channel_data(running * app["Power"], running)
 
-        appliance_data["Freezer"]['counts'][t] = 1 if freezer_power > 0 else 0
-        appliance_data["Freezer"]['power'][t] = freezer_power
+        elif power_type == "flexible":
+            appliance_data[name] = channel_data(h0_history.series(name, simulation_steps))
+
+    appliance_data["Fridge"] = channel_data(h0_history.series("Fridge", simulation_steps))
+    appliance_data["Freezer"] = channel_data(h0_history.series("Freezer", simulation_steps))
     
     # Sort appliances for better visualisation (most used at the bottom)
     sorted_appliances = sorted(appliance_data.items(), key=lambda item: sum(item[1]['counts']), reverse=True) 
     
-    h0_heat_pump = []
-    for t in range(simulation_steps):
-        hp_power = houses[0].history_E.get(("Heat_Pump", t), 0.0)
-        h0_heat_pump.append(hp_power)
+    h0_heat_pump = h0_history.series("Heat_Pump", simulation_steps).tolist()
 
 
     # print("\nAppliance Sort Order (by total time steps):")
@@ -401,10 +347,7 @@ def run_simulation():
     
     appliance_power_data = {name: data['power'] for name, data in sorted_appliances}
 
-    all_houses_import = []
-    for h in houses:
-        house_history = [h.history_E.get(("Grid_Import", step), 0.0) for step in range(total_steps*2)]
-        all_houses_import.append(house_history)
+    all_houses_import = stack(houses, "Grid_Import", total_steps*2).tolist()
 
     test_step = 26
     sum_of_individual_imports = sum(house[test_step] for house in all_houses_import)
@@ -414,19 +357,16 @@ def run_simulation():
     # print(f"Sum of individual house imports: {sum_of_individual_imports} kW")
     # print(f"Sum of individual house exports: {sum_of_individual_exports} kW")
     # print(f"Net community transformer load: {total_community_demand} kW")
-    dumb_appliance_data = {app["name"]: [0.0] * simulation_steps for app in appliances}
-    dumb_appliance_data["Fridge"] = [0.0] * simulation_steps
-    dumb_appliance_data["Freezer"] = [0.0] * simulation_steps
-    h0_dumb_heat_pump = [0.0] * simulation_steps
-
-
-    for t in range(simulation_steps):
-        h0_dumb_heat_pump[t] = houses[0].history_E.get(("Open_Loop_Heat_Pump", t), 0.0)
-        
-        dumb_appliance_data["Fridge"][t] = houses[0].history_E.get(("Open_Loop_Fridge", t), 0.0)
-        dumb_appliance_data["Freezer"][t] = houses[0].history_E.get(("Open_Loop_Freezer", t), 0.0)
-        for app in appliances:
-            dumb_appliance_data[app["name"]][t] = houses[0].history_E.get((f"Open_Loop_{app['name']}", t), 0.0)
+    dumb_appliance_data = {app["name"]: h0_history.series(f"Open_Loop_{app['name']}", simulation_steps).tolist()
+                           for app in appliances}
+    dumb_appliance_data["Fridge"] = h0_history.series("Open_Loop_Fridge", simulation_steps).tolist()
+    dumb_appliance_data["Freezer"] = h0_history.series("Open_Loop_Freezer", simulation_steps).tolist()
+    h0_dumb_heat_pump = h0_history.series("Open_Loop_Heat_Pump", simulation_steps).tolist()
+    h0_indoor_temp = h0_history.series("Indoor_Temp").tolist()
+
+    # Everything is read from the histories now, so the steps flushed to disk can go
+    for house in houses:
+        house.history_E.remove()
             
     plot_simulation_results(
         community_demand=history_community_demand,
@@ -445,7 +385,7 @@ def run_simulation():
         community_actual_demand=history_actual_community_demand,
         h0_heat_pump=h0_heat_pump,
         h0_thermal_storage=history_h0_soc_th,
-        h0_indoor_temp=houses[0].history_T_in,  
+        h0_indoor_temp=h0_indoor_temp,
         all_houses_import=all_houses_import        
     )
 
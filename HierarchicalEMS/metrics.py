@@ -0,0 +1,124 @@
+# metrics.py
+# Run KPIs kept up to date from each step's readings (what execute_physical_action returns),
+# shared by main.run_simulation and pareto_parallel.run_single_simulation. Community demand on
+# both the smart and the open-loop side is max(0, import - export).
+from config import *
+from data import *
+
+# Channels of a house's step that the metrics and main.py's plots use
+reading_channels = ("Grid_Import", "Grid_Export", "Open_Loop_Import", "Open_Loop_Export", "Indoor_Temp",
+                    "Battery_Discharge")
+
+
+def readings(house, step):
+    # What a house did at a step, once execute_physical_action has written it, and the state it
+    # left the house in. Also what a HousePool worker sends back, so nothing else is fetched.
+    values = {name: house.history_E.get((name, step), 0.0) for name in reading_channels}
+    values["house_id"] = house.house_id
+    values["ran"] = [app["name"] for app in appliances if house.history_E.get((app["name"], step), 0.0) > 0]
+    values["soc"] = house.current_soc
+    values["soc_th"] = house.current_soc_th
+    values["T_fridge"] = house.current_T_fridge
+    values["T_freezer"] = house.current_T_freezer
+    return values
+
+
+def side():
+    # Running totals of one side (smart or open loop) of the community
+    return {"cost": 0.0, "energy": 0.0, "exported": 0.0, "peak": 0.0, "demand": 0.0,
+            "breach_count": 0, "breach_energy": 0.0}
+
+
+class Metrics:
+    def __init__(self, houses, limit, tolerance=0.0):
+        self.limit = limit                  # transformer limit (kW), a step breaches above limit + tolerance
+        self.tolerance = tolerance
+        self.steps = 0
+        self.smart = side()
+        self.open = side()
+        self.houses = {house.house_id: {"ran": set(), "temperature": 0.0} for house in houses}
+
+    def add(self, totals, imports, exports, price_in, price_out):
+        demand = max(0.0, imports - exports)
+        totals["cost"] += (imports * price_in - exports * price_out) * delta
+        totals["energy"] += (imports - exports) * delta
+        totals["exported"] += exports * delta
+        totals["peak"] = max(totals["peak"], demand)
+        totals["demand"] += demand
+        if demand > self.limit + self.tolerance:
+            totals["breach_count"] += 1
+        totals["breach_energy"] += max(0.0, demand - self.limit) * delta
+
+    def update(self, step, readings):
+        price_in = price_grid_elec[step % total_steps]
+        price_out = price_grid_export[step % total_steps]
+        self.add(self.smart, sum(r["Grid_Import"] for r in readings), sum(r["Grid_Export"] for r in readings),
+                 price_in, price_out)
+        self.add(self.open, sum(r["Open_Loop_Import"] for r in readings), sum(r["Open_Loop_Export"] for r in readings),
+                 price_in, price_out)
+        for r in readings:
+            house = self.houses[r["house_id"]]
+            house["ran"].update(r["ran"])
+            house["temperature"] += r["Indoor_Temp"]
+        self.steps += 1
+
+    def par(self, totals):
+        average = totals["demand"] / self.steps if self.steps else 0.0
+        return totals["peak"] / average if average > 0 else 0.0
+
+    def result(self):
+        return {
+            'Smart_Cost': self.smart["cost"], 'Open_Cost': self.open["cost"],
+            'Smart_Peak': self.smart["peak"], 'Open_Peak': self.open["peak"],
+            'Smart_PAR': self.par(self.smart), 'Open_PAR': self.par(self.open),
+            'Smart_Breach_Count': self.smart["breach_count"], 'Smart_Breach_Energy': self.smart["breach_energy"],
+            'Open_Breach_Count': self.open["breach_count"], 'Open_Breach_Energy': self.open["breach_energy"],
+            'Smart_Energy': self.smart["energy"], 'Open_Energy': self.open["energy"],
+            'Smart_Export': self.smart["exported"], 'Open_Export': self.open["exported"],
+        }
+
+    def house_sla(self, house):
+        # Service level of one house (%): EV charge delivered against what was due by the end of
+        # the run, every other appliance of the day run at least once, and the average indoor
+        # temperature (full marks from 18 C, a sliding half to full from 16 C)
+        totals = self.houses[house.house_id]
+        total_tasks = 0.0
+        fulfilled_tasks = 0.0
+
+        ev_appliance = next((app for app in house.personal_appliances if app["name"] == "Electric car"), None)
+        if ev_appliance is not None:
+            ts = ev_appliance.get("T_S", 0.0) * steps_per_hour        # window in steps, like self.steps
+            tf = ev_appliance.get("T_F", 0.0) * steps_per_hour
+            crosses_midnight = tf < ts
+            ev_req = ev_appliance.get("Required_Energy", 0.0)
+            if ev_req > 0:
+                ev_delivered = house.flexible_energy_delivered.get("Electric car", 0.0)
+                total_tasks += 1.0
+                expected_progress = min(1.0, (self.steps - ts) / ((tf + total_steps) - ts) if crosses_midnight else 1.0)
+                target_energy_by_end_of_sim = ev_req * expected_progress
+                if target_energy_by_end_of_sim > 0:
+                    fulfilled_tasks += min(1.0, ev_delivered / target_energy_by_end_of_sim)
+                else:
+                    fulfilled_tasks += 1.0
+
+        for app in house.personal_appliances:
+            if app.get("power_type") == "flexible":
+                continue  # EV already handled above
+            if app.get("T_S", 0.0) * steps_per_hour >= self.steps:
+                continue  # its window never opened in the run
+            total_tasks += 1.0
+            if app["name"] in totals["ran"]:
+                fulfilled_tasks += 1.0
+
+        avg_temp = totals["temperature"] / self.steps if self.steps else 0
+        total_tasks += 1.0
+        if avg_temp >= 18.0:
+            fulfilled_tasks += 1.0
+        elif avg_temp >= 16.0:
+            fulfilled_tasks += 0.5 + (0.5 * ((avg_temp - 16.0) / 2.0))
+
+        return (fulfilled_tasks / total_tasks) * 100 if total_tasks > 0 else 100.0
+
+    def sla(self, houses):
+        # Community service level (%), the average over the houses
+        return sum(self.house_sla(house) for house in houses) / len(houses)
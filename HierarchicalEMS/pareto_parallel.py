@@ -8,7 +8,13 @@ from config import *
 from data import *
 from house_agent import HouseAgent
 from community_controller import CommunityController
-import pickle
+from central_solver import CentralController
+from subproblem_cache import shared_cache
+from surrogate import shared_policy
+from history import stack
+from metrics import Metrics
+from result_store import ResultStore, pack
+import checkpoint
 import math
 
 
@@ -18,15 +24,24 @@ sigmas = [0.0, 0.1, 0.25, 0.5, 0.75, 1.0]
 # alphas = [0.30]
 # sigmas = [0.75]
 num_simulations = 20 
+sweep_cache_dir = 'subproblem_cache_4'     # solved house subproblems shared by every worker of the sweep
 
 
-def run_single_simulation(params):
-    alpha, sigma, seed_val = params
+def init_worker(cache_directory):
+    # Every worker process shares the sweep's on-disk subproblem cache
+    shared_cache.directory = cache_directory
+
+
+def start_simulation(alpha, sigma, seed_val):
+    # A run at step 0: the houses, the community and the series logged as it goes
     np.random.seed(seed_val) 
     random.seed(seed_val)
     
     houses = [HouseAgent(i, PV_capacity, C_E, I_max / num_homes) for i in range(num_homes)]
-    community = CommunityController(transformer_limit=I_max)
+    if community_solver == "central":
+        community = CentralController(transformer_limit=I_max)
+    else:
+        community = CommunityController(transformer_limit=I_max)
     
     for house in houses:
         house.alpha = alpha
@@ -48,23 +63,15 @@ def run_single_simulation(params):
     cache['appliance_data']['Freezer'] = []
     cache['appliance_data']['Unpredicted_Human_Load'] = []
 
+    return {"alpha": alpha, "sigma": sigma, "seed": seed_val, "step": 0, "houses": houses, "community": community,
+            "cache": cache, "metrics": Metrics(houses, I_max), "cache_stats": dict(shared_cache.stats),
+            "surrogate_stats": dict(shared_policy.stats)}
 
-    max_smart_peak = 0.0
-    total_smart_cost = 0.0
-    total_smart_net_energy = 0.0 
 
-    smart_breach_count = 0
-    smart_breach_energy = 0.0
-
-    max_open_peak = 0.0
-    total_open_cost = 0.0
-    total_open_net_energy = 0.0 
-
-    open_breach_count = 0
-    open_breach_energy = 0.0
-
-
-    for step in range(48*days): 
+def advance(sim, stop, checkpoint_path=None):
+    # Run steps [sim["step"], stop), checkpointing to checkpoint_path when one is due
+    houses, community, cache, metrics = sim["houses"], sim["community"], sim["cache"], sim["metrics"]
+    for step in range(sim["step"], stop): 
         # Deterministically generate Day 2+ appliances in the main thread
         if step > 0 and step % total_steps == 0:
             for house in houses:
@@ -74,33 +81,12 @@ def run_single_simulation(params):
 
         approved_schedules, peak_demand = community.negotiate_schedules(houses, step)
 
-        step_smart_import = 0.0
-        step_smart_export = 0.0
-        step_open_import = 0.0
-        step_open_export = 0.0
-
+        readings = []
         for house in houses:
             sched = next(s for s in approved_schedules if s["house_id"] == house.house_id)
-            house.execute_physical_action(sched, step)
-            
-            step_smart_export += house.history_E.get(("Grid_Export", step), 0.0)
-            step_smart_import += house.history_E.get(("Grid_Import", step), 0.0)
-            
-            abs_t = step % total_steps
-            pv_gen = house.pv_capacity * solar_profile[abs_t]
-
-            open_import = house.history_E.get(("Open_Loop_Import", step), 0.0)
-            open_export = house.history_E.get(("Open_Loop_Export", step), 0.0)
-            
-            step_open_import += open_import
-            step_open_export += open_export
-
-            cache['all_houses_import'][house.house_id].append(house.history_E.get(("Grid_Import", step), 0.0))
+            readings.append(house.execute_physical_action(sched, step))
+        metrics.update(step, readings)
         
-        abs_t = step % total_steps
-        
-        cache['community_demand'].append(step_smart_import)
-        cache['community_actual_demand'].append(step_open_import)
         h0 = houses[0]
         abs_t = step % total_steps
         cache['h0_soc'].append(h0.current_soc)
@@ -111,127 +97,97 @@ def run_single_simulation(params):
         
         h0_sched = next(s for s in approved_schedules if s["house_id"] == 0)
         cache['h0_charge'].append(h0_sched.get("planned_charge_k0", 0.0))
-        cache['h0_import'].append(h0.history_E.get(("Grid_Import", step), 0.0))
-        cache['h0_discharge'].append(h0.history_E.get(("Battery_Discharge", step), 0.0))
         cache['h0_solar'].append(h0.pv_capacity * efficiency * solar_profile[abs_t])
-        cache['h0_heat_pump'].append(h0.history_E.get(("Heat_Pump", step), 0.0))
-        cache['h0_dumb_heat_pump'].append(h0.history_E.get(("Open_Loop_Heat_Pump", step), 0.0))
-
-        cache['dumb_appliance_data']['Fridge'].append(h0.history_E.get(("Open_Loop_Fridge", step), 0.0))
-        cache['dumb_appliance_data']['Freezer'].append(h0.history_E.get(("Open_Loop_Freezer", step), 0.0))
-        cache['appliance_data']['Fridge'].append(h0.history_E.get(("Fridge", step), 0.0))
-        cache['appliance_data']['Freezer'].append(h0.history_E.get(("Freezer", step), 0.0))
-        cache['appliance_data']['Unpredicted_Human_Load'].append(h0.history_E.get(("Rogue_Load", step), 0.0))
-
-        for app in appliances:
-            name = app["name"]
-            cache['dumb_appliance_data'][name].append(h0.history_E.get((f"Open_Loop_{name}", step), 0.0))
-            
-            if app.get("power_type", "constant") == "constant":
-                count = sum(1 for past_t in range(max(0, step - int(app["Slots"]) + 1), step + 1) if h0.history_E.get((name, past_t), 0) == 1)
-                cache['appliance_data'][name].append(count * app["Power"])
-            else:
-                cache['appliance_data'][name].append(h0.history_E.get((name, step), 0.0))
-
-        net_smart_community_demand = max(0.0, step_smart_import - step_smart_export)
-        net_open_community_demand = max(0.0, step_open_import - step_open_export)
-
-        max_smart_peak = max(max_smart_peak, net_smart_community_demand)
-        max_open_peak = max(max_open_peak, net_open_community_demand)
-
-        if net_smart_community_demand > I_max:
-            smart_breach_count += 1
-            smart_breach_energy += (net_smart_community_demand - I_max) * delta
-        if net_open_community_demand > I_max:
-            open_breach_count += 1
-            open_breach_energy += (net_open_community_demand - I_max) * delta
-        
-        price_in, price_out = price_grid_elec[abs_t], price_grid_export[abs_t]
 
-        total_smart_cost += (step_smart_import * price_in * delta) - (step_smart_export * price_out * delta)
-        total_open_cost += (step_open_import * price_in * delta) - (step_open_export * price_out * delta)
+        sim["step"] = step + 1
+        if checkpoint_path is not None and checkpoint.due(step):
+            checkpoint.save(checkpoint_path, step + 1, houses, community, series=cache, metrics=metrics)
 
-        total_smart_net_energy += (step_smart_import - step_smart_export) * delta
-        total_open_net_energy += (step_open_import - step_open_export) * delta
 
+def run_single_simulation(params):
+    alpha, sigma, seed_val = params
+    sim = start_simulation(alpha, sigma, seed_val)
+
+    # A run that was stopped carries on from its last checkpoint
+    checkpoint_path = checkpoint.path_for(f"pareto_{alpha}_{sigma}_{seed_val}")
+    saved = checkpoint.load(checkpoint_path)
+    if saved is not None:
+        sim.update(step=saved["step"], houses=saved["houses"], community=saved["community"], cache=saved["series"],
+                   metrics=saved["metrics"])
+
+    advance(sim, 48*days, checkpoint_path)
+    checkpoint.remove(checkpoint_path)
+    result = finish(sim)
+    for house in sim["houses"]:
+        house.history_E.remove()
+    return result
+
+
+def finish(sim):
+    # The run's KPIs and packed series, from the houses' state once every step has run
+    alpha, sigma, seed_val = sim["alpha"], sim["sigma"], sim["seed"]
+    houses, cache, metrics = sim["houses"], sim["cache"], sim["metrics"]
+
+    # The series read back from the houses' histories, one array slice per channel
+    steps = 48 * days
+    smart_import = stack(houses, "Grid_Import", steps)
+    step_smart_import = smart_import.sum(axis=0)
+    step_open_import = stack(houses, "Open_Loop_Import", steps).sum(axis=0)
+
+    cache['community_demand'] = step_smart_import.tolist()
+    cache['community_actual_demand'] = step_open_import.tolist()
+    for house, imports in zip(houses, smart_import):
+        cache['all_houses_import'][house.house_id] = imports.tolist()
+
+    h0_history = houses[0].history_E
+    cache['h0_import'] = h0_history.series("Grid_Import", steps).tolist()
+    cache['h0_discharge'] = h0_history.series("Battery_Discharge", steps).tolist()
+    cache['h0_heat_pump'] = h0_history.series("Heat_Pump", steps).tolist()
+    cache['h0_dumb_heat_pump'] = h0_history.series("Open_Loop_Heat_Pump", steps).tolist()
+
+    cache['dumb_appliance_data']['Fridge'] = h0_history.series("Open_Loop_Fridge", steps).tolist()
+    cache['dumb_appliance_data']['Freezer'] = h0_history.series("Open_Loop_Freezer", steps).tolist()
+    cache['appliance_data']['Fridge'] = h0_history.series("Fridge", steps).tolist()
+    cache['appliance_data']['Freezer'] = h0_history.series("Freezer", steps).tolist()
+    cache['appliance_data']['Unpredicted_Human_Load'] = h0_history.series("Rogue_Load", steps).tolist()
+
+    for app in appliances:
+        name = app["name"]
+        cache['dumb_appliance_data'][name] = h0_history.series(f"Open_Loop_{name}", steps).tolist()
+
+        if app.get("power_type", "constant") == "constant":
+            cache['appliance_data'][name] = (h0_history.running(name, app["Slots"], steps) * app["Power"]).tolist()
+        else:
+            cache['appliance_data'][name] = h0_history.series(name, steps).tolist()
+
+    # KPIs kept up to date as the steps ran, see metrics.py
+    kpis = metrics.result()
     smart_end_soc = sum(h.current_soc for h in houses)
     open_end_soc = sum(h.open_soc for h in houses)
-    soc_delta = smart_end_soc - open_end_soc
-    average_price = sum(price_grid_elec[:48]) / 48.0
-    total_smart_cost -= ((smart_end_soc - open_end_soc) * (sum(price_grid_elec[:48]) / 48.0))
-
-    community_total_sla_score = 0.0
-    sim_steps_run = 48 * days
-
-       
-    for house in houses:
-        total_tasks = 0.0
-        fulfilled_tasks = 0.0
-        
-        # 1. Flexible Appliances (EV) 
-        ev_appliance = next((app for app in house.personal_appliances if app["name"] == "Electric car"), None)
-        if ev_appliance is not None:
-            ts = ev_appliance.get("T_S", 0.0)
-            tf = ev_appliance.get("T_F", 0.0)
-            crosses_midnight = tf < ts 
-            ev_req = ev_appliance.get("Required_Energy", 0.0)
-            
-            if ev_req > 0:
-                ev_delivered = house.flexible_energy_delivered.get("Electric car", 0.0)
-                total_tasks += 1.0
-                expected_progress = min(1.0, (sim_steps_run - ts) / ((tf + 48) - ts) if crosses_midnight else 1.0)
-                target_energy_by_end_of_sim = ev_req * expected_progress
-                
-                if target_energy_by_end_of_sim > 0:
-                    fulfilled_tasks += min(1.0, ev_delivered / target_energy_by_end_of_sim)
-                else:
-                    fulfilled_tasks += 1.0 
-                
-        # 2. Standard Appliances
-        for app in house.personal_appliances:
-            if app.get("power_type") == "flexible":
-                continue  # EV already handled above
-    
-            # if doesnt start in 24 hour sim still counted        
-            window_opens_in_sim = any((app.get("T_S", 0.0) * steps_per_hour) <= s < sim_steps_run for s in range(sim_steps_run))
-
-            if not window_opens_in_sim:
-                continue
-
-            total_tasks += 1.0
-            if any(house.history_E.get((app["name"], s), 0) > 0 for s in range(sim_steps_run)):
-                fulfilled_tasks += 1.0     
-
-        # 3. Thermal Comfort 
-        avg_temp = sum(house.history_T_in) / len(house.history_T_in) if house.history_T_in else 0
-        total_tasks += 1.0
-        if avg_temp >= 18.0: 
-            fulfilled_tasks += 1.0
-        elif avg_temp >= 16.0: 
-            fulfilled_tasks += 0.5 + (0.5 * ((avg_temp - 16.0) / 2.0))
-        
-        house_sla_pct = (fulfilled_tasks / total_tasks) * 100 if total_tasks > 0 else 100.0
-        community_total_sla_score += house_sla_pct
+    total_smart_cost = kpis['Smart_Cost'] - (smart_end_soc - open_end_soc) * (sum(price_grid_elec[:48]) / 48.0)
+    total_open_cost = kpis['Open_Cost']
+    max_smart_peak, max_open_peak = kpis['Smart_Peak'], kpis['Open_Peak']
 
-    avg_community_sla = community_total_sla_score / num_homes
+    avg_community_sla = metrics.sla(houses)
     cost_saving_pct = (total_open_cost - total_smart_cost) / abs(total_open_cost) * 100 if total_open_cost != 0 else 0.0
     peak_reduction_pct = (max_open_peak - max_smart_peak) / max_open_peak * 100
 
     return {
         'Sigma': sigma, 'Alpha': alpha, 'Seed': seed_val,
         'Cost_Saving': cost_saving_pct, 'Peak_Reduction': peak_reduction_pct, 'SLA': avg_community_sla,
-        'Smart_Breach_Count': smart_breach_count, 'Smart_Breach_Energy': smart_breach_energy,
-        'Open_Breach_Count': open_breach_count, 'Open_Breach_Energy': open_breach_energy,
+        'Smart_Breach_Count': kpis['Smart_Breach_Count'], 'Smart_Breach_Energy': kpis['Smart_Breach_Energy'],
+        'Open_Breach_Count': kpis['Open_Breach_Count'], 'Open_Breach_Energy': kpis['Open_Breach_Energy'],
         'Smart_Peak': max_smart_peak, 'Open_Peak': max_open_peak,
         'Smart_Cost': total_smart_cost, 'Open_Cost': total_open_cost,
-        'Smart_Energy': total_smart_net_energy, 'Open_Energy': total_open_net_energy,
-        'Time_Series_Cache': cache  
+        'Smart_Energy': kpis['Smart_Energy'], 'Open_Energy': kpis['Open_Energy'],
+        'Cache_Hit_Rate': shared_cache.hit_rate(since=sim["cache_stats"]),
+        'Surrogate': shared_policy.report(since=sim["surrogate_stats"]),
+        'Time_Series_Cache': pack(cache)       # float32 columns, see result_store.py
     }
 
 if __name__ == '__main__':
     csv_file = 'pareto_2day_10house_10kW_extended4.csv'
-    cache_file = 'simulation_cache_4.pkl'
-    all_cache = {}
+    store = ResultStore('simulation_cache_4')       # one shard per run, see result_store.py
     completed_runs = set()
 
     cols = ['Sigma', 'Alpha', 'Seed', 'Cost_Saving', 'Peak_Reduction', 'SLA', 
@@ -248,17 +204,10 @@ if __name__ == '__main__':
 
     all_combinations = [(round(a, 4), round(s, 4), seed) for a in alphas for s in sigmas for seed in range(num_simulations)]
     combinations = [c for c in all_combinations if c not in completed_runs]
-    
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'rb') as f:
-                all_cache = pickle.load(f)
-        except: pass
-
 
     print(f"Resuming... {len(completed_runs)} completed, {len(combinations)} remaining.")
 
-    with concurrent.futures.ProcessPoolExecutor() as executor:
+    with concurrent.futures.ProcessPoolExecutor(initializer=init_worker, initargs=(sweep_cache_dir,)) as executor:
         futures = {executor.submit(run_single_simulation, combo): combo for combo in combinations}
         
         for future in concurrent.futures.as_completed(futures):
@@ -267,15 +216,13 @@ if __name__ == '__main__':
                 # Append single row to CSV immediately
                 combo_key = (res['Alpha'], res['Sigma'], res['Seed'])
                 cache_payload = res.pop('Time_Series_Cache')
-                all_cache[combo_key] = cache_payload
-                
+                store.put(combo_key, cache_payload)
                 
                 pd.DataFrame([res], columns=cols).to_csv(csv_file, mode='a', header=False, index=False)
                 
-                with open(cache_file, 'wb') as f:
-                    pickle.dump(all_cache, f)
-                
-                    print(f"Done -> Alpha: {res['Alpha']:<4} | Sigma: {res['Sigma']:<4} | Seed: {res['Seed']:<2} | Breaches (S/O): {res['Smart_Breach_Count']}/{res['Open_Breach_Count']} | Energy (S/O): {res['Smart_Breach_Energy']:.2f}/{res['Open_Breach_Energy']:.2f} | Peak Red: {res['Peak_Reduction']:>5.2f}%")
+                print(f"Done -> Alpha: {res['Alpha']:<4} | Sigma: {res['Sigma']:<4} | Seed: {res['Seed']:<2} | Breaches (S/O): {res['Smart_Breach_Count']}/{res['Open_Breach_Count']} | Energy (S/O): {res['Smart_Breach_Energy']:.2f}/{res['Open_Breach_Energy']:.2f} | Peak Red: {res['Peak_Reduction']:>5.2f}% | Cache hits: {res['Cache_Hit_Rate'] * 100:.0f}%")
+                if surrogate_model is not None:
+                    print(f"        Surrogate: {res['Surrogate']}")
             except Exception as exc:
                 print(f"A simulation crashed: {exc}")
 
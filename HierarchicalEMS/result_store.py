@@ -0,0 +1,243 @@
+# result_store.py
+# Sweep time series, one shard per run (shards/<alpha>_<sigma>_<seed>.run) plus an append-only
+# index.jsonl. Runs are packed as rows of one array (pack) and read back lazily (Run); an old
+# single-pickle sweep cache is split into a store with import_pickle.
+import os
+import sys
+import json
+import zlib
+import pickle
+import tempfile
+import numpy as np
+from config import *
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def columns(value, rows):
+    # Layout of a payload value, appending its series to rows. A series is its row number;
+    # dicts and lists of series keep their shape.
+    if isinstance(value, dict):
+        return {"dict": {name: columns(item, rows) for name, item in value.items()}}
+    if isinstance(value, (list, tuple, np.ndarray)) and len(value) and not np.isscalar(value[0]):
+        return {"list": [columns(item, rows) for item in value]}
+    try:
+        series = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        series = None
+    if series is None or series.ndim != 1 or (rows and len(series) != len(rows[0])):
+        raise TypeError("Only series of numbers of one length can be packed")
+    rows.append(series)
+    return len(rows) - 1
+
+
+def compress(values, codec):
+    if codec is None:
+        return values.tobytes()
+    if codec == "delta":
+        bits = values.view(f"<u{values.itemsize}")
+        deltas = np.diff(bits, prepend=np.zeros(1, bits.dtype))
+        # Small deltas leave the high bytes zero: group each byte position together for zlib
+        return zlib.compress(deltas.view(np.uint8).reshape(-1, values.itemsize).T.tobytes())
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("series_codec = 'zstd' needs the zstandard package")
+        return zstandard.ZstdCompressor().compress(values.tobytes())
+    raise ValueError(f"Unknown series codec {codec!r}")
+
+
+def decompress(data, dtype, codec):
+    dtype = np.dtype(dtype)
+    if codec is None:
+        return np.frombuffer(data, dtype)
+    if codec == "delta":
+        grouped = np.frombuffer(zlib.decompress(data), np.uint8).reshape(dtype.itemsize, -1)
+        deltas = np.ascontiguousarray(grouped.T).view(f"<u{dtype.itemsize}").ravel()
+        return np.cumsum(deltas, dtype=deltas.dtype).view(dtype)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("Reading zstd series needs the zstandard package")
+        return np.frombuffer(zstandard.ZstdDecompressor().decompress(data), dtype)
+    raise ValueError(f"Unknown series codec {codec!r}")
+
+
+def pack(payload, dtype=series_dtype, codec=series_codec):
+    # A dict of series (nested dicts and lists of them) as one compact array
+    rows = []
+    layout = columns(payload, rows)
+    if not isinstance(layout, dict) or "dict" not in layout:
+        raise TypeError("Only dicts of series can be packed")
+    values = np.array(rows or np.zeros((0, 0)), dtype=np.dtype(dtype).newbyteorder("<"))
+    return {"series": layout["dict"], "length": values.shape[1], "dtype": values.dtype.str, "codec": codec,
+            "data": compress(values.ravel(), codec)}
+
+
+def packed(value):
+    return isinstance(value, dict) and set(value) == {"series", "length", "dtype", "codec", "data"}
+
+
+class Run:
+    # A packed run read lazily, from a .run file or from memory. Uncompressed files are mapped
+    # on first use and a series is a view of the mapping, so only the pages of the series that
+    # are plotted are read from disk; compressed runs are decoded whole on first use.
+    def __init__(self, header, path=None, offset=0, data=None):
+        self.layout = header["series"]
+        self.length = header["length"]
+        self.dtype = header["dtype"]
+        self.codec = header["codec"]
+        self.path = path
+        self.offset = offset        # bytes before the first series in the file
+        self.data = data
+        self.values = None
+
+    def build(self, spec):
+        if isinstance(spec, dict) and "dict" in spec:
+            return {name: self.build(item) for name, item in spec["dict"].items()}
+        if isinstance(spec, dict) and "list" in spec:
+            return [self.build(item) for item in spec["list"]]
+        if self.values is None:
+            if self.data is not None:
+                self.values = decompress(self.data, self.dtype, self.codec)
+            elif os.path.getsize(self.path) == self.offset:
+                self.values = np.zeros(0, self.dtype)
+            elif self.codec is None:
+                self.values = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.offset)
+            else:
+                with open(self.path, "rb") as f:
+                    f.seek(self.offset)
+                    self.values = decompress(f.read(), self.dtype, self.codec)
+        return self.values[spec * self.length:(spec + 1) * self.length]
+
+    def __getitem__(self, name):
+        return self.build(self.layout[name])
+
+    def get(self, name, default=None):
+        return self[name] if name in self.layout else default
+
+    def __contains__(self, name):
+        return name in self.layout
+
+    def keys(self):
+        return self.layout.keys()
+
+
+def unpack(value):
+    # The dict shape the plotting code expects, with NumPy series
+    return Run(value, data=value["data"]) if packed(value) else value
+
+
+def materialise(value):
+    # Plain lists and dicts of floats, the shape run_single_simulation used to return
+    if isinstance(value, Run):
+        return {name: materialise(value[name]) for name in value.keys()}
+    if isinstance(value, dict):
+        return {name: materialise(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [materialise(item) for item in value]
+    return np.asarray(value, dtype=np.float64).tolist() if isinstance(value, np.ndarray) else value
+
+
+class ResultStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.jsonl")
+        os.makedirs(os.path.join(directory, "shards"), exist_ok=True)
+        self.index = None           # read on first use, playback never needs it
+        self.torn = False           # the last line was cut off, so the next entry starts a new line
+
+    def entries(self):
+        if self.index is None:
+            self.index = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    for line in f:
+                        self.torn = not line.endswith("\n")
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue            # cut off by a crash while appending
+                        self.index[(entry["alpha"], entry["sigma"], entry["seed"])] = entry["shard"]
+        return self.index
+
+    def keys(self):
+        return set(self.entries())
+
+    def __contains__(self, key):
+        return key in self.entries()
+
+    def __len__(self):
+        return len(self.entries())
+
+    def shard(self, key):
+        alpha, sigma, seed = key
+        return os.path.join("shards", f"{alpha}_{sigma}_{seed}")
+
+    def replace(self, path, write):
+        # Write through a scratch file and rename, so readers never see half a file
+        fd, scratch = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(scratch, path)
+
+    def put(self, key, payload):
+        # A packed run, or a payload to pack with the configured dtype and codec
+        # (raises TypeError for anything that is not a dict of series)
+        self.entries()
+        if not packed(payload):
+            payload = pack(payload)
+        header = json.dumps({name: payload[name] for name in ("series", "length", "dtype", "codec")},
+                            separators=(",", ":")).encode()
+        header += b" " * (-len(header) % 8)
+
+        def write(f):
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            f.write(payload["data"])
+        shard = self.shard(key) + ".run"
+        self.replace(os.path.join(self.directory, shard), write)
+
+        # One short line per run, flushed in a single write
+        alpha, sigma, seed = key
+        line = json.dumps({"alpha": alpha, "sigma": sigma, "seed": seed, "shard": shard}) + "\n"
+        if self.torn:
+            line = "\n" + line
+            self.torn = False
+        with open(self.index_path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.index[key] = shard
+
+    def open(self, key):
+        # The run as a read-only mapping of its series
+        path = os.path.join(self.directory, self.shard(key) + ".run")
+        if not os.path.exists(path):
+            raise KeyError(key)
+        with open(path, "rb") as f:
+            size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(size))
+        return Run(header, path, 8 + size)
+
+    def load(self, key):
+        # The run read in full as lists
+        return materialise(self.open(key))
+
+
+def import_pickle(path, directory):
+    # Split an old single-pickle sweep cache into a store
+    with open(path, "rb") as f:
+        all_cache = pickle.load(f)
+    store = ResultStore(directory)
+    for key, payload in all_cache.items():
+        store.put(key, payload)
+    return store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "import":
+        sys.exit("usage: python result_store.py import <pickle> <directory>")
+    store = import_pickle(sys.argv[2], sys.argv[3])
+    print(f"{len(store)} runs in {sys.argv[3]}")
@@ -0,0 +1,217 @@
+# solvers.py
+# Solves the PuLP house model: HiGHS in-process through highspy (the model compiled once into
+# column arrays and updated in place), or PuLP's CBC binary when highspy is missing.
+import os
+import re
+import time
+import tempfile
+import numpy as np
+import pulp
+from config import solver_backend
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+warned_fallback = False
+
+
+def resolve_backend(backend=None):
+    # Pick the requested backend, falling back to CBC if HiGHS cannot be imported
+    global warned_fallback
+    backend = backend or solver_backend
+    if backend == "highs" and highspy is None:
+        if not warned_fallback:
+            print("highspy is not installed, falling back to CBC")
+            warned_fallback = True
+        return "cbc"
+    if backend not in ("highs", "cbc"):
+        raise ValueError(f"Unknown solver backend '{backend}'")
+    return backend
+
+
+class CompiledModel:
+    # Column-wise matrix of a PuLP problem. The coefficient matrix is fixed at compile time;
+    # costs, bounds and right-hand sides are re-read from the PuLP objects on every solve,
+    # which is what lets a persistent model be updated in place and solved again.
+
+    def __init__(self, model):
+        self.model = model
+        self.variables = model.variables()
+        self.constraints = list(model.constraints.values())
+
+        column = {var.name: j for j, var in enumerate(self.variables)}
+        entries = [[] for _ in self.variables]
+        for i, constraint in enumerate(self.constraints):
+            for var, coefficient in constraint.items():
+                if coefficient != 0:
+                    entries[column[var.name]].append((i, coefficient))
+
+        a_start = [0]
+        a_index = []
+        a_value = []
+        for col in entries:
+            for i, coefficient in col:
+                a_index.append(i)
+                a_value.append(coefficient)
+            a_start.append(len(a_index))
+
+        self.a_start = np.array(a_start, dtype=np.int32)
+        self.a_index = np.array(a_index, dtype=np.int32)
+        self.a_value = np.array(a_value, dtype=np.float64)
+        self.integrality = np.array([1 if var.cat == pulp.LpInteger else 0 for var in self.variables], dtype=np.int32)
+        self.highs = None
+        self.passed = False         # True once HiGHS holds a copy of the model
+        self.relaxed = False        # True while HiGHS holds it with every integer column made continuous
+
+    def costs(self):
+        objective = self.model.objective
+        return np.array([objective.get(var, 0.0) for var in self.variables], dtype=np.float64)
+
+    def arrays(self):
+        inf = highspy.kHighsInf
+        col_cost = self.costs()
+        col_lower = np.array([-inf if var.lowBound is None else var.lowBound for var in self.variables], dtype=np.float64)
+        col_upper = np.array([inf if var.upBound is None else var.upBound for var in self.variables], dtype=np.float64)
+
+        row_lower = np.empty(len(self.constraints))
+        row_upper = np.empty(len(self.constraints))
+        for i, constraint in enumerate(self.constraints):
+            lb = constraint.getLb()
+            ub = constraint.getUb()
+            row_lower[i] = -inf if lb is None else lb
+            row_upper[i] = inf if ub is None else ub
+        return col_cost, col_lower, col_upper, row_lower, row_upper
+
+
+def interruptible(h, stop):
+    # HiGHS polls its interrupt callbacks while it solves: once stop() is true it ends the solve,
+    # keeping any incumbent (the streaming negotiation cancels stragglers this way). HiGHS keeps
+    # the flag from one run to the next, so every poll writes it.
+    def check(event):
+        event.interrupt(stop())
+    h.cbSimplexInterrupt += check
+    h.cbIpmInterrupt += check
+    h.cbMipInterrupt += check
+
+
+def solve_highs(compiled, time_limit=None, gap_rel=None, warm_start=None, costs_only=False, relax=False, stop=None):
+    if compiled.highs is None:
+        compiled.highs = highspy.Highs()
+        compiled.highs.setOptionValue("output_flag", False)
+        if stop is not None:
+            interruptible(compiled.highs, stop)
+    h = compiled.highs
+    if time_limit is not None:
+        h.setOptionValue("time_limit", float(time_limit))
+    if gap_rel is not None:
+        h.setOptionValue("mip_rel_gap", gap_rel)
+
+    num_col = len(compiled.variables)
+    every_col = np.arange(num_col, dtype=np.int32)
+    integrality = np.zeros_like(compiled.integrality) if relax else compiled.integrality
+    if costs_only and compiled.passed:
+        # Only the objective moved: keep HiGHS's copy of the model and just swap the costs
+        h.changeColsCost(num_col, every_col, compiled.costs())
+    elif compiled.passed:
+        # The matrix never changes, so costs and bounds are rewritten in place. Unlike passModel
+        # this keeps HiGHS's simplex basis, which warm starts the next LP.
+        col_cost, col_lower, col_upper, row_lower, row_upper = compiled.arrays()
+        h.changeColsCost(num_col, every_col, col_cost)
+        h.changeColsBounds(num_col, every_col, col_lower, col_upper)
+        h.changeRowsBounds(len(compiled.constraints), np.arange(len(compiled.constraints), dtype=np.int32),
+                           row_lower, row_upper)
+    else:
+        col_cost, col_lower, col_upper, row_lower, row_upper = compiled.arrays()
+        sense = -1 if compiled.model.sense == pulp.LpMaximize else 1
+        h.passModel(
+            num_col, len(compiled.constraints), len(compiled.a_value),
+            1, sense, compiled.model.objective.constant,     # 1 = column-wise matrix
+            col_cost, col_lower, col_upper, row_lower, row_upper,
+            compiled.a_start, compiled.a_index, compiled.a_value, integrality
+        )
+        compiled.passed = True
+        compiled.relaxed = relax
+    if relax != compiled.relaxed:
+        h.changeColsIntegrality(num_col, every_col, integrality)
+        compiled.relaxed = relax
+    if warm_start and not relax:
+        # MIP start: HiGHS keeps the integer values and completes the rest with an LP
+        start = highspy.HighsSolution()
+        start.col_value = [warm_start.get(var, 0.0) for var in compiled.variables]
+        start.value_valid = True
+        h.setSolution(start)
+    h.run()
+
+    model_status = h.getModelStatus()
+    info = h.getInfo()
+    has_solution = info.primal_solution_status == 2      # 2 = feasible point available
+
+    if model_status == highspy.HighsModelStatus.kOptimal:
+        status = pulp.LpStatusOptimal
+    elif model_status in (highspy.HighsModelStatus.kInfeasible, highspy.HighsModelStatus.kUnboundedOrInfeasible):
+        status = pulp.LpStatusInfeasible
+    elif model_status == highspy.HighsModelStatus.kUnbounded:
+        status = pulp.LpStatusUnbounded
+    else:
+        # Time limit and friends: report "Not Solved" but keep any incumbent, as PuLP does for CBC
+        status = pulp.LpStatusNotSolved
+
+    if has_solution:
+        values = h.getSolution().col_value
+        for var, value in zip(compiled.variables, values):
+            var.varValue = value
+    else:
+        for var in compiled.variables:
+            var.varValue = None
+
+    compiled.model.status = status
+    return status, info.mip_node_count if compiled.integrality.any() and not relax else 0
+
+
+def solve_cbc(model, time_limit=None, gap_rel=None, warm_start=None, relax=False):
+    if warm_start and not relax:
+        # PuLP writes the current variable values to a CBC mipstart file
+        for var, value in warm_start.items():
+            var.varValue = value
+
+    # CBC only reports its node count in the log, so route the log to a scratch file
+    log_fd, log_path = tempfile.mkstemp(suffix=".log")
+    os.close(log_fd)
+    try:
+        status = model.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=time_limit, gapRel=gap_rel, mip=not relax,
+                                               warmStart=bool(warm_start) and not relax, logPath=log_path))
+        with open(log_path) as f:
+            match = re.search(r"Enumerated nodes:\s+(\d+)", f.read())
+    finally:
+        os.remove(log_path)
+    return status, int(match.group(1)) if match else (0 if relax else None)
+
+
+def solve(model, backend=None, time_limit=None, gap_rel=None, compiled=None, warm_start=None, costs_only=False,
+          relax=False, stop=None):
+    # Solve a PuLP problem and leave the solution in each variable's varValue.
+    # Pass a CompiledModel for a persistent problem to skip recompiling the matrix,
+    # a {variable: value} dict as warm_start to give the solver an incumbent, and
+    # costs_only=True when nothing but objective coefficients changed since the last solve.
+    # relax=True solves it as a pure LP, for when every integer variable is already fixed by its bounds;
+    # the MIP start is dropped then, as HiGHS warm starts the LP from its last basis instead.
+    # stop() is polled during a HiGHS solve to end it early; CBC always runs to its time limit.
+    backend = resolve_backend(backend)
+    start = time.perf_counter()
+
+    if backend == "highs":
+        if compiled is None:
+            compiled = CompiledModel(model)
+        status, nodes = solve_highs(compiled, time_limit, gap_rel, warm_start, costs_only, relax, stop)
+    else:
+        status, nodes = solve_cbc(model, time_limit, gap_rel, warm_start, relax)
+
+    return {
+        "status": pulp.LpStatus[status],
+        "backend": backend,
+        "wall_time": time.perf_counter() - start,
+        "nodes": nodes,
+    }
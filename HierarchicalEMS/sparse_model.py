@@ -0,0 +1,577 @@
+# sparse_model.py
+# The house MPC model of house_model.py built directly as NumPy/SciPy arrays for HiGHS,
+# with appliance columns only inside their windows and an optional move-blocked horizon.
+import time
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, Bounds, LinearConstraint
+from config import *
+from data import *
+import solvers
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+class SparseHouseModel:
+    # Same interface as HouseModel: update(), set_penalties(), solve(), solution(), stats
+
+    def __init__(self, house_id, battery_capacity, house_limit, horizon=48, blocks=None):
+        self.house_id = house_id
+        self.battery_capacity = battery_capacity
+        self.house_limit = house_limit
+        self.horizon = horizon
+
+        blocks = list(blocks) if blocks else [1] * horizon
+        if sum(blocks) != horizon or blocks[0] != 1 or min(blocks) < 1:
+            raise ValueError(f"Horizon blocks {blocks} must be positive, start with a single step and sum to {horizon}")
+        self.blocks = np.array(blocks, dtype=np.int64)                          # base steps in each period
+        self.block_start = np.concatenate(([0], np.cumsum(self.blocks)[:-1]))   # first base step of each period
+        self.period_of = np.repeat(np.arange(len(blocks)), self.blocks)         # period of each base step
+        self.periods = len(blocks)
+        self.signature = ("sparse", tuple(blocks))
+
+        self.constant_apps = [app for app in appliances if app["power_type"] == "constant" and not app.get("interruptible", False)]
+        self.flexible_apps = [app for app in appliances if app["power_type"] == "flexible"]
+
+        self.structure = None       # (start windows, charging sessions) the arrays were built for
+        self.grid_binary = True     # False while the Z_grid binaries and their big-M rows are switched off
+        self.highs = None
+        self.relaxed = False        # True while HiGHS holds the model with continuous integrality
+        self.bounds_changed = True  # right-hand sides or bounds changed since HiGHS last saw the model
+        self.step = None
+        self.x = None
+        self.last_solve = None
+        self.last_plan = None       # values of the fixed columns in the last successful solve
+        self.last_appliances = None # full-horizon appliance trajectories of the last successful solve
+        self.plan_step = None
+        self.cancel_step = None     # a solve at this step is to stop as soon as HiGHS lets it
+        self.stats = {"solves": 0, "warm_starts": 0, "nodes": 0, "wall_time": 0.0, "grid_binary_dropped": 0,
+                      "rebuilds": 0, "lp_solves": 0}
+
+    def build(self, start_windows, flex_sessions):
+        H = self.horizon
+        P = self.periods
+        L = self.blocks.astype(np.float64)
+        inf = np.inf
+
+        # Column layout. The families that do not depend on the appliance windows come first,
+        # so they keep the same columns from one build to the next.
+        self.num_col = 0
+        lower, upper, integer = [], [], []
+
+        def cols(n, lb=0.0, ub=inf, binary=False):
+            index = np.arange(self.num_col, self.num_col + n)
+            self.num_col += n
+            lower.append(np.full(n, lb))
+            upper.append(np.full(n, 1.0 if binary else ub))
+            integer.append(np.full(n, 1 if binary else 0, dtype=np.int32))
+            return index
+
+        self.S_E = cols(P, 0.0, self.battery_capacity)
+        self.z = cols(P)
+        self.y = cols(P)
+        self.I = cols(P)
+        self.I_excess = cols(P)
+        self.I_export = cols(P)
+        self.Z_grid = cols(P, binary=True)        # 1 = Importing, 0 = Exporting
+        self.P_HP = cols(P, 0.0, 10.0)
+        self.P_HP_Space = cols(P)
+        self.P_HP_DHW = cols(P)
+        self.S_TH = cols(P, 0.0, C_TH)
+        self.T_in = cols(P, T_min, T_max)
+        self.diff = cols(P)
+        self.T_fr = cols(P, 2.0, 5.0)
+        self.T_fz = cols(P, -22.0, -15.0)
+        self.P_comp_fr = cols(P, 0.0, 0.3)
+        self.P_comp_fz = cols(P, 0.0, 0.3)
+        self.Reserve_deficit = cols(P)
+        self.P_max_local = cols(1)[0]
+        self.P_max_flex = cols(1)[0]
+        self.num_fixed = self.num_col
+
+        # Constant appliances: one start binary per slot of the start window.
+        # Inside a longer period only its first valid slot is kept as a candidate start.
+        self.E = {}
+        self.E_slots = {}
+        for app in self.constant_apps:
+            name = app["name"]
+            if name in start_windows:
+                valid = np.array(start_windows[name], dtype=np.int64)
+                first = np.unique(self.period_of[valid], return_index=True)[1]
+                self.E_slots[name] = valid[first]
+                self.E[name] = cols(len(self.E_slots[name]), binary=True)
+
+        # Flexible appliances: power and on/off state per period the charging session touches,
+        # with the share of the period the car is plugged in
+        self.P_flex = {}
+        self.O_flex = {}
+        self.flex_slots = {}
+        self.flex_share = {}
+        self.E_deficit = {}
+        for app in self.flexible_apps:
+            name = app["name"]
+            if name in flex_sessions:
+                session = np.array(flex_sessions[name][0], dtype=np.int64)
+                periods, count = np.unique(self.period_of[session], return_counts=True)
+                self.flex_slots[name] = periods
+                self.flex_share[name] = count / L[periods]
+                self.E_deficit[name] = cols(1)[0]
+                self.P_flex[name] = cols(len(periods))
+                self.O_flex[name] = cols(len(periods), binary=True)
+
+        self.col_lower = np.concatenate(lower)
+        self.col_upper = np.concatenate(upper)
+        self.integrality = np.concatenate(integer)
+
+        # Row layout: rows() hands out a block of rows, terms() adds coefficients to it
+        self.num_row = 0
+        self.row_index = {}
+        row_lower, row_upper = [], []
+        entries_row, entries_col, entries_val = [], [], []
+
+        def rows(name, n, lb, ub):
+            index = np.arange(self.num_row, self.num_row + n)
+            self.num_row += n
+            self.row_index[name] = index
+            row_lower.append(np.broadcast_to(np.asarray(lb, dtype=np.float64), n))
+            row_upper.append(np.broadcast_to(np.asarray(ub, dtype=np.float64), n))
+            return index
+
+        def terms(row, col, value):
+            row, col = np.broadcast_arrays(row, col)
+            entries_row.append(row.ravel())
+            entries_col.append(col.ravel())
+            entries_val.append(np.broadcast_to(np.asarray(value, dtype=np.float64), row.shape).ravel())
+
+        M = self.big_M = 20.0  # Safe physical wire limit in kW
+
+        r = rows("Discharge_Rate_Limit", P, -inf, D_E)
+        terms(r, self.y, 1)
+        r = rows("Charge_Limit", P, -inf, G_E)
+        terms(r, self.z, 1)
+        r = rows("Grid_limit", P, -inf, self.house_limit)
+        terms(r, self.I, 1)
+        terms(r, self.I_excess, -1)
+
+        r = rows("Max_Import_State", P, -inf, 0)
+        terms(r, self.I, 1)
+        terms(r, self.Z_grid, -M)
+        r = rows("Max_Export_State", P, -inf, M)
+        terms(r, self.I_export, 1)
+        terms(r, self.Z_grid, M)
+
+        # The battery inverter must always maintain enough headroom to absorb a rogue spike
+        r = rows("Spike_Headroom", P, 0, inf)
+        terms(r, self.z, 1)
+        terms(r, self.y, -1)
+        r = rows("Track_Peak", P, -inf, 0)
+        terms(r, self.I, 1)
+        terms(r, self.P_max_local, -1)
+
+        # Sum flexible appliances AND the Heat Pump to squash them together
+        r = rows("Track_Flex_Peak", P, -inf, 0)
+        for name, slots in self.flex_slots.items():
+            terms(r[slots], self.P_flex[name], 1)
+        terms(r, self.P_HP, 1)
+        terms(r, self.P_max_flex, -1)
+
+        r = rows("Soft_Safety_Reserve", P, 0, inf)
+        terms(r, self.S_E, 1)
+        terms(r, self.Reserve_deficit, 1)
+
+        # Storage Dynamics (row 0 carries the initial state on its right-hand side)
+        r = rows("SoC_Dynamics", P, 0, 0)
+        terms(r, self.S_E, 1)
+        terms(r[1:], self.S_E[:-1], -1)
+        terms(r, self.z, -nu_E * delta * L)
+        terms(r, self.y, delta * L / nu_E)
+
+        # Constant appliances: exactly one start inside the window
+        for name in self.E:
+            r = rows(f"Sched_{name}", 1, 1, 1)
+            terms(r, self.E[name], 1)
+
+        # Flexible appliances: semi-continuous power and the session energy requirement
+        for app in self.flexible_apps:
+            name = app["name"]
+            if name not in self.flex_slots:
+                continue
+            n = len(self.flex_slots[name])
+            share = self.flex_share[name]
+            r = rows(f"Min_{name}", n, 0, inf)
+            terms(r, self.P_flex[name], 1)
+            terms(r, self.O_flex[name], -app["Min_Power"] * share)
+            r = rows(f"Max_{name}", n, -inf, 0)
+            terms(r, self.P_flex[name], 1)
+            terms(r, self.O_flex[name], -app["Max_Power"] * share)
+
+            energy = delta * L[self.flex_slots[name]]
+            r = rows(f"Energy_Req_Min_{name}", 1, 0, inf)
+            terms(r, self.P_flex[name], energy)
+            terms(r, self.E_deficit[name], 1)
+            r = rows(f"Energy_Req_Max_{name}", 1, -inf, 0)
+            terms(r, self.P_flex[name], energy)
+
+        fr_gain = ((0.1467 + 0.1196) / 0.3) * delta
+        fz_gain = (((7/25) + (15/67)) / 0.3) * delta
+        hp_gain = (delta / C_in) * COP
+        self.loss = (delta / C_in) * UA
+
+        # demand + locked-in appliance power - solar generation is the right-hand side
+        r = rows("Power_balance", P, 0, 0)
+        for app in self.constant_apps:
+            name = app["name"]
+            if name not in self.E:
+                continue
+            # A start at slot s draws power in every slot of [s, s + Slots) that is inside the horizon,
+            # averaged over the period each of those slots belongs to
+            for offset in range(int(app["Slots"])):
+                running = self.E_slots[name] + offset
+                inside = running < H
+                periods = self.period_of[running[inside]]
+                terms(r[periods], self.E[name][inside], app["Power"] / L[periods])
+        for name, slots in self.flex_slots.items():
+            terms(r[slots], self.P_flex[name], 1)
+        terms(r, self.P_HP, 1)
+        terms(r, self.z, 1)
+        terms(r, self.P_comp_fr, 0.3)
+        terms(r, self.P_comp_fz, 0.3)
+        terms(r, self.I_export, 1)
+        terms(r, self.I, -1)
+        terms(r, self.y, -1)
+
+        r = rows("HP_Split", P, 0, 0)
+        terms(r, self.P_HP_Space, 1)
+        terms(r, self.P_HP_DHW, 1)
+        terms(r, self.P_HP, -1)
+
+        r = rows("T_fridge", P, 0.1196 * delta * L, 0.1196 * delta * L)
+        terms(r, self.T_fr, 1)
+        terms(r[1:], self.T_fr[:-1], -1)
+        terms(r, self.P_comp_fr, fr_gain * L)
+        r = rows("T_freezer", P, (15/67) * delta * L, (15/67) * delta * L)
+        terms(r, self.T_fz, 1)
+        terms(r[1:], self.T_fz[:-1], -1)
+        terms(r, self.P_comp_fz, fz_gain * L)
+        r = rows("T_in", P, 0, 0)
+        terms(r, self.T_in, 1)
+        terms(r[1:], self.T_in[:-1], -(1 - self.loss * L[1:]))
+        terms(r, self.P_HP_Space, -hp_gain * L)
+        r = rows("S_TH", P, 0, 0)
+        terms(r, self.S_TH, 1)
+        terms(r[1:], self.S_TH[:-1], -1)
+        terms(r, self.P_HP_DHW, -COP * delta * L)
+
+        # Comfort Deviation Constraints
+        r = rows("Comfort_Upper", P, -T_target, inf)
+        terms(r, self.diff, 1)
+        terms(r, self.T_in, -1)
+        r = rows("Comfort_Lower", P, T_target, inf)
+        terms(r, self.diff, 1)
+        terms(r, self.T_in, 1)
+
+        # Terminal Region
+        r = rows("Terminal_Region_Lower_Bound", 1, 0, inf)
+        terms(r, self.S_E[P - 1], 1)
+        r = rows("Terminal_Thermal_Region", 1, T_min, inf)
+        terms(r, self.T_in[P - 1], 1)
+        r = rows("Terminal_Tank_Reserve", 1, 0.25 * C_TH, inf)
+        terms(r, self.S_TH[P - 1], 1)
+
+        self.row_lower = np.concatenate(row_lower)
+        self.row_upper = np.concatenate(row_upper)
+        self.A = sp.csc_matrix(
+            (np.concatenate(entries_val), (np.concatenate(entries_row), np.concatenate(entries_col))),
+            shape=(self.num_row, self.num_col)
+        )
+        self.A.sum_duplicates()
+
+        # Objective Function: the price dependent coefficients are overwritten by set_penalties().
+        # Per-step terms are weighted by the number of steps in each period.
+        terminal_value_rate = 0.08
+        c = np.zeros(self.num_col)
+        c[self.I] = delta * L
+        c[self.I_export] = -delta * L
+        c[self.I_excess] = 1000 * L     # penalty for going over 1kW battery will no save itself for the 35p peak
+        c[self.Reserve_deficit] = 200 * L
+        c[self.diff] = 5.0 * L
+        c[self.y] = delta * wear_cost_elec * L
+        c[self.P_HP] = delta * wear_cost_therm * L
+        for column in self.E_deficit.values():
+            c[column] = 5000
+        c[self.S_E[P - 1]] -= terminal_value_rate
+        c[self.P_max_local] = 0.1
+        c[self.P_max_flex] = 10
+        self.c = c
+
+        # Time-indexed fixed families, used to shift the previous plan into a warm start
+        self.trajectories = np.array([self.S_E, self.z, self.y, self.I, self.I_excess, self.I_export, self.Z_grid,
+                                      self.P_HP, self.P_HP_Space, self.P_HP_DHW, self.S_TH, self.T_in, self.diff,
+                                      self.T_fr, self.T_fz, self.P_comp_fr, self.P_comp_fz, self.Reserve_deficit])
+
+        # A fresh model starts with every structural row in place and HiGHS has to take it whole
+        self.grid_binary = True
+        self.highs = None
+        self.bounds_changed = True
+        self.x = None
+        self.stats["rebuilds"] += 1
+
+    def update(self, inputs, community_penalty_prices):
+        # Rewrite everything that depends on the house state and the look-ahead window
+        H = self.horizon
+        self.step = inputs["step"]
+        structure = (tuple(sorted((name, tuple(slots)) for name, slots in inputs["start_windows"].items())),
+                     tuple(sorted((name, tuple(session[0])) for name, session in inputs["flex_sessions"].items())))
+        if structure != self.structure:
+            self.build(inputs["start_windows"], inputs["flex_sessions"])
+            self.structure = structure
+        self.bounds_changed = True
+        rl, ru = self.row_lower, self.row_upper
+
+        rl[self.row_index["Spike_Headroom"]] = inputs["safety_margin"] - D_E
+        rl[self.row_index["Soft_Safety_Reserve"]] = inputs["dynamic_soc_min"]
+        balance = self.row_index["Power_balance"]
+        rl[balance] = ru[balance] = self.average(np.asarray(inputs["solar"][:H]) - np.asarray(inputs["elec_demand"][:H])
+                                                 - np.asarray(inputs["locked_in_power"][:H]))
+
+        T_out = self.average(inputs["T_out"])
+        r = self.row_index["T_in"]
+        rl[r[1:]] = ru[r[1:]] = self.loss * self.blocks[1:] * T_out[1:]
+        rl[r[0]] = ru[r[0]] = inputs["T_in"] - self.loss * (inputs["T_in"] - T_out[0])
+
+        r = self.row_index["SoC_Dynamics"][0]
+        rl[r] = ru[r] = inputs["soc"]
+        r = self.row_index["T_fridge"][0]
+        rl[r] = ru[r] = inputs["T_fridge"] + (0.1196 * delta)
+        r = self.row_index["T_freezer"][0]
+        rl[r] = ru[r] = inputs["T_freezer"] + ((15/67) * delta)
+        r = self.row_index["S_TH"][0]
+        rl[r] = ru[r] = inputs["soc_th"]
+        rl[self.row_index["Terminal_Region_Lower_Bound"]] = inputs["dynamic_soc_min"]
+
+        for name in self.flex_slots:
+            req_energy = inputs["flex_sessions"][name][1]
+            rl[self.row_index[f"Energy_Req_Min_{name}"]] = req_energy
+            ru[self.row_index[f"Energy_Req_Max_{name}"]] = req_energy
+            # A full car stays off, which frees its on/off binaries
+            self.col_upper[self.O_flex[name]] = 1.0 if req_energy > 0 else 0.0
+            self.col_upper[self.P_flex[name]] = np.inf if req_energy > 0 else 0.0
+
+        self.set_penalties(inputs, community_penalty_prices)
+
+    def average(self, values):
+        # Mean of a per-step forecast over each period of the horizon
+        values = np.asarray(values[:self.horizon], dtype=np.float64)
+        return np.add.reduceat(values, self.block_start) / self.blocks
+
+    def set_penalties(self, inputs, community_penalty_prices):
+        # Between negotiation rounds this is the only thing that changes
+        H = self.horizon
+        weight = delta * self.blocks
+        self.c[self.I] = weight * self.average(np.asarray(inputs["prices"][:H]) + np.asarray(community_penalty_prices[:H]))
+        self.c[self.I_export] = -weight * self.average(inputs["export_prices"])
+
+        # Importing and exporting in the same slot loses (import + penalty - export) on every kWh,
+        # so when that margin is positive everywhere the LP already keeps them apart
+        margin = self.c[self.I] + self.c[self.I_export]
+        self.set_grid_binary(not drop_grid_binary or bool(np.any(margin <= 0)))
+
+    def set_grid_binary(self, needed):
+        # Fixing Z_grid at 0 and freeing its big-M rows lets HiGHS presolve drop all of them
+        if needed == self.grid_binary:
+            return
+        self.col_upper[self.Z_grid] = 1.0 if needed else 0.0
+        # Without the big-M rows the wire limit they imposed becomes a plain bound
+        self.col_upper[self.I] = np.inf if needed else self.big_M
+        self.col_upper[self.I_export] = np.inf if needed else self.big_M
+        self.row_upper[self.row_index["Max_Import_State"]] = 0.0 if needed else np.inf
+        self.row_upper[self.row_index["Max_Export_State"]] = self.big_M if needed else np.inf
+        self.grid_binary = needed
+        self.bounds_changed = True
+
+    def cancel(self, step):
+        # Stop the solve for this step, from another thread; its incumbent is kept if it has one
+        self.cancel_step = step
+
+    def cancelled(self):
+        return self.cancel_step is not None and self.cancel_step == self.step
+
+    def discrete(self):
+        # True while some binary column can still take both values
+        return bool(np.any(self.integrality.astype(bool) & (self.col_upper > self.col_lower)))
+
+    def appliance_trajectories(self, x):
+        # Scatter the windowed appliance columns back onto the full horizon, one value per base step
+        H = self.horizon
+        starts = {}
+        for name, slots in self.E_slots.items():
+            starts[name] = np.zeros(H)
+            starts[name][slots] = x[self.E[name]]
+        powers, states = {}, {}
+        for name, periods in self.flex_slots.items():
+            power = np.zeros(self.periods)
+            power[periods] = x[self.P_flex[name]]
+            powers[name] = power[self.period_of]
+            state = np.zeros(self.periods)
+            state[periods] = x[self.O_flex[name]]
+            states[name] = state[self.period_of]
+        deficits = {name: x[column] for name, column in self.E_deficit.items()}
+        return starts, powers, states, deficits
+
+    def shifted_plan(self):
+        # Receding horizon: the plan made `shift` steps ago, moved forward and clipped to today's bounds
+        if self.last_plan is None or self.plan_step is None:
+            return None
+        shift = self.step - self.plan_step
+        if not 0 <= shift < self.horizon:
+            return None
+
+        # Plans are shifted one base step at a time and read back at the start of each period
+        H = self.horizon
+        plan = self.last_plan
+        start = np.zeros(self.num_col)
+        source = np.minimum(np.arange(H) + shift, H - 1)
+        sample = source[self.block_start]
+        start[self.trajectories] = plan[self.trajectories[:, self.period_of[sample]]]
+        start[[self.P_max_local, self.P_max_flex]] = plan[[self.P_max_local, self.P_max_flex]]
+
+        starts, powers, states, deficits = self.last_appliances
+        for name, slots in self.E_slots.items():
+            if name in starts:
+                # Start binaries are not repeated past the end of the previous plan (that would be a second start)
+                moved = np.zeros(H)
+                moved[:H - shift] = starts[name][shift:]
+                start[self.E[name]] = moved[slots]
+        for name, periods in self.flex_slots.items():
+            if name in powers:
+                start[self.P_flex[name]] = powers[name][sample[periods]]
+                start[self.O_flex[name]] = states[name][sample[periods]]
+                start[self.E_deficit[name]] = deficits[name]
+        return np.clip(start, self.col_lower, self.col_upper)
+
+    def solve_highs(self, start, relax):
+        h = self.highs
+        every_col = np.arange(self.num_col, dtype=np.int32)
+        integrality = np.zeros_like(self.integrality) if relax else self.integrality
+        if h is None:
+            h = self.highs = highspy.Highs()
+            h.setOptionValue("output_flag", False)
+            solvers.interruptible(h, self.cancelled)
+            h.passModel(
+                self.num_col, self.num_row, self.A.nnz, 1, 1, 0.0,       # column-wise, minimise, no offset
+                self.c, self.col_lower, self.col_upper, self.row_lower, self.row_upper,
+                self.A.indptr.astype(np.int32), self.A.indices.astype(np.int32), self.A.data, integrality
+            )
+            self.relaxed = relax
+        else:
+            h.changeColsCost(self.num_col, every_col, self.c)
+            if self.bounds_changed:
+                h.changeColsBounds(self.num_col, every_col, self.col_lower, self.col_upper)
+                h.changeRowsBounds(self.num_row, np.arange(self.num_row, dtype=np.int32), self.row_lower, self.row_upper)
+        if relax != self.relaxed:
+            h.changeColsIntegrality(self.num_col, every_col, integrality)
+            self.relaxed = relax
+        self.bounds_changed = False
+        h.setOptionValue("time_limit", float(solver_time_limit))
+
+        if start is not None:
+            # MIP start: HiGHS keeps the integer values and completes the rest with an LP
+            solution = highspy.HighsSolution()
+            solution.col_value = start
+            solution.value_valid = True
+            h.setSolution(solution)
+        h.run()
+        return highs_result(h, relax)
+
+    def solve_scipy(self, relax):
+        # Without highspy, SciPy's milp (HiGHS compiled into SciPy) solves the same arrays
+        integrality = np.zeros_like(self.integrality) if relax else self.integrality
+        result = milp(self.c, integrality=integrality, bounds=Bounds(self.col_lower, self.col_upper),
+                      constraints=LinearConstraint(self.A, self.row_lower, self.row_upper),
+                      options={"time_limit": solver_time_limit})
+        statuses = {0: "Optimal", 1: "Not Solved", 2: "Infeasible", 3: "Unbounded"}
+        return statuses.get(result.status, "Not Solved"), result.x, getattr(result, "mip_node_count", 0)
+
+    def solve(self, backend=None):
+        # Without a free binary the LP basis HiGHS kept from the last solve is the warm start
+        relax = lp_fast_path and not self.discrete()
+        start = self.shifted_plan() if warm_start and not relax else None
+
+        # CBC needs PuLP objects, so without the in-process HiGHS the arrays go to SciPy
+        backend = solvers.resolve_backend(backend)
+        clock = time.perf_counter()
+        if backend == "highs":
+            status, self.x, nodes = self.solve_highs(start, relax)
+        else:
+            backend = "scipy"
+            status, self.x, nodes = self.solve_scipy(relax)
+        self.last_solve = {"status": status, "backend": backend, "wall_time": time.perf_counter() - clock, "nodes": nodes}
+
+        self.stats["solves"] += 1
+        self.stats["warm_starts"] += 1 if start is not None and backend == "highs" else 0
+        self.stats["grid_binary_dropped"] += 0 if self.grid_binary else 1
+        self.stats["lp_solves"] += 1 if relax else 0
+        self.stats["nodes"] += nodes or 0
+        self.stats["wall_time"] += self.last_solve["wall_time"]
+
+        if status == "Optimal" or (status == "Not Solved" and self.x is not None):
+            self.keep_plan()
+            return "Optimal"
+        return status
+
+    def keep_plan(self):
+        # The solution in self.x becomes the plan the next step's warm start is shifted from
+        self.last_plan = self.x[:self.num_fixed]
+        self.last_appliances = self.appliance_trajectories(self.x)
+        self.plan_step = self.step
+
+    def solution(self):
+        # Plain lists of the solved trajectories, in the shape the house agent packages up:
+        # one value per base step, each period's value repeated over the steps it spans.
+        # Appliances without columns (outside their window, already run) are reported as off.
+        x = self.x
+        H = self.horizon
+        starts, powers, _, _ = self.appliance_trajectories(x)
+
+        def per_step(columns):
+            return x[columns][self.period_of].tolist()
+
+        return {
+            "I": per_step(self.I),
+            "z": per_step(self.z),
+            "y": per_step(self.y),
+            "I_export": per_step(self.I_export),
+            "I_excess": per_step(self.I_excess),
+            "S_E": per_step(self.S_E),
+            "S_TH": per_step(self.S_TH),
+            "T_in": per_step(self.T_in),
+            "T_fr": per_step(self.T_fr),
+            "T_fz": per_step(self.T_fz),
+            "P_comp_fr": per_step(self.P_comp_fr),
+            "P_comp_fz": per_step(self.P_comp_fz),
+            "P_HP": per_step(self.P_HP),
+            "E": {app["name"]: starts[app["name"]].tolist() if app["name"] in starts else [0.0] * H
+                  for app in self.constant_apps},
+            "P_flex": {app["name"]: powers[app["name"]].tolist() if app["name"] in powers else [0.0] * H
+                       for app in self.flexible_apps},
+            "objective": float(self.c @ x),
+        }
+
+
+def highs_result(h, relax):
+    # (status, solution or None, branch-and-bound nodes) of the last run of a highspy.Highs
+    model_status = h.getModelStatus()
+    info = h.getInfo()
+    x = np.array(h.getSolution().col_value) if info.primal_solution_status == 2 else None
+    if model_status == highspy.HighsModelStatus.kOptimal:
+        status = "Optimal"
+    elif model_status in (highspy.HighsModelStatus.kInfeasible, highspy.HighsModelStatus.kUnboundedOrInfeasible):
+        status = "Infeasible"
+    elif model_status == highspy.HighsModelStatus.kUnbounded:
+        status = "Unbounded"
+    else:
+        status = "Not Solved"
+    return status, x, 0 if relax else info.mip_node_count
@@ -0,0 +1,113 @@
+# subproblem_cache.py
+# Content-addressed memo of solved house subproblems, keyed on a hash of the hardware, horizon
+# inputs and community penalties: an in-memory LRU with an optional shared directory behind it.
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from config import *
+
+
+def canonical(value):
+    # Nested dicts are sorted so two equal states always produce the same text
+    if isinstance(value, dict):
+        return tuple(sorted((k, canonical(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical(v) for v in value)
+    return value
+
+
+def subproblem_key(signature, battery_capacity, house_limit, inputs, community_penalty_prices):
+    # The step number is left out: two steps with identical inputs are the same problem.
+    # The model signature tells formulations apart (e.g. a move-blocked horizon).
+    state = {name: value for name, value in inputs.items() if name != "step"}
+    penalties = tuple(round(p / cache_penalty_quantum) for p in community_penalty_prices)
+    text = repr((signature, battery_capacity, house_limit, canonical(state), penalties))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def essentials(sol):
+    # The part of a solution package_schedule reads: the import and flexible load profiles, and
+    # every other series at k = 0 only
+    kept = {}
+    for name, value in sol.items():
+        if name in ("I", "P_flex") or not isinstance(value, (list, dict)):
+            kept[name] = value
+        elif isinstance(value, dict):
+            kept[name] = {item: series[:1] for item, series in value.items()}
+        else:
+            kept[name] = value[:1]
+    return kept
+
+
+class SubproblemCache:
+    # In-memory LRU in front of an optional directory of pickles shared between sweep workers
+
+    def __init__(self, max_entries=cache_max_entries, directory=cache_dir):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()    # houses of one step solve on the controller's thread pool
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pkl")
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key]
+
+        if self.directory is not None:
+            try:
+                with open(self.path(key), "rb") as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                value = None
+            if value is not None:
+                self.remember(key, value)
+                with self.lock:
+                    self.stats["disk_hits"] += 1
+                return value
+
+        with self.lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        self.remember(key, value)
+        if self.directory is not None:
+            # Write to a scratch file and rename, so other workers never read half a pickle
+            folder = os.path.dirname(self.path(key))
+            os.makedirs(folder, exist_ok=True)
+            fd, scratch = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(scratch, self.path(key))
+
+    def remember(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def hit_rate(self, since=None):
+        # Fraction of lookups answered from memory or disk, optionally since an earlier stats snapshot
+        stats = {name: count - (since or {}).get(name, 0) for name, count in self.stats.items()}
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        return (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+
+    def report(self):
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return (f"{lookups} lookups, {self.stats['hits']} memory hits, {self.stats['disk_hits']} disk hits, "
+                f"{self.stats['evictions']} evictions, hit rate {self.hit_rate() * 100:.1f}%")
+
+
+# One cache per process, shared by every house agent in it
+shared_cache = SubproblemCache()
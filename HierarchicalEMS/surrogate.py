@@ -0,0 +1,251 @@
+# surrogate.py
+# Linear stand-in for the house MILP, fitted on logged solves (python surrogate.py train <log dir>
+# <model file>). An answer is used only when it is close to the training states, its on/off
+# decisions are clear-cut and it passes the house's k = 0 dynamics, power balance and EV energy;
+# anything else goes to the MILP.
+import os
+import sys
+import pickle
+import numpy as np
+from config import *
+from data import *
+from subproblem_cache import SubproblemCache
+
+constant_apps = [app for app in appliances if app["power_type"] == "constant" and not app.get("interruptible", False)]
+flexible_apps = [app for app in appliances if app["power_type"] == "flexible"]
+
+# k = 0 dynamics of the house model (see sparse_model.build)
+fr_gain = ((0.1467 + 0.1196) / 0.3) * delta
+fz_gain = (((7/25) + (15/67)) / 0.3) * delta
+hp_gain = (delta / C_in) * COP
+loss = (delta / C_in) * UA
+
+
+def features(inputs, community_penalty_prices, battery_capacity, house_limit):
+    # Everything the house solve depends on, as one flat vector
+    H = mpc_horizon
+    phase = np.zeros(total_steps)
+    phase[inputs["step"] % total_steps] = 1.0
+    windows = []
+    for app in constant_apps:
+        slots = inputs["start_windows"].get(app["name"])
+        windows += [1.0, slots[0], len(slots)] if slots else [0.0, 0.0, 0.0]
+    for app in flexible_apps:
+        session, energy = inputs["flex_sessions"].get(app["name"], ([], 0.0))
+        windows += [1.0, session[0], len(session), energy] if session else [0.0, 0.0, 0.0, energy]
+    state = [inputs["soc"], inputs["soc_th"], inputs["T_fridge"], inputs["T_freezer"], inputs["T_in"],
+             inputs["safety_margin"], inputs["dynamic_soc_min"], battery_capacity, house_limit]
+    return np.concatenate([state, phase, inputs["elec_demand"][:H], inputs["locked_in_power"][:H],
+                           community_penalty_prices[:H], windows])
+
+
+def targets(inputs, sol):
+    # k = 0 controls (heat pump split recovered from the tank and room temperatures), a start-now
+    # flag per constant appliance, then the flexible-load and import profiles
+    space = (sol["T_in"][0] - (inputs["T_in"] - loss * (inputs["T_in"] - inputs["T_out"][0]))) / hp_gain
+    dhw = (sol["S_TH"][0] - inputs["soc_th"]) / (COP * delta)
+    k0 = [sol["z"][0], sol["y"][0], sol["P_comp_fr"][0], sol["P_comp_fz"][0], space, dhw]
+    starts = [sol["E"][app["name"]][0] for app in constant_apps]
+    flex = [sol["P_flex"][app["name"]][:mpc_horizon] for app in flexible_apps]
+    return np.concatenate([k0, starts] + flex + [sol["I"][:mpc_horizon]])
+
+
+class SurrogatePolicy:
+    def __init__(self):
+        self.model = None
+        self.stats = {"queries": 0, "accepted": 0, "novel": 0, "undecided": 0, "infeasible": 0, "inconsistent": 0}
+
+    def load(self, path):
+        with open(path, "rb") as f:
+            self.model = pickle.load(f)
+        # Squared norms of the training states, for the nearest-neighbour distance
+        self.model["norms"] = (self.model["states"].astype(np.float64) ** 2).sum(axis=1)
+
+    def predict(self, x):
+        z = (x - self.model["mean"]) / self.model["scale"]
+        nearest = self.model["norms"] - 2.0 * (self.model["states"] @ z) + z @ z
+        distance = np.sqrt(max(0.0, float(nearest.min())) / len(z))
+        return distance, self.model["intercept"] + z @ self.model["weights"]
+
+    def propose(self, inputs, community_penalty_prices, battery_capacity, house_limit):
+        # A solution dict in the shape of model.solution() (k = 0 entries only, apart from the
+        # profiles), or None when the MILP has to decide
+        if self.model is None:
+            return None
+        self.stats["queries"] += 1
+        H = mpc_horizon
+        distance, prediction = self.predict(features(inputs, community_penalty_prices, battery_capacity, house_limit))
+        if distance > surrogate_radius:
+            self.stats["novel"] += 1
+            return None
+
+        z, y, comp_fr, comp_fz, space, dhw = np.clip(prediction[:6], 0.0, [G_E, D_E, 0.3, 0.3, 10.0, 10.0])
+        rest = prediction[6:]
+        load = inputs["elec_demand"][0] + inputs["locked_in_power"][0] - inputs["solar"][0]
+
+        # Discrete decisions at k = 0 have to be clear-cut
+        starts = {}
+        for app, value in zip(constant_apps, rest[:len(constant_apps)]):
+            slots = inputs["start_windows"].get(app["name"], [])
+            if not slots or slots[0] != 0:
+                start = 0.0
+            elif len(slots) == 1:
+                start = 1.0             # the window closes now: it has to start
+            elif value >= 1.0 - surrogate_margin:
+                start = 1.0
+            elif value <= surrogate_margin:
+                start = 0.0
+            else:
+                self.stats["undecided"] += 1
+                return None
+            starts[app["name"]] = [start]
+            load += start * app["Power"]
+        rest = rest[len(constant_apps):]
+
+        # Flexible loads over the whole session: every slot clearly off or within the power range,
+        # and the energy still required delivered inside the horizon (as far as it fits)
+        flex = {}
+        for app in flexible_apps:
+            prediction, rest = rest[:H], rest[H:]
+            profile = np.zeros(H)
+            session, energy = inputs["flex_sessions"].get(app["name"], ([], 0.0))
+            if session and energy > 0:
+                power = prediction[session]
+                on = power >= (1.0 - surrogate_margin) * app["Min_Power"]
+                if np.any(~on & (power > surrogate_margin * app["Max_Power"])):
+                    self.stats["undecided"] += 1
+                    return None
+                target = min(energy, app["Max_Power"] * delta * len(session))
+                power = np.where(on, np.clip(power, app["Min_Power"], app["Max_Power"]), 0.0)
+                if power.sum() > 0:
+                    # Spread the shortfall or surplus over the slots that are on
+                    power = np.where(on, np.clip(power * target / (delta * power.sum()), app["Min_Power"], app["Max_Power"]), 0.0)
+                if abs(delta * power.sum() - target) > surrogate_tolerance:
+                    self.stats["infeasible"] += 1
+                    return None
+                profile[session] = power
+            flex[app["name"]] = profile.tolist()
+            load += profile[0]
+        import_profile = np.maximum(0.0, rest[:H])
+
+        # States after k = 0 from the house dynamics, and the grid exchange from the power balance
+        soc = inputs["soc"] + nu_E * delta * z - delta * y / nu_E
+        soc_th = inputs["soc_th"] + COP * delta * dhw
+        T_fr = inputs["T_fridge"] + 0.1196 * delta - fr_gain * comp_fr
+        T_fz = inputs["T_freezer"] + (15/67) * delta - fz_gain * comp_fz
+        T_in = inputs["T_in"] - loss * (inputs["T_in"] - inputs["T_out"][0]) + hp_gain * space
+        tol = 1e-6
+        if (not -tol <= soc <= battery_capacity + tol or not -tol <= soc_th <= C_TH + tol
+                or not 2.0 - tol <= T_fr <= 5.0 + tol or not -22.0 - tol <= T_fz <= -15.0 + tol
+                or not T_min - tol <= T_in <= T_max + tol or space + dhw > 10.0
+                or z - y < inputs["safety_margin"] - D_E - tol):
+            self.stats["infeasible"] += 1
+            return None
+
+        net = load + space + dhw + z - y + 0.3 * (comp_fr + comp_fz)
+        grid_import, grid_export = max(net, 0.0), max(-net, 0.0)
+        if abs(grid_import - import_profile[0]) > surrogate_tolerance:
+            self.stats["inconsistent"] += 1
+            return None
+        import_profile[0] = grid_import
+
+        self.stats["accepted"] += 1
+        return {
+            "I": import_profile.tolist(),
+            "z": [z],
+            "y": [y],
+            "I_export": [grid_export],
+            "I_excess": [max(0.0, grid_import - house_limit)],
+            "S_E": [soc],
+            "S_TH": [soc_th],
+            "T_in": [T_in],
+            "T_fr": [T_fr],
+            "T_fz": [T_fz],
+            "P_comp_fr": [comp_fr],
+            "P_comp_fz": [comp_fz],
+            "P_HP": [space + dhw],
+            "E": starts,
+            "P_flex": flex,
+        }
+
+    def report(self, since=None):
+        # Optionally since an earlier stats snapshot (one run of several in the same process)
+        stats = {name: count - (since or {}).get(name, 0) for name, count in self.stats.items()}
+        queries = stats["queries"]
+        share = stats["accepted"] / queries * 100 if queries else 0.0
+        return (f"{queries} queries, {stats['accepted']} MILP calls avoided ({share:.1f}%), "
+                f"fallbacks: {stats['novel']} novel, {stats['undecided']} undecided, "
+                f"{stats['infeasible']} infeasible, {stats['inconsistent']} inconsistent")
+
+
+def load_samples(directory):
+    # Every logged subproblem under the directory as (features, targets) matrices
+    X, Y = [], []
+    for folder, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                with open(os.path.join(folder, name), "rb") as f:
+                    sample = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            X.append(features(sample["inputs"], sample["penalties"], sample["battery_capacity"], sample["house_limit"]))
+            Y.append(targets(sample["inputs"], sample["sol"]))
+    return np.array(X), np.array(Y)
+
+
+def fit(X, Y, ridge=1e-3):
+    # Ridge regression on standardised features. The standardised training states are kept
+    # for the distance check.
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale < 1e-9] = 1.0
+    Z = (X - mean) / scale
+    intercept = Y.mean(axis=0)
+    weights = np.linalg.solve(Z.T @ Z + ridge * len(Z) * np.eye(Z.shape[1]), Z.T @ (Y - intercept))
+    return {"mean": mean, "scale": scale, "intercept": intercept, "weights": weights, "states": Z.astype(np.float32)}
+
+
+def train(directory, path, holdout=0.2, seed=0):
+    # Fit on the logged samples, report on a held-out share, then refit on all of them and save
+    X, Y = load_samples(directory)
+    if len(X) == 0:
+        raise ValueError(f"No surrogate samples under {directory}")
+    order = np.random.default_rng(seed).permutation(len(X))
+    cut = int(len(X) * (1 - holdout))
+    fitted, held = order[:cut], order[cut:]
+    print(f"Surrogate training: {len(X)} samples, {X.shape[1]} features, {Y.shape[1]} targets")
+
+    if len(held):
+        policy = SurrogatePolicy()
+        policy.model = fit(X[fitted], Y[fitted])
+        policy.model["norms"] = (policy.model["states"].astype(np.float64) ** 2).sum(axis=1)
+        predictions = np.array([policy.predict(x)[1] for x in X[held]])
+        distances = np.array([policy.predict(x)[0] for x in X[held]])
+        errors = np.abs(predictions - Y[held])
+        near = distances <= surrogate_radius
+        I0 = 6 + len(constant_apps) + mpc_horizon * len(flexible_apps)
+        starts = slice(6, 6 + len(constant_apps))
+        print(f"  held out {len(held)}: within radius {near.mean() * 100:.1f}%, "
+              f"k=0 import MAE {errors[:, I0].mean():.3f} kW ({errors[near, I0].mean() if near.any() else 0.0:.3f} within radius), "
+              f"start flags MAE {errors[:, starts].mean():.3f}, profile MAE {errors[:, I0:].mean():.3f} kW")
+
+    model = fit(X, Y)
+    with open(path, "wb") as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"  saved {path}")
+    return model
+
+
+# One policy and one sample log per process, shared by every house agent in it
+shared_policy = SurrogatePolicy()
+if surrogate_model is not None:
+    shared_policy.load(surrogate_model)
+sample_log = SubproblemCache(max_entries=0, directory=surrogate_log_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "train":
+        sys.exit("usage: python surrogate.py train <log dir> <model file>")
+    train(sys.argv[2], sys.argv[3])
@@ -0,0 +1,15 @@
+# conftest.py
+# The tests import the simulation modules the way its scripts do, from the folder above.
+# Run from HierarchicalEMS: python -m pytest -q
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def recorded_states():
+    # One house driven through its first steps, with the horizon inputs it saw at each of them
+    from benchmark import record_house_states
+    return record_house_states(6)
@@ -0,0 +1,62 @@
+# test_checkpoint.py
+import numpy as np
+import pytest
+import checkpoint
+import house_model
+import sparse_model
+import pareto_parallel
+from history import stack
+
+steps = 4
+
+
+@pytest.fixture
+def small_run(monkeypatch, tmp_path):
+    # Two houses, checkpoints every 2 steps into tmp_path. Solver models are rebuilt on resume,
+    # so warm starts are off to keep ties between equally cheap plans resolving the same way.
+    monkeypatch.setattr(pareto_parallel, "num_homes", 2)
+    monkeypatch.setattr(checkpoint, "checkpoint_every", 2)
+    monkeypatch.setattr(checkpoint, "checkpoint_dir", str(tmp_path))
+    monkeypatch.setattr(house_model, "warm_start", False)
+    monkeypatch.setattr(sparse_model, "warm_start", False)
+    return checkpoint.path_for("run")
+
+
+def outcome(sim):
+    houses = sim["houses"]
+    return {
+        "series": sim["cache"],
+        "kpis": sim["metrics"].result(),
+        "imports": stack(houses, "Grid_Import", steps).tolist(),
+        "heat_pump": stack(houses, "Heat_Pump", steps).tolist(),
+        "soc": [house.current_soc for house in houses],
+    }
+
+
+def test_resume_matches_an_uninterrupted_run(small_run):
+    whole = pareto_parallel.start_simulation(0.1, 0.75, 0)
+    pareto_parallel.advance(whole, steps)
+    expected = outcome(whole)
+
+    # Stopped after step 2: the run picks up from the checkpoint written after step 1
+    stopped = pareto_parallel.start_simulation(0.1, 0.75, 0)
+    pareto_parallel.advance(stopped, 3, small_run)
+    resumed = pareto_parallel.start_simulation(0.1, 0.75, 0)
+    saved = checkpoint.load(small_run)
+    assert saved["step"] == 2
+    resumed.update(step=saved["step"], houses=saved["houses"], community=saved["community"], cache=saved["series"],
+                   metrics=saved["metrics"])
+    pareto_parallel.advance(resumed, steps)
+
+    result = outcome(resumed)
+    assert result["series"] == expected["series"]
+    for name in ("imports", "heat_pump", "soc"):
+        assert np.allclose(result[name], expected[name]), name
+    for name, value in expected["kpis"].items():
+        assert np.allclose(result["kpis"][name], value), name
+
+
+def test_no_checkpoint_without_checkpoint_every(small_run, monkeypatch):
+    monkeypatch.setattr(checkpoint, "checkpoint_every", None)
+    assert checkpoint.load(small_run) is None
+    assert not checkpoint.due(1)
@@ -0,0 +1,62 @@
+# test_fork.py
+import numpy as np
+import pytest
+import checkpoint
+import fork
+import house_agent
+import house_model
+import sparse_model
+import pareto_parallel
+from result_store import unpack
+
+params = (0.1, 0.75, 0)
+
+
+@pytest.fixture
+def small_run(monkeypatch, tmp_path):
+    # Two houses for one day on a coarse move-blocked horizon (to keep it quick), histories
+    # bounded to a window that flushes to tmp_path. The pool workers are forked from this
+    # process, so they see the same settings.
+    histories = tmp_path / "histories"
+    histories.mkdir()
+    for module in (pareto_parallel, fork, house_agent):
+        monkeypatch.setattr(module, "days", 1)
+    monkeypatch.setattr(pareto_parallel, "num_homes", 2)
+    monkeypatch.setattr(house_agent, "model_builder", "sparse")
+    monkeypatch.setattr(house_agent, "horizon_blocks", [1] * 2 + [2] * 3 + [4] * 10)
+    monkeypatch.setattr(house_agent, "history_window", 16)
+    monkeypatch.setattr(house_agent, "history_dir", str(histories))
+    monkeypatch.setattr(fork, "history_dir", str(histories))
+    monkeypatch.setattr(fork, "sweep_cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(checkpoint, "checkpoint_dir", str(tmp_path))
+    monkeypatch.setattr(house_model, "warm_start", False)
+    monkeypatch.setattr(sparse_model, "warm_start", False)
+    return tmp_path
+
+
+@pytest.mark.parametrize("fork_step", [2, 40])
+def test_branch_with_the_base_parameters_is_the_run(small_run, fork_step):
+    # Forked at step 40 the prefix has flushed blocks of its histories, which the branch links to
+    [branched] = fork.fork(params, fork_step, [{}], max_workers=1)
+    whole = pareto_parallel.run_single_simulation(params)
+
+    assert branched.pop("Fork_Step") == fork_step and branched.pop("I_max") == pareto_parallel.I_max
+    series = unpack(branched.pop("Time_Series_Cache"))
+    expected = unpack(whole.pop("Time_Series_Cache"))
+    for name in ("Cache_Hit_Rate", "Surrogate"):
+        branched.pop(name), whole.pop(name)
+    assert branched.keys() == whole.keys()
+    for name, value in whole.items():
+        assert np.allclose(branched[name], value), name
+    assert np.array_equal(series["community_demand"], expected["community_demand"])
+    for imports, reference in zip(series["all_houses_import"], expected["all_houses_import"]):
+        assert np.array_equal(imports, reference)
+
+    # The prefix's and the branch's history blocks and the fork checkpoint are all gone
+    assert list((small_run / "histories").iterdir()) == []
+    assert list(small_run.glob("*.ckpt")) == []
+
+
+def test_branch_cannot_change_the_seed(small_run):
+    with pytest.raises(ValueError):
+        fork.branch(checkpoint.path_for("missing"), params, {"seed": 1})
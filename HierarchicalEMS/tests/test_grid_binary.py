@@ -0,0 +1,31 @@
+# test_grid_binary.py
+import pytest
+import house_model
+import sparse_model
+from house_model import HouseModel
+from sparse_model import SparseHouseModel
+
+penalties = [0.0] * 48
+
+
+@pytest.mark.parametrize("module, builder", [(house_model, HouseModel), (sparse_model, SparseHouseModel)])
+def test_dropping_the_binary_keeps_the_wire_limit(recorded_states, monkeypatch, module, builder):
+    # A slot with far more solar than the wire can export: with or without the import/export
+    # binary the grid exchange stays within the big-M limit and the optimum is the same
+    house, states = recorded_states
+    monkeypatch.setattr(module, "warm_start", False)
+    solar = list(states[0]["solar"])
+    solar[5] = 35.0
+    inputs = dict(states[0], solar=solar)
+    results = []
+    for dropping in (False, True):
+        monkeypatch.setattr(module, "drop_grid_binary", dropping)
+        model = builder(house.house_id, house.battery_capacity, house.house_limit)
+        model.update(inputs, penalties)
+        assert model.grid_binary != dropping
+        assert model.solve("highs") == "Optimal"
+        solution = model.solution()
+        assert max(solution["I_export"]) <= model.big_M + 1e-6
+        assert max(solution["I"]) <= model.big_M + 1e-6
+        results.append(solution["objective"])
+    assert results[1] == pytest.approx(results[0], rel=1e-4)
@@ -0,0 +1,93 @@
+# test_history.py
+import pickle
+import numpy as np
+import pytest
+from history import History, stack
+
+
+def fill(history, steps, seed=0, first=0):
+    # Random values in a few channels, including one outside the registry, from step `first`
+    rng = np.random.default_rng(seed)
+    values = {name: rng.random(steps) for name in ("Grid_Import", "Heat_Pump", "Extra")}
+    for step in range(first, steps):
+        for name, series in values.items():
+            history[(name, step)] = series[step]
+    return values
+
+
+def test_dict_interface():
+    history = History(steps=10)
+    history[("Grid_Import", 3)] = 1.5
+    assert history[("Grid_Import", 3)] == 1.5
+    assert history.get(("Grid_Import", 2)) == 0.0
+    assert history.get(("Grid_Import", 4), "missing") == "missing"
+    assert ("Grid_Import", 3) in history and ("Grid_Import", 4) not in history
+    with pytest.raises(KeyError):
+        history[("Unknown", 0)]
+
+
+def test_full_history_grows_and_round_trips():
+    history = History(steps=8)
+    values = fill(history, 30)
+    for name, series in values.items():
+        assert np.array_equal(history.series(name), series)
+    assert np.array_equal(history.series("Grid_Import", 35)[30:], np.zeros(5))
+    copy = pickle.loads(pickle.dumps(history))
+    assert copy.data.shape[1] == 30
+    copy[("Heat_Pump", 30)] = 2.0
+    assert copy.series("Heat_Pump", 31)[-1] == 2.0
+
+
+def test_running_counts_started_loads():
+    history = History(steps=10)
+    history[("Dish washer", 2)] = 1
+    history[("Dish washer", 9)] = 0
+    assert history.running("Dish washer", 3).tolist() == [0, 0, 1, 1, 1, 0, 0, 0, 0, 0]
+
+
+def test_stack():
+    class House:
+        pass
+    houses = [House(), House()]
+    for i, house in enumerate(houses):
+        house.history_E = History(steps=4)
+        house.history_E[("Grid_Import", 1)] = i + 1.0
+    assert stack(houses, "Grid_Import", 3).tolist() == [[0, 1, 0], [0, 2, 0]]
+
+
+def test_window_flushes_and_reads_back(tmp_path):
+    # A bounded history reads every step back as the full one does, from memory or disk
+    full, bounded = History(steps=8), History(window=16, directory=tmp_path)
+    values = fill(full, 100)
+    fill(bounded, 100)
+    assert bounded.data.shape[1] == 32
+    assert bounded.start == 80 and len(list(tmp_path.glob("history_*/*.npy"))) == 5
+    for name in values:
+        assert np.array_equal(bounded.series(name), full.series(name))
+        assert np.array_equal(bounded.series(name, 50), full.series(name, 50))
+    assert bounded.get(("Heat_Pump", 5)) == full.get(("Heat_Pump", 5))
+    assert bounded.running("Grid_Import", 4).tolist() == full.running("Grid_Import", 4).tolist()
+    with pytest.raises(ValueError):
+        bounded[("Grid_Import", 10)] = 1.0
+
+
+def test_window_must_cover_a_run(tmp_path):
+    with pytest.raises(ValueError):
+        History(window=2, directory=tmp_path)
+
+
+def test_window_copies_and_branches(tmp_path):
+    history = History(window=16, directory=tmp_path)
+    values = fill(history, 60)
+    copy = pickle.loads(pickle.dumps(history))
+    copy.branch(tmp_path)
+    assert copy.directory != history.directory
+    branched = fill(copy, 100, seed=1, first=60)
+    # The branch shares the blocks written before it and writes its own after
+    assert np.array_equal(copy.series("Grid_Import", 60), values["Grid_Import"])
+    assert np.array_equal(copy.series("Grid_Import")[60:], branched["Grid_Import"][60:])
+    assert np.array_equal(history.series("Grid_Import"), values["Grid_Import"])
+
+    copy.remove()
+    history.remove()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,29 @@
+# test_house_model.py
+import pytest
+from house_model import HouseModel
+
+penalties = [0.0] * 48
+
+
+def test_update_in_place_matches_a_fresh_build(recorded_states):
+    # One model rewritten by update() reaches the optimum of a model built for each state
+    house, states = recorded_states
+    model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    for inputs in states[::2]:
+        model.update(inputs, penalties)
+        fresh = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+        fresh.update(inputs, penalties)
+        assert model.solve("highs") == fresh.solve("highs") == "Optimal"
+        assert model.solution()["objective"] == pytest.approx(fresh.solution()["objective"], rel=1e-4)
+
+
+def test_penalties_reach_the_import_cost(recorded_states):
+    # Only the objective changes between negotiation rounds: a penalty in every slot lowers the import
+    house, states = recorded_states
+    model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model.update(states[0], penalties)
+    model.solve("highs")
+    free = sum(model.solution()["I"])
+    model.set_penalties(states[0], [5.0] * 48)
+    model.solve("highs")
+    assert sum(model.solution()["I"]) <= free + 1e-6
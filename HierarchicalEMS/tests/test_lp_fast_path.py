@@ -0,0 +1,40 @@
+# test_lp_fast_path.py
+import pytest
+import house_model
+import sparse_model
+from house_model import HouseModel
+from sparse_model import SparseHouseModel
+
+penalties = [0.0] * 48
+
+
+@pytest.mark.parametrize("module, builder", [(house_model, HouseModel), (sparse_model, SparseHouseModel)])
+def test_lp_path_keeps_the_optimum(recorded_states, monkeypatch, module, builder):
+    # A state with today's appliances run and the car full: once the grid binary is dropped no
+    # binary is free, and the LP reaches the MILP's optimum
+    house, states = recorded_states
+    monkeypatch.setattr(module, "drop_grid_binary", True)
+    monkeypatch.setattr(module, "warm_start", False)
+    objectives = []
+    for fast in (False, True):
+        monkeypatch.setattr(module, "lp_fast_path", fast)
+        model = builder(house.house_id, house.battery_capacity, house.house_limit)
+        for inputs in states[::2]:
+            inputs = dict(inputs, start_windows={}, flex_sessions={"Electric car": ([0, 1, 2], 0.0)})
+            model.update(inputs, penalties)
+            assert not model.discrete()
+            assert model.solve("highs") == "Optimal"
+            objectives.append(model.solution()["objective"])
+        assert model.stats["lp_solves"] == (len(states[::2]) if fast else 0)
+    half = len(objectives) // 2
+    assert objectives[half:] == pytest.approx(objectives[:half], rel=1e-9)
+
+
+def test_free_binary_keeps_the_milp(recorded_states, monkeypatch):
+    house, states = recorded_states
+    monkeypatch.setattr(sparse_model, "lp_fast_path", True)
+    model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model.update(dict(states[0], start_windows={"Washing machine": [2, 3, 4]}), penalties)
+    assert model.discrete()
+    model.solve("highs")
+    assert model.stats["lp_solves"] == 0
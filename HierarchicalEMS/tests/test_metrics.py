@@ -0,0 +1,125 @@
+# test_metrics.py
+import numpy as np
+import pytest
+import house_model
+import sparse_model
+import pareto_parallel
+from config import delta, steps_per_hour, total_steps
+from data import price_grid_elec, price_grid_export
+from history import stack
+from metrics import Metrics, readings
+
+steps = 4
+
+
+@pytest.fixture(scope="module")
+def small_run():
+    # Two houses run for a few steps through the pareto loop
+    patch = pytest.MonkeyPatch()
+    patch.setattr(pareto_parallel, "num_homes", 2)
+    patch.setattr(house_model, "warm_start", False)
+    patch.setattr(sparse_model, "warm_start", False)
+    sim = pareto_parallel.start_simulation(0.1, 0.75, 0)
+    pareto_parallel.advance(sim, steps)
+    yield sim
+    patch.undo()
+
+
+def side_kpis(houses, prefix, limit, tolerance):
+    # One side's KPIs the way pareto_parallel computed them from the histories after the run
+    imports = stack(houses, f"{prefix}Import", steps).sum(axis=0)
+    exports = stack(houses, f"{prefix}Export", steps).sum(axis=0)
+    demand = np.maximum(0.0, imports - exports)
+    price_in = np.asarray(price_grid_elec)[np.arange(steps) % total_steps]
+    price_out = np.asarray(price_grid_export)[np.arange(steps) % total_steps]
+    return {
+        "Cost": ((imports * price_in - exports * price_out) * delta).sum(),
+        "Peak": demand.max(),
+        "PAR": demand.max() / demand.mean() if demand.mean() > 0 else 0.0,
+        "Breach_Count": int((demand > limit + tolerance).sum()),
+        "Breach_Energy": np.maximum(0.0, demand - limit).sum() * delta,
+        "Energy": (imports - exports).sum() * delta,
+        "Export": exports.sum() * delta,
+    }
+
+
+def house_sla(house):
+    # pareto_parallel's service level, with the EV window in steps
+    total_tasks = fulfilled_tasks = 0.0
+    ev = next((app for app in house.personal_appliances if app["name"] == "Electric car"), None)
+    if ev is not None and ev.get("Required_Energy", 0.0) > 0:
+        ts, tf = ev["T_S"] * steps_per_hour, ev["T_F"] * steps_per_hour
+        progress = min(1.0, (steps - ts) / ((tf + total_steps) - ts) if tf < ts else 1.0)
+        target = ev["Required_Energy"] * progress
+        delivered = house.flexible_energy_delivered.get("Electric car", 0.0)
+        total_tasks += 1.0
+        fulfilled_tasks += min(1.0, delivered / target) if target > 0 else 1.0
+    for app in house.personal_appliances:
+        if app.get("power_type") == "flexible":
+            continue
+        if not any(app.get("T_S", 0.0) * steps_per_hour <= s < steps for s in range(steps)):
+            continue
+        total_tasks += 1.0
+        if (house.history_E.series(app["name"], steps) > 0).any():
+            fulfilled_tasks += 1.0
+    avg_temp = float(house.history_E.series("Indoor_Temp", steps).mean())
+    total_tasks += 1.0
+    if avg_temp >= 18.0:
+        fulfilled_tasks += 1.0
+    elif avg_temp >= 16.0:
+        fulfilled_tasks += 0.5 + 0.5 * (avg_temp - 16.0) / 2.0
+    return fulfilled_tasks / total_tasks * 100
+
+
+def check(metrics, houses, limit, tolerance):
+    result = metrics.result()
+    for side, prefix in (("Smart", "Grid_"), ("Open", "Open_Loop_")):
+        for name, value in side_kpis(houses, prefix, limit, tolerance).items():
+            assert result[f"{side}_{name}"] == pytest.approx(value, abs=1e-9), f"{side}_{name}"
+    assert metrics.sla(houses) == pytest.approx(sum(house_sla(house) for house in houses) / len(houses))
+
+
+def test_result_matches_the_histories(small_run):
+    houses = small_run["houses"]
+    check(small_run["metrics"], houses, small_run["community"].limit, 0.0)
+
+
+def test_replayed_with_breaches(small_run):
+    # The same steps against a limit below the run's demand, with main.py's tolerance (the
+    # open-loop batteries carry the night, so only the smart side breaches this early)
+    houses = small_run["houses"]
+    limit = 0.75 * small_run["metrics"].result()["Smart_Peak"]
+    metrics = Metrics(houses, limit, tolerance=0.01)
+    for step in range(steps):
+        metrics.update(step, [readings(house, step) for house in houses])
+    assert metrics.result()["Smart_Breach_Count"] > 0
+    check(metrics, houses, limit, 0.01)
+
+
+def test_open_demand_is_net_of_export():
+    # An open-loop house exporting more than it imports adds no demand, so no peak and no breach
+    class House:
+        house_id = 0
+        personal_appliances = []
+    metrics = Metrics([House()], limit=1.0)
+    metrics.update(0, [{"house_id": 0, "Grid_Import": 0.0, "Grid_Export": 0.0, "Open_Loop_Import": 2.0,
+                        "Open_Loop_Export": 3.0, "Indoor_Temp": 20.0, "ran": []}])
+    result = metrics.result()
+    assert result["Open_Peak"] == 0.0 and result["Open_Breach_Count"] == 0
+    assert result["Open_Energy"] == pytest.approx(-1.0 * delta)
+
+
+def test_ev_progress_counts_steps():
+    # An overnight window 18:00-08:00 is 28 steps; twelve steps past 18:00 the car is due 12/28 of its energy
+    class House:
+        house_id = 0
+        personal_appliances = [{"name": "Electric car", "power_type": "flexible", "T_S": 18, "T_F": 8,
+                                "Required_Energy": 14.0}]
+        flexible_energy_delivered = {"Electric car": 3.0}
+    metrics = Metrics([House()], limit=10.0)
+    reading = {"house_id": 0, "Grid_Import": 0.0, "Grid_Export": 0.0, "Open_Loop_Import": 0.0,
+               "Open_Loop_Export": 0.0, "Indoor_Temp": 20.0, "ran": []}
+    for step in range(18 * steps_per_hour + 12):
+        metrics.update(step, [reading])
+    # EV 3 of the 6 kWh due, and full comfort
+    assert metrics.house_sla(House()) == pytest.approx((0.5 + 1.0) / 2 * 100)
@@ -0,0 +1,104 @@
+# test_result_store.py
+import numpy as np
+import pytest
+import result_store
+from result_store import ResultStore, pack, unpack, materialise
+
+key = (0.1, 0.75, 3)
+
+
+def payload(steps=96, seed=0):
+    # The shape of a sweep run's time series: flat series, a list of them and a dict of them
+    rng = np.random.default_rng(seed)
+    return {
+        "community_demand": rng.random(steps).tolist(),
+        "all_houses_import": [rng.random(steps).tolist() for _ in range(3)],
+        "appliance_data": {"Fridge": rng.random(steps).tolist(), "Electric car": [0.0] * steps},
+    }
+
+
+def test_put_and_load(tmp_path):
+    store = ResultStore(tmp_path)
+    store.put(key, payload())
+    store.put((0.2, 0.75, 3), payload(seed=1))
+    reopened = ResultStore(tmp_path)
+    assert reopened.keys() == {key, (0.2, 0.75, 3)} and len(reopened) == 2
+    assert reopened.load(key) == materialise(unpack(pack(payload())))
+    with pytest.raises(KeyError):
+        reopened.open((0.3, 0.75, 3))
+
+
+def test_torn_index_line(tmp_path):
+    # A crash while appending leaves half a line: it is skipped and the next entry starts a new line
+    store = ResultStore(tmp_path)
+    store.put(key, payload())
+    with open(store.index_path, "a") as f:
+        f.write('{"alpha": 0.2, "sig')
+    store = ResultStore(tmp_path)
+    assert store.keys() == {key}
+    store.put((0.3, 0.75, 3), payload())
+    assert ResultStore(tmp_path).keys() == {key, (0.3, 0.75, 3)}
+
+
+def test_stored_again_replaces_the_run(tmp_path):
+    store = ResultStore(tmp_path)
+    store.put(key, payload())
+    store.put(key, payload(seed=1))
+    assert ResultStore(tmp_path).load(key) == materialise(unpack(pack(payload(seed=1))))
+    assert sorted(path.name for path in (tmp_path / "shards").iterdir()) == ["0.1_0.75_3.run"]
+
+
+def test_only_runs_of_series_are_stored(tmp_path):
+    store = ResultStore(tmp_path)
+    with pytest.raises(TypeError):
+        store.put(key, {"not a series": "text"})
+    assert key not in ResultStore(tmp_path)
+
+
+def test_playback_maps_the_shard(tmp_path):
+    # An uncompressed run is opened without reading its series; each one is a view of the file
+    store = ResultStore(tmp_path)
+    store.put(key, pack(payload(), codec=None))
+    run = ResultStore(tmp_path).open(key)
+    assert run.values is None
+    assert set(run.keys()) == {"community_demand", "all_houses_import", "appliance_data"}
+    demand = run["community_demand"]
+    assert isinstance(run.values, np.memmap)
+    assert np.shares_memory(demand, run.values)
+    assert demand.tolist() == pytest.approx(payload()["community_demand"], rel=1e-6)
+    assert len(run["all_houses_import"]) == 3
+    assert run["appliance_data"]["Electric car"].tolist() == [0.0] * 96
+    assert run.get("missing") is None and "missing" not in run
+
+
+codecs = [None, "delta", pytest.param("zstd", marks=pytest.mark.skipif(result_store.zstandard is None,
+                                                                     reason="zstandard is not installed"))]
+
+
+@pytest.mark.parametrize("codec", codecs)
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_pack_round_trip(tmp_path, codec, dtype):
+    # Every codec gives back the series at the stored precision, in memory and through a shard
+    original = payload()
+    packed = pack(original, dtype=dtype, codec=codec)
+    assert packed["length"] == 96 and packed["codec"] == codec
+    stored = np.asarray(original["community_demand"], dtype=dtype)
+    assert np.array_equal(unpack(packed)["community_demand"], stored)
+    assert np.array_equal(unpack(packed)["all_houses_import"][2], np.asarray(original["all_houses_import"][2], dtype=dtype))
+
+    store = ResultStore(tmp_path)
+    store.put(key, packed)
+    assert ResultStore(tmp_path).load(key) == materialise(unpack(packed))
+
+
+def test_float32_halves_the_size():
+    assert len(pack(payload(), dtype="float32")["data"]) * 2 == len(pack(payload(), dtype="float64")["data"])
+
+
+def test_only_series_can_be_packed():
+    with pytest.raises(TypeError):
+        pack({"demand": [1.0, 2.0], "prices": [1.0, 2.0, 3.0]})
+    with pytest.raises(TypeError):
+        pack([[1.0, 2.0]])
+    with pytest.raises(ValueError):
+        pack({"demand": [1.0]}, codec="lz4")
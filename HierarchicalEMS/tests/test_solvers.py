@@ -0,0 +1,64 @@
+# test_solvers.py
+import pulp
+import pytest
+import solvers
+from house_model import HouseModel
+
+cbc = pytest.mark.skipif(not pulp.PULP_CBC_CMD(msg=0).available(), reason="PuLP's CBC binary is not available")
+highs = pytest.mark.skipif(solvers.highspy is None, reason="highspy is not installed")
+
+
+def knapsack():
+    model = pulp.LpProblem("Knapsack", pulp.LpMaximize)
+    take = pulp.LpVariable.dicts("take", range(4), cat="Binary")
+    extra = pulp.LpVariable("extra", 0, 1.5)
+    model += pulp.lpSum(value * take[i] for i, value in enumerate([5, 4, 3, 2])) + extra
+    model += pulp.lpSum(weight * take[i] for i, weight in enumerate([4, 3, 2, 1])) + extra <= 6, "Capacity"
+    return model, take, extra
+
+
+@cbc
+@highs
+def test_backends_agree_on_a_small_milp():
+    results = {}
+    for backend in ("cbc", "highs"):
+        model, take, extra = knapsack()
+        assert solvers.solve(model, backend)["status"] == "Optimal"
+        results[backend] = (pulp.value(model.objective), [take[i].varValue for i in range(4)], extra.varValue)
+    assert results["highs"][0] == pytest.approx(results["cbc"][0])
+    assert results["highs"][1] == pytest.approx(results["cbc"][1])
+
+
+@highs
+def test_compiled_model_rereads_bounds_and_costs():
+    # A persistent problem changed in place is solved again without recompiling
+    model, take, extra = knapsack()
+    compiled = solvers.CompiledModel(model)
+    solvers.solve(model, "highs", compiled=compiled)
+    first = pulp.value(model.objective)
+    model.constraints["Capacity"].constant = -3
+    solvers.solve(model, "highs", compiled=compiled)
+    assert pulp.value(model.objective) < first
+    model.objective[extra] = 10
+    solvers.solve(model, "highs", compiled=compiled, costs_only=True)
+    assert extra.varValue == pytest.approx(1.5)
+
+
+@cbc
+@highs
+def test_backends_agree_on_the_house_model(recorded_states):
+    house, states = recorded_states
+    model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    for inputs in states[::3]:
+        model.update(inputs, [0.0] * 48)
+        objectives = []
+        for backend in ("cbc", "highs"):
+            assert model.solve(backend) == "Optimal"
+            objectives.append(model.solution()["objective"])
+        # Both are MIP optima, equal to within the solvers' default relative gaps
+        assert objectives[1] == pytest.approx(objectives[0], rel=1e-3)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        solvers.resolve_backend("gurobi")
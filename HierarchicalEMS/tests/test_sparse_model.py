@@ -0,0 +1,109 @@
+# test_sparse_model.py
+import pytest
+import house_model
+import sparse_model
+from house_model import HouseModel
+from sparse_model import SparseHouseModel
+
+penalties = [0.0] * 48
+
+
+@pytest.fixture
+def cold(monkeypatch):
+    # Without warm starts both builders solve every state from scratch
+    monkeypatch.setattr(house_model, "warm_start", False)
+    monkeypatch.setattr(sparse_model, "warm_start", False)
+
+
+def test_same_optimum_as_pulp(recorded_states, cold):
+    house, states = recorded_states
+    pulp_model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    for inputs in states[::2]:
+        pulp_model.update(inputs, penalties)
+        model.update(inputs, penalties)
+        assert pulp_model.solve("highs") == model.solve("highs") == "Optimal"
+        # Both are MIP optima, so they agree to within HiGHS's default relative gap
+        assert model.solution()["objective"] == pytest.approx(pulp_model.solution()["objective"], rel=1e-4)
+
+
+def test_solution_has_the_pulp_shape(recorded_states, cold):
+    house, states = recorded_states
+    pulp_model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    for candidate in (pulp_model, model):
+        candidate.update(states[0], penalties)
+        candidate.solve("highs")
+    expected, solution = pulp_model.solution(), model.solution()
+    assert solution.keys() == expected.keys()
+    for name, values in solution.items():
+        if isinstance(values, dict):
+            assert values.keys() == expected[name].keys()
+            assert all(len(series) == 48 for series in values.values())
+        elif isinstance(values, list):
+            assert len(values) == 48
+
+
+def test_scipy_solves_the_same_arrays(recorded_states, cold):
+    # Without highspy the arrays go to SciPy's milp
+    house, states = recorded_states
+    model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model.update(states[0], penalties)
+    model.solve("highs")
+    expected = model.solution()["objective"]
+    assert model.solve("cbc") == "Optimal"
+    assert model.last_solve["backend"] == "scipy"
+    assert model.solution()["objective"] == pytest.approx(expected, rel=1e-4)
+
+
+def test_appliance_columns_only_inside_their_windows(recorded_states, cold):
+    # A start window and a charging session of a few slots get columns for those slots alone,
+    # with the same optimum as the every-slot PuLP formulation
+    house, states = recorded_states
+    inputs = dict(states[0])
+    washer = "Washing machine"
+    inputs["start_windows"] = {washer: [2, 3, 4]}
+    inputs["flex_sessions"] = {"Electric car": (list(range(5, 11)), 3.0)}
+
+    pulp_model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    model = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    pulp_model.update(inputs, penalties)
+    model.update(inputs, penalties)
+    assert list(model.E_slots) == [washer] and len(model.E[washer]) == 3
+    assert list(model.flex_slots) == ["Electric car"] and len(model.P_flex["Electric car"]) == 6
+
+    assert pulp_model.solve("highs") == model.solve("highs") == "Optimal"
+    solution = model.solution()
+    assert solution["objective"] == pytest.approx(pulp_model.solution()["objective"], rel=1e-4)
+    starts = solution["E"][washer]
+    assert sum(starts) == pytest.approx(1.0) and sum(starts[2:5]) == pytest.approx(1.0)
+    power = solution["P_flex"]["Electric car"]
+    assert sum(power[:5]) + sum(power[11:]) == 0.0
+    assert sum(power) * sparse_model.delta == pytest.approx(3.0)
+
+
+@pytest.mark.parametrize("blocks", [[1] * 47, [2] + [1] * 46, [1, 0] + [1] * 47])
+def test_blocks_must_cover_the_horizon(blocks):
+    with pytest.raises(ValueError):
+        SparseHouseModel(0, 11, 1.0, blocks=blocks)
+
+
+def test_move_blocked_horizon(recorded_states, cold):
+    house, states = recorded_states
+    full = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    single = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit, blocks=[1] * 48)
+    blocks = [1] * 8 + [2] * 8 + [4] * 6
+    blocked = SparseHouseModel(house.house_id, house.battery_capacity, house.house_limit, blocks=blocks)
+    for model in (full, single, blocked):
+        model.update(states[0], penalties)
+        assert model.solve("highs") == "Optimal"
+    assert single.solution()["objective"] == pytest.approx(full.solution()["objective"], rel=1e-9)
+    assert blocked.num_col < full.num_col
+
+    # One decision per period, repeated over the steps it spans
+    grid_import = blocked.solution()["I"]
+    assert len(grid_import) == 48
+    start = 0
+    for length in blocks:
+        assert grid_import[start:start + length] == [grid_import[start]] * length
+        start += length
@@ -0,0 +1,76 @@
+# test_subproblem_cache.py
+import random
+import pytest
+import house_agent
+import house_model
+import solvers
+from config import C_E, I_max, PV_capacity, num_homes
+from house_agent import HouseAgent
+from subproblem_cache import SubproblemCache, essentials, subproblem_key
+
+penalties = [0.0] * 48
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    # A fresh cache in front of the house agents, cold solves every time
+    cache = SubproblemCache()
+    monkeypatch.setattr(house_agent, "cache_subproblems", True)
+    monkeypatch.setattr(house_agent, "shared_cache", cache)
+    monkeypatch.setattr(house_model, "warm_start", False)
+    return cache
+
+
+def make_house():
+    random.seed(0)
+    house = HouseAgent(0, PV_capacity, C_E, I_max / num_homes)
+    house.alpha = 0.1
+    house.sigma_human = 0.75
+    return house
+
+
+def key_for(house, step, prices):
+    inputs = house.prepare_model(step, prices)
+    return subproblem_key(house.model_template.signature, house.battery_capacity, house.house_limit, inputs, prices)
+
+
+def test_identical_subproblem_is_a_hit(cache):
+    house = make_house()
+    first = house.generate_proposed_schedule(0, penalties)
+    assert cache.stats["misses"] == 1 and len(cache.entries) == 1
+    solves = house.model_template.stats["solves"]
+    stored = cache.entries[key_for(house, 0, penalties)]
+    assert stored == essentials(house.model_template.solution())
+
+    again = house.generate_proposed_schedule(0, penalties)
+    assert cache.stats["hits"] == 1
+    assert house.model_template.stats["solves"] == solves
+    assert again["proposed_import_profile"] == first["proposed_import_profile"]
+    assert again["planned_import_k0"] == first["planned_import_k0"]
+
+
+def test_changed_penalties_miss(cache):
+    house = make_house()
+    house.generate_proposed_schedule(0, penalties)
+    changed = list(penalties)
+    changed[10] = 0.5
+    house.generate_proposed_schedule(0, changed)
+    assert cache.stats["hits"] == 0 and cache.stats["misses"] == 2
+    assert len(cache.entries) == 2
+    assert key_for(house, 0, changed) != key_for(house, 0, penalties)
+
+
+def test_time_limited_solve_is_not_stored(cache, monkeypatch):
+    # The solver stops on its time limit with an incumbent: the plan is used but not cached
+    solve = solvers.solve
+
+    def time_limited(*args, **kwargs):
+        result = solve(*args, **kwargs)
+        result["status"] = "Not Solved"
+        return result
+    monkeypatch.setattr(solvers, "solve", time_limited)
+    house = make_house()
+    package = house.generate_proposed_schedule(0, penalties)
+    assert house.model_template.last_solve["status"] == "Not Solved"
+    assert package["proposed_import_profile"] == house.model_template.solution()["I"]
+    assert cache.entries == {}
@@ -0,0 +1,98 @@
+# test_surrogate.py
+import numpy as np
+import pytest
+import house_model
+import surrogate
+from config import delta, mpc_horizon
+from house_model import HouseModel
+from surrogate import SurrogatePolicy, constant_apps, features, fit, targets
+
+penalties = [0.0] * 48
+
+
+@pytest.fixture(scope="module")
+def solved(recorded_states):
+    # The recorded states plus one with an open charging session, each with its MILP solution
+    house, states = recorded_states
+    charging = dict(states[1], flex_sessions={"Electric car": (list(range(10)), 5.0)})
+    previous, house_model.warm_start = house_model.warm_start, False
+    model = HouseModel(house.house_id, house.battery_capacity, house.house_limit)
+    samples = []
+    for inputs in list(states) + [charging]:
+        model.update(inputs, penalties)
+        assert model.solve("highs") == "Optimal"
+        samples.append((inputs, model.solution()))
+    house_model.warm_start = previous
+    return house, samples
+
+
+@pytest.fixture
+def policy(solved):
+    # Fitted on the solved states themselves, so every one of them is within the radius
+    house, samples = solved
+    X = np.array([features(inputs, penalties, house.battery_capacity, house.house_limit) for inputs, _ in samples])
+    Y = np.array([targets(inputs, sol) for inputs, sol in samples])
+    policy = SurrogatePolicy()
+    policy.model = fit(X, Y, ridge=1e-9)
+    policy.model["norms"] = (policy.model["states"].astype(np.float64) ** 2).sum(axis=1)
+    return policy
+
+
+def test_accepted_proposals_agree_with_the_milp(solved, policy):
+    house, samples = solved
+    accepted = 0
+    for inputs, sol in samples:
+        proposal = policy.propose(inputs, penalties, house.battery_capacity, house.house_limit)
+        if proposal is None:
+            continue
+        accepted += 1
+        # k = 0 states from the house dynamics
+        for name in ("S_E", "S_TH", "T_in", "T_fr", "T_fz", "z", "y", "P_HP"):
+            assert proposal[name][0] == pytest.approx(sol[name][0], abs=1e-3), name
+        # Power balance at k = 0
+        load = (inputs["elec_demand"][0] + inputs["locked_in_power"][0] - inputs["solar"][0]
+                + sum(proposal["E"][app["name"]][0] * app["Power"] for app in constant_apps)
+                + sum(profile[0] for profile in proposal["P_flex"].values()))
+        net = load + proposal["P_HP"][0] + proposal["z"][0] - proposal["y"][0] \
+            + 0.3 * (proposal["P_comp_fr"][0] + proposal["P_comp_fz"][0])
+        assert proposal["I"][0] - proposal["I_export"][0] == pytest.approx(net)
+        assert proposal["I"][0] == pytest.approx(sol["I"][0], abs=surrogate.surrogate_tolerance)
+        # The charging session gets the energy it still needs
+        for name, (session, energy) in inputs["flex_sessions"].items():
+            delivered = sum(proposal["P_flex"][name]) * delta
+            assert delivered == pytest.approx(sum(sol["P_flex"][name][:mpc_horizon]) * delta, abs=surrogate.surrogate_tolerance)
+            assert sum(proposal["P_flex"][name][k] for k in range(mpc_horizon) if k not in session) == 0.0
+            assert delivered == pytest.approx(min(energy, 7.0 * len(session) * delta), abs=surrogate.surrogate_tolerance)
+    assert accepted == policy.stats["accepted"] == len(samples)
+
+
+def test_unseen_state_goes_to_the_milp(solved, policy):
+    house, samples = solved
+    inputs = dict(samples[0][0], soc=0.0, T_in=25.0, T_fridge=9.0)
+    assert policy.propose(inputs, [3.0] * 48, house.battery_capacity, house.house_limit) is None
+    assert policy.stats["novel"] == 1
+
+
+def test_undecided_start_goes_to_the_milp(solved, policy, monkeypatch):
+    # A start window open now, with the start flag predicted halfway between off and on
+    house, samples = solved
+    inputs, sol = samples[0]
+    name = constant_apps[0]["name"]
+    inputs = dict(inputs, start_windows={name: [0, 1, 2]})
+    prediction = targets(inputs, sol)
+    prediction[6] = 0.5
+    monkeypatch.setattr(policy, "predict", lambda x: (0.0, prediction))
+    assert policy.propose(inputs, penalties, house.battery_capacity, house.house_limit) is None
+    assert policy.stats["undecided"] == 1
+
+
+def test_charging_shortfall_goes_to_the_milp(solved, policy, monkeypatch):
+    # The charging sample with its predicted car profile zeroed: the session would end short
+    house, samples = solved
+    inputs, sol = samples[-1]
+    prediction = targets(inputs, sol)
+    first = 6 + len(constant_apps)
+    prediction[first:first + mpc_horizon] = 0.0
+    monkeypatch.setattr(policy, "predict", lambda x: (0.0, prediction))
+    assert policy.propose(inputs, penalties, house.battery_capacity, house.house_limit) is None
+    assert policy.stats["infeasible"] == 1
@@ -35,4 +35,7 @@ price_gas = 0.08
 
 # Community Settings
 num_homes = 30
-homes = range(num_homes)
\ No newline at end of file
+homes = range(num_homes)
+
+# Solver Settings
+solver_backend = "highs"    # "highs" runs HiGHS in-process via highspy, "cbc" uses PuLP's CBC binary (fallback)
@@ -2,6 +2,7 @@
 import pulp
 from config import *
 from data import *
+import solvers
 
 def solve_scenario(mode="minimise_cost", co2_limit=None):
     time_steps_48h = range(total_steps *2)
@@ -174,8 +175,8 @@ def solve_scenario(mode="minimise_cost", co2_limit=None):
         model += total_co2
 
     # Solve
-    model.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=30, gapRel=0.05))
-    solve_time = model.solutionTime
+    result = solvers.solve(model, time_limit=30, gap_rel=0.05)
+    solve_time = result["wall_time"]
 
     if pulp.LpStatus[model.status] == 'Optimal':
         return pulp.value(total_cost), pulp.value(total_co2), u, S_E, E, I_base, I_extra, solve_time
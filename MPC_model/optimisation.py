@@ -2,6 +2,7 @@
 import pulp
 from config import *
 from data import *
+import solvers
 
 def solve_mpc_step(start_step, initial_soc_E, initial_soc_TH, appliances_already_run, history_E, horizon=48, mode="minimise_cost"):
     # Createa  a local timeline from 0 to H for the solver
@@ -148,7 +149,7 @@ def solve_mpc_step(start_step, initial_soc_E, initial_soc_TH, appliances_already
 
     model += total_cost
 
-    model.solve(pulp.PULP_CBC_CMD(msg=0, timeLimit=30, gapRel=0.05))
+    result = solvers.solve(model, time_limit=30, gap_rel=0.05)
 
     if pulp.LpStatus[model.status] == 'Optimal':
         # At k = 0
@@ -184,7 +185,8 @@ def solve_mpc_step(start_step, initial_soc_E, initial_soc_TH, appliances_already
             'x_t': current_x_t,
             'app_starts': current_E_starts,
             'current_soc_E': S_E[0].varValue,
-            'current_soc_TH': S_TH[0].varValue
+            'current_soc_TH': S_TH[0].varValue,
+            'solve_time': result["wall_time"]
             }
 
     else:
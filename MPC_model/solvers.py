@@ -0,0 +1,24 @@
+# solvers.py
+# Solver choice for the PuLP model (solver_backend in config.py): HiGHS in-process through
+# PuLP's highspy interface, or PuLP's bundled CBC binary, also used when highspy is missing.
+import time
+import pulp
+from config import solver_backend
+
+
+def solve(model, time_limit=None, gap_rel=None):
+    # Solve and leave the solution in each variable's varValue
+    backend = solver_backend
+    if backend not in ("highs", "cbc"):
+        raise ValueError(f"Unknown solver backend '{backend}'")
+    if backend == "highs" and not pulp.HiGHS(msg=False).available():
+        print("highspy is not installed, falling back to CBC")
+        backend = "cbc"
+
+    if backend == "highs":
+        solver = pulp.HiGHS(msg=False, timeLimit=time_limit, gapRel=gap_rel)
+    else:
+        solver = pulp.PULP_CBC_CMD(msg=0, timeLimit=time_limit, gapRel=gap_rel)
+    start = time.perf_counter()
+    model.solve(solver)
+    return {"status": pulp.LpStatus[model.status], "backend": backend, "wall_time": time.perf_counter() - start}